@@ -0,0 +1,175 @@
+# General imports
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+# Allow running as a script from any directory, local imports are relative to the project root
+project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_dir)
+
+# Local imports
+from main import generate_school_data_typed_rows, generate_data_dict, associate_student_marks, \
+    associate_student_courses, check_course_test_weights, compute_student_averages, \
+    generate_school_data_student_entries
+from common.JSONWriter import JSONWriter
+from common.school_ids import SchoolIds
+from benchmarks.generate_school_data import generate_school_data
+
+# Global values for benchmarking
+default_results_dir = os.path.join(project_dir, 'benchmarks', 'results')
+default_data_dir = os.path.join(project_dir, 'benchmarks', 'data')
+benchmark_stages = ('parse', 'generate_data_dict', 'associate', 'check_weights', 'averages', 'write_json')
+
+
+# Run each stage of process_admin_data once over a dataset, timing each stage
+def time_admin_data_stages(data_dir: str, output_file: str):
+    """
+    Stages are run directly (rather than through process_admin_data) so each can be timed on its own:
+        parse: reading input files into typed rows (generate_school_data_typed_rows)
+        generate_data_dict: building course, student and test dicts
+        associate: associate_student_marks and associate_student_courses
+        check_weights: check_course_test_weights
+        averages: compute_student_averages
+        write_json: generating student entries and writing them to output_file
+
+    :param data_dir: directory holding courses.csv, students.csv, tests.csv and marks.csv
+    :param output_file: path to write output json to
+    :return: dict with keys as stage names and values as seconds taken
+    """
+    json_writer = JSONWriter()
+    json_writer.set_json_writer_output_file(output_file)  # Errors in generated data raise AdminDataError
+    input_files = [os.path.join(data_dir, f) for f in ('courses.csv', 'students.csv', 'tests.csv', 'marks.csv')]
+
+    timings = {}
+    start = time.perf_counter()
+    courses_rows, students_rows, tests_rows, marks_rows = generate_school_data_typed_rows(input_files)
+    timings['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    course_data = generate_data_dict(courses_rows, isCourse=True)
+    student_data = generate_data_dict(students_rows, isStudent=True)
+    test_data = generate_data_dict(tests_rows, isTest=True)
+    school_ids = SchoolIds(course_data, test_data)
+    timings['generate_data_dict'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    associate_student_marks(student_data, marks_rows, school_ids)
+    associate_student_courses(student_data, school_ids)
+    timings['associate'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    check_course_test_weights(school_ids)
+    timings['check_weights'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compute_student_averages(student_data)
+    timings['averages'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    students = (student_data[s_id] for s_id in sorted(student_data))
+    json_writer.write_students_to_output_file(generate_school_data_student_entries(students, course_data))
+    timings['write_json'] = time.perf_counter() - start
+
+    return timings
+
+
+# Find commit of project being benchmarked, so results can be compared across commits
+def current_commit():
+    """
+    :return: short hash of current git commit (suffixed with -dirty if there are uncommitted changes), or unknown
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=project_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=project_dir,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+    return commit + '-dirty' if dirty else commit
+
+
+# Benchmark stages over datasets of each scale, the best (lowest) time of each stage across repeats is kept
+def run_benchmarks(scales: list, repeats: int, data_dir: str, seed: int = 0):
+    """
+    :param scales: list of numbers of marks, a dataset is generated for each (reused if already generated)
+    :param repeats: number of times stages are run over each dataset
+    :param data_dir: directory holding generated datasets, one subdirectory per scale
+    :param seed: seed for generating datasets
+    :return: dict of results, holding commit, python version, and for each scale the row counts and stage timings
+    """
+    results = {
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeats': repeats,
+        'scales': {}
+    }
+
+    for marks in scales:
+        scale_dir = os.path.join(data_dir, f'{marks}-seed{seed}')
+        if not os.path.exists(os.path.join(scale_dir, 'marks.csv')):  # Generate dataset once, reused by later runs
+            print(f'Generating dataset with {marks} marks in {scale_dir}')
+            generate_school_data(scale_dir, marks, seed=seed)
+
+        best = {}
+        for _ in range(repeats):
+            timings = time_admin_data_stages(scale_dir, os.path.join(scale_dir, 'output.json'))
+            for stage in timings:
+                best[stage] = min(best.get(stage, timings[stage]), timings[stage])
+
+        best['total'] = sum(best[stage] for stage in benchmark_stages)
+        results['scales'][str(marks)] = best
+        print(f'{marks} marks: ' + ', '.join(f'{stage} {best[stage]:.3f}s' for stage in best))
+
+    return results
+
+
+# Print timings of results next to timings of earlier results, with the ratio of new time to old time
+def compare_results(results: dict, baseline: dict):
+    """
+    :param results: results from run_benchmarks
+    :param baseline: earlier results (e.g. loaded from a results file of another commit)
+    :return: None, serves to print a comparison for each scale found in both results
+    """
+    print(f'Comparing {results["commit"]} against {baseline["commit"]}')
+    for scale in results['scales']:
+        if scale not in baseline['scales']:
+            continue
+        print(f'{scale} marks:')
+        for stage, seconds in results['scales'][scale].items():
+            old_seconds = baseline['scales'][scale].get(stage)
+            if old_seconds:
+                print(f'  {stage:<20} {old_seconds:>9.3f}s -> {seconds:>9.3f}s  ({seconds / old_seconds:.2f}x)')
+
+
+# Example run of benchmark_admin_tool.py, benchmarking 1k, 100k and 1M marks, compared against an earlier result
+# python benchmarks/benchmark_admin_tool.py --scales 1000 100000 1000000 --compare benchmarks/results/abc1234.json
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time each stage of process_admin_data on generated datasets.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 100000, 1000000],
+                        help='numbers of marks in generated datasets')
+    parser.add_argument('--repeats', type=int, default=3, help='runs per dataset, best time of each stage is kept')
+    parser.add_argument('--seed', type=int, default=0, help='seed for generating datasets')
+    parser.add_argument('--data-dir', default=default_data_dir, help='directory holding generated datasets')
+    parser.add_argument('--results-dir', default=default_results_dir, help='directory to save results to')
+    parser.add_argument('--compare', help='results file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    benchmark_results = run_benchmarks(args.scales, args.repeats, args.data_dir, args.seed)
+
+    # Save results named by commit, so results of different commits sit side by side
+    os.makedirs(args.results_dir, exist_ok=True)
+    results_file = os.path.join(args.results_dir, f'{benchmark_results["commit"]}.json')
+    with open(results_file, 'w') as results_output:
+        json.dump(benchmark_results, results_output, indent=2)
+        results_output.write('\n')
+    print(f'Results saved to {results_file}')
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_input:
+            compare_results(benchmark_results, json.load(baseline_input))
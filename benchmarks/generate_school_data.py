@@ -0,0 +1,142 @@
+# General imports
+import os
+import sys
+import random
+import argparse
+
+# Allow running as a script from any directory, local imports are relative to the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Local imports
+from common.course import desired_columns_courses, course_weight_total
+from common.student import desired_columns_students
+from common.test import desired_columns_tests
+from common.mark import desired_columns_marks
+
+# Global values for generating school data
+default_courses = 20  # Number of courses generated unless specified
+default_max_tests_per_course = 5  # Each course has between 1 and this many tests
+default_courses_per_student = 6  # Number of courses each student takes unless there are fewer courses
+write_chunk_rows = 100000  # Rows of marks joined and written to file at a time
+
+
+# Split total weight of a course between its tests, weights are positive integers adding up to course_weight_total
+def generate_test_weights(test_count: int, rng: random.Random):
+    """
+    :param test_count: number of tests in course, at most course_weight_total
+    :param rng: random number generator
+    :return: list of test_count weights adding up to course_weight_total
+    """
+    cuts = sorted(rng.sample(range(1, course_weight_total), test_count - 1))
+    return [end - start for start, end in zip([0] + cuts, cuts + [course_weight_total])]
+
+
+# Write a csv file with a header row followed by rows (rows are sequences of values)
+def write_csv_rows(file_path: str, columns: tuple, rows):
+    """
+    :param file_path: path to csv file to write
+    :param columns: column names, written as header row
+    :param rows: iterable of rows, each a sequence of values ordered as columns
+    :return: number of rows written (header not included)
+    """
+    row_count = 0
+    with open(file_path, 'w') as csv_file:
+        csv_file.write(','.join(columns) + '\n')
+        chunk = []
+        for r in rows:
+            chunk.append(','.join(str(v) for v in r))
+            if len(chunk) == write_chunk_rows:
+                csv_file.write('\n'.join(chunk) + '\n')
+                row_count += len(chunk)
+                chunk = []
+        if chunk:
+            csv_file.write('\n'.join(chunk) + '\n')
+            row_count += len(chunk)
+
+    return row_count
+
+
+# Generate valid courses, students, tests and marks csv files with about the requested number of marks
+def generate_school_data(output_dir: str, marks: int, courses: int = default_courses,
+                         max_tests_per_course: int = default_max_tests_per_course,
+                         courses_per_student: int = default_courses_per_student, seed: int = 0):
+    """
+    Each student takes courses_per_student random courses and has a mark for every test of those courses, so every
+    student has a course average for each of their courses. Students are added until there are at least the requested
+    number of marks. Marks are written in random student order, as marks from a student information system would be.
+
+    :param output_dir: directory to write courses.csv, students.csv, tests.csv and marks.csv to
+    :param marks: number of marks to generate (at least this many are generated, the last student completes its courses)
+    :param courses: number of courses to generate
+    :param max_tests_per_course: each course has between 1 and this many tests
+    :param courses_per_student: number of courses taken by each student
+    :param seed: seed for random number generator, the same seed generates the same files
+    :return: dict with number of rows written to each file (keys are courses, students, tests, marks), throws
+    ValueError if marks, courses or courses_per_student is below 1 (students would never add up to the requested marks)
+    or max_tests_per_course is not between 1 and course_weight_total
+    """
+    for name, value in (('marks', marks), ('courses', courses), ('courses_per_student', courses_per_student)):
+        if value < 1:
+            raise ValueError(f'Number of {name} to generate must be at least 1, got: {value}')
+    if not 1 <= max_tests_per_course <= course_weight_total:
+        raise ValueError(f'Number of tests per course must be between 1 and {course_weight_total} (each test has a '
+                         f'weight of at least 1), got: {max_tests_per_course}')
+
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    courses_per_student = min(courses_per_student, courses)
+
+    # Tests of each course, as (test id, weight) tuples
+    course_tests = {}
+    test_id = 1
+    for course_id in range(1, courses + 1):
+        weights = generate_test_weights(rng.randint(1, max_tests_per_course), rng)
+        course_tests[course_id] = [(test_id + i, w) for i, w in enumerate(weights)]
+        test_id += len(weights)
+
+    # Add students until there are enough marks, each student takes a random selection of courses
+    student_courses = []
+    mark_count = 0
+    while mark_count < marks:
+        taken = rng.sample(range(1, courses + 1), courses_per_student)
+        student_courses.append(taken)
+        mark_count += sum(len(course_tests[c]) for c in taken)
+
+    # Generator of marks rows, students are shuffled so marks are not sorted by student
+    def marks_rows():
+        student_order = list(range(len(student_courses)))
+        rng.shuffle(student_order)
+        for s in student_order:
+            for c in student_courses[s]:
+                for t, _ in course_tests[c]:
+                    yield t, s + 1, rng.randint(0, 100)
+
+    return {
+        'courses': write_csv_rows(os.path.join(output_dir, 'courses.csv'), desired_columns_courses,
+                                  ((c, f'Course {c}', f'Teacher {c}') for c in course_tests)),
+        'students': write_csv_rows(os.path.join(output_dir, 'students.csv'), desired_columns_students,
+                                   ((s, f'Student {s}') for s in range(1, len(student_courses) + 1))),
+        'tests': write_csv_rows(os.path.join(output_dir, 'tests.csv'), desired_columns_tests,
+                                ((t, c, w) for c in course_tests for t, w in course_tests[c])),
+        'marks': write_csv_rows(os.path.join(output_dir, 'marks.csv'), desired_columns_marks, marks_rows())
+    }
+
+
+# Example run of generate_school_data.py, generating about one million marks
+# python benchmarks/generate_school_data.py benchmarks/data/1M --marks=1000000
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate valid school data csv files at a configurable scale.')
+    parser.add_argument('output_dir', help='directory to write courses, students, tests and marks csv files to')
+    parser.add_argument('--marks', type=int, required=True, help='number of marks to generate')
+    parser.add_argument('--courses', type=int, default=default_courses, help='number of courses to generate')
+    parser.add_argument('--max-tests-per-course', type=int, default=default_max_tests_per_course)
+    parser.add_argument('--courses-per-student', type=int, default=default_courses_per_student)
+    parser.add_argument('--seed', type=int, default=0, help='seed for random number generator')
+    args = parser.parse_args()
+
+    try:
+        row_counts = generate_school_data(args.output_dir, args.marks, args.courses, args.max_tests_per_course,
+                                          args.courses_per_student, args.seed)
+    except ValueError as error:
+        parser.error(str(error))
+    print(f'Generated school data in {args.output_dir}: ' + ', '.join(f'{row_counts[k]} {k}' for k in row_counts))
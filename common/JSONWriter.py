@@ -1,25 +1,126 @@
 # General imports
-import sys
+import os
 import json
+import gzip
+import lzma
+import uuid
+from contextlib import contextmanager, ExitStack
+
+try:  # orjson is an optional dependency, only the fast encoder makes use of it
+    import orjson
+except ImportError:
+    orjson = None
+
+# Local imports
+from common.handle_errors import handle_error
+from common.student_index import student_index_suffix, student_index_header, student_index_record, \
+    student_index_magic, ndjson_shard_file
+
+# Global values for output formats of the json writer
+fast_encoder_available = orjson is not None  # Fast encoder is only used if orjson can be imported
+supported_compressions = ('gzip', 'xz')  # Output is compressed as it is written, no separate compression step
+compressed_file_suffixes = {'gzip': '.gz', 'xz': '.xz'}
+gzip_compress_level = 6  # Level 9 (gzip module default) is several times slower for little smaller output
+
+
+# Context manager writing a file under a temporary name next to it, which replaces the file once written without error
+@contextmanager
+def replace_file_when_written(file_path: str, open_file):
+    """
+    The temporary file is in the same directory (and so on the same file system) as file_path, so it replaces file_path
+    with a single rename (os.replace). An error while writing removes the temporary file and leaves file_path as it was,
+    rather than truncated.
+
+    :param file_path: path of file to write
+    :param open_file: function opening a new file for writing given its path, e.g. lambda f: open(f, 'xb')
+    :return: context manager yielding the opened temporary file
+    """
+    temp_path = f'{file_path}.{uuid.uuid4().hex}.tmp'  # Unique, so runs writing the same output do not collide
+    try:
+        with open_file(temp_path) as temp_file:
+            yield temp_file
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:  # Temporary file was never created
+            pass
+        raise
 
 
 # A class which serves to create a custom json writer which can be used to write dictionary objects to output files
 class JSONWriter:
-    def __init__(self, output_file: str = None, indent_spaces: int = 2, sort_keys: bool = False, new_line: bool = True):
+    def __init__(self, output_file: str = None, indent_spaces: int = 2, sort_keys: bool = False, new_line: bool = True,
+                 compact: bool = False, compression: str = None, fast_encoder: bool = False):
         self.output_file = output_file
         self.indent_spaces = indent_spaces
         self.sort_keys = sort_keys
         self.new_line = new_line
+        self.compact = compact  # No indent and no spaces after separators
+        self.compression = compression  # None, or one of supported_compressions
+        self.fast_encoder = fast_encoder and fast_encoder_available
+
+    # Serves to set how JSONWriter writes output, compression must be one of supported_compressions (or None)
+    def set_json_writer_format(self, compact: bool = False, compression: str = None, fast_encoder: bool = False):
+        """
+        :param compact: boolean to determine whether json is written without indent or spaces after separators
+        :param compression: name of compression output is written with (gzip or xz), None to write uncompressed output
+        :param fast_encoder: boolean to determine whether orjson encodes json, ignored when orjson is not installed.
+        orjson writes characters other than ASCII as UTF-8 rather than escaping them, and only indents by 2 spaces
+        (other indents are encoded by json)
+        :return: None
+        """
+        if compression is not None and compression not in supported_compressions:
+            handle_error(f'Unknown compression specified: {compression}. Supported compressions are: '
+                         f'{", ".join(supported_compressions)}.')
+        self.compact = compact
+        self.compression = compression
+        self.fast_encoder = fast_encoder and fast_encoder_available
 
-    # Serves to set output file for JSONWriter, ensures ability to open said file
+    # Open output file (or another file written by JSONWriter) for writing text, compressed as set for JSONWriter
+    def open_output_file(self, output_file: str, mode: str = 'w'):
+        """
+        :param output_file: path to file
+        :param mode: w to truncate an existing file, x to create a new file only
+        :return: opened text file
+        """
+        if self.compression == 'gzip':
+            return gzip.open(output_file, mode + 't', compresslevel=gzip_compress_level, encoding='utf-8')
+        elif self.compression == 'xz':
+            return lzma.open(output_file, mode + 't', encoding='utf-8')
+        return open(output_file, mode, encoding='utf-8' if self.fast_encoder else None)
+
+    # Open a temporary file for writing output file, which replaces output file once written (see
+    # replace_file_when_written)
+    def replace_output_file_when_written(self, output_file: str):
+        return replace_file_when_written(output_file, lambda f: self.open_output_file(f, 'x'))
+
+    # Encode a json object as a string, laid out as set for JSONWriter (indented, or compact)
+    def encode_json(self, json_data):
+        indent = None if self.compact else self.indent_spaces
+        if self.fast_encoder and (self.compact or indent == 2):
+            option = (orjson.OPT_SORT_KEYS if self.sort_keys else 0) | (0 if self.compact else orjson.OPT_INDENT_2)
+            return orjson.dumps(json_data, option=option).decode()
+
+        return json.dumps(json_data, indent=indent, sort_keys=self.sort_keys,
+                          separators=(',', ':') if self.compact else None)
+
+    # Encode a json object as a compact line of bytes ending with a new line, used for newline delimited json
+    def encode_json_line(self, json_data):
+        if self.fast_encoder:
+            option = orjson.OPT_APPEND_NEWLINE | (orjson.OPT_SORT_KEYS if self.sort_keys else 0)
+            return orjson.dumps(json_data, option=option)
+
+        return (json.dumps(json_data, separators=(',', ':'), sort_keys=self.sort_keys) + '\n').encode()
+
+    # Serves to set output file for JSONWriter, ensures ability to open said file (without truncating an earlier output)
     def set_json_writer_output_file(self, output_file):
         try:
-            file = open(output_file, 'w')
+            file = open(output_file, 'a')
             file.close()
             self.output_file = output_file
-        except PermissionError:
-            print('Cannot utilize desired output file due because of insufficient user permissions.')
-            sys.exit(-1)
+        except PermissionError:  # Output file is left unset, so the error is printed rather than written
+            handle_error('Cannot utilize desired output file due because of insufficient user permissions.')
 
     # Serves to write students to json formatted as per the spec, example output in tests/Example1/output.json
     def write_json_to_output_file(self, json_data: dict):
@@ -28,11 +129,145 @@ class JSONWriter:
         :return: None, serves to write json_data (dict) to an output file
         """
 
-        with open(self.output_file, 'w') as output_file:  # Attempt to open output file and write json string in
-            json.dump(json_data, output_file, indent=self.indent_spaces, sort_keys=self.sort_keys)
+        # Attempt to write json to a temporary file, which then replaces output file
+        with self.replace_output_file_when_written(self.output_file) as output_file:
+            output_file.write(self.encode_json(json_data))
             if self.new_line:  # If new line at bottom of file desired, write it in
                 output_file.write("\n")
 
         json_data.clear()  # Clear the dict
-        output_file.close()  # Close the file
 
+    # Serves to write students to json one entry at a time, output matches write_json_to_output_file({"students": [...]})
+    def write_students_to_output_file(self, student_entries, trailing_sections=None,
+                                      list_name: str = "students"):
+        """
+        :param student_entries: iterable (e.g. generator) of student entry dicts, ordered as they should appear in output
+        :param trailing_sections: function returning a dict of sections written after students (e.g. course statistics),
+        called once every student entry is written, None for students only. A section which is not a dict or list
+        (e.g. a generator of entries) is written as a list one entry at a time, as students are
+        :param list_name: name of the list entries are written to, e.g. "courses" for a file of course statistics
+        :return: number of student entries written, serves to write each student entry to the output file once received.
+        Entries are written to a temporary file which replaces output file once every entry is written, so an error
+        while writing leaves output file as it was rather than holding part of the students
+        """
+        with self.replace_output_file_when_written(self.output_file) as output_file:
+            return self.write_students_to_file(output_file, student_entries, trailing_sections, list_name)
+
+    # Serves to write students to an opened file (or other text stream, e.g. io.StringIO) one entry at a time
+    def write_students_to_file(self, output_file, student_entries, trailing_sections=None, list_name: str = "students"):
+        """
+        :param output_file: opened text file or stream json is written to
+        :param student_entries: iterable (e.g. generator) of student entry dicts, ordered as they should appear in output
+        :param trailing_sections: function returning a dict of sections written after students, see
+        write_students_to_output_file
+        :param list_name: name of the list entries are written to, see write_students_to_output_file
+        :return: number of student entries written, see write_students_to_output_file
+        """
+
+        # Mirror json.dump layout: entries in the students list are nested two indent levels deep
+        if self.compact or self.indent_spaces is None:
+            item_separator, key_separator = (',', ':') if self.compact else (', ', ': ')
+            indent = entry_indent = None
+            first_prefix, separator = '', item_separator
+            closing, empty_closing, section_prefix, object_closing = ']', ']', item_separator, '}'
+            opening = '{'
+        else:
+            key_separator = ': '
+            indent = ' ' * self.indent_spaces
+            entry_indent = '\n' + indent * 2
+            first_prefix, separator = entry_indent, ',' + entry_indent
+            closing, empty_closing = '\n' + indent + ']', ']'
+            section_prefix, object_closing = ',\n' + indent, '\n}'
+            opening = '{\n' + indent
+
+        output_file.write(opening + json.dumps(list_name) + key_separator + '[')
+        entry_count = self.write_list_entries(output_file, student_entries, first_prefix, separator, entry_indent)
+        output_file.write(closing if entry_count else empty_closing)
+        if trailing_sections is not None:  # Sections follow students at the same depth, as in json.dump of one dict
+            for section_name, section in trailing_sections().items():
+                output_file.write(section_prefix + json.dumps(section_name) + key_separator)
+                if not isinstance(section, (dict, list)):  # Entries of the section are written as they are generated
+                    output_file.write('[')
+                    section_count = self.write_list_entries(output_file, section, first_prefix, separator,
+                                                            entry_indent)
+                    output_file.write(closing if section_count else empty_closing)
+                    continue
+                section_json = self.encode_json(section)
+                if indent is not None:
+                    section_json = section_json.replace('\n', '\n' + indent)
+                output_file.write(section_json)
+        output_file.write(object_closing)
+        if self.new_line:  # If new line at bottom of file desired, write it in
+            output_file.write("\n")
+
+        return entry_count
+
+    # Serves to write entries of a list nested one level in a json object, each entry is encoded once received
+    def write_list_entries(self, output_file, entries, first_prefix: str, separator: str, entry_indent: str = None):
+        """
+        :param output_file: opened text file or stream json is written to
+        :param entries: iterable (e.g. generator) of entry dicts
+        :param first_prefix: written before the first entry
+        :param separator: written before every entry after the first
+        :param entry_indent: new line and indent of entries, None for entries without indent
+        :return: number of entries written
+        """
+        entry_count = 0
+        for entry in entries:
+            entry_json = self.encode_json(entry)
+            if entry_indent is not None:  # Shift each line of the entry to its depth within the list
+                entry_json = entry_json.replace('\n', entry_indent)
+
+            output_file.write((separator if entry_count else first_prefix) + entry_json)
+            entry_count += 1
+
+        return entry_count
+
+    # Serves to write students as newline delimited json (one student per line, in the order received) with an index
+    def write_students_to_ndjson_file(self, student_entries, shard_size: int = None):
+        """
+        Each line is a compact json student entry. An index of fixed size records (student id, shard, byte offset and
+        length of the student's line) is written to output file + student_index_suffix, so a single student can be read
+        with one seek (see common/student_index.py). When shard_size is given, lines are split across shard files of
+        shard_size students each (1 for a file per student), and output file holds a json list of shards instead.
+
+        :param student_entries: iterable (e.g. generator) of student entry dicts, in order of student id
+        :param shard_size: number of students in each shard file, None to write every student to output file
+        :return: number of student entries written
+        """
+        shards = []  # Filled out with first id, last id and number of students in each shard file when sharding
+        entry_count, offset, data_file = 0, 0, None
+        with ExitStack() as written_files:  # Index (and unsharded output) replace earlier files once lines are written
+            index_file = written_files.enter_context(replace_file_when_written(
+                self.output_file + student_index_suffix, lambda f: open(f, 'xb')))
+            index_file.write(student_index_header.pack(student_index_magic, shard_size or 0))
+            if not shard_size:
+                data_file = written_files.enter_context(replace_file_when_written(self.output_file,
+                                                                                  lambda f: open(f, 'xb')))
+            try:
+                for entry in student_entries:
+                    if shard_size and entry_count % shard_size == 0:  # Start next shard file
+                        if data_file is not None:
+                            data_file.close()
+                        shard_file = ndjson_shard_file(self.output_file, len(shards))
+                        data_file, offset = open(shard_file, 'wb'), 0
+                        shards.append({"file": os.path.basename(shard_file), "firstId": entry["id"],
+                                       "lastId": entry["id"], "students": 0})
+
+                    line = self.encode_json_line(entry)
+                    data_file.write(line)
+                    index_file.write(student_index_record.pack(entry["id"], max(len(shards) - 1, 0), offset,
+                                                               len(line)))
+                    offset += len(line)
+                    entry_count += 1
+                    if shards:
+                        shards[-1]["lastId"] = entry["id"]
+                        shards[-1]["students"] += 1
+            finally:
+                if shard_size and data_file is not None:  # Shard files are closed here, output file by written_files
+                    data_file.close()
+
+        if shard_size:  # Output file lists shards, so a range of students can be found without reading the index
+            self.write_json_to_output_file({"shards": shards})
+
+        return entry_count
@@ -0,0 +1,36 @@
+# Local imports
+from common.JSONWriter import JSONWriter
+
+
+# A class which holds everything a single run of the admin tool needs: input and output paths, options and own writer
+# Runs share no state, so separate contexts can be processed in separate threads or processes at the same time
+class AdminRunContext:
+    def __init__(self, courses_file: str, students_file: str, tests_file: str, marks_file: str, output_file: str,
+                 **options):
+        self.input_files = [courses_file, students_file, tests_file, marks_file]
+        self.output_file = output_file
+        self.options = options  # Keyword arguments of generate_admin_data (e.g. streaming, engine, workers)
+        self.json_writer = JSONWriter()  # Writer of this run only, used for output and error json
+
+
+# A class which holds the outcome of a run, returned in place of exiting once a run has finished
+class AdminRunResult:
+    def __init__(self, output_file: str, error_message: str = None, students_written: int = 0):
+        self.output_file = output_file
+        self.error_message = error_message  # Message of error which stopped the run, None if the run succeeded
+        self.students_written = students_written
+
+    # Whether the run finished without an error
+    @property
+    def succeeded(self):
+        return self.error_message is None
+
+    # Exit code the command line tool exits with for this result
+    @property
+    def exit_code(self):
+        return 0 if self.succeeded else -1
+
+    # Turn result into a dictionary object, used in batch summaries
+    def result_as_dict(self):
+        return {'output': self.output_file, 'succeeded': self.succeeded, 'error': self.error_message,
+                'studentsWritten': self.students_written}
@@ -6,11 +6,14 @@ from common.handle_errors import handle_error
 
 # Global values for Course or course input data
 desired_columns_courses = ('id', 'name', 'teacher')  # Referenced when parsing school data csv input
+column_types_courses = (int, str, str)  # Types of desired columns, rows are converted to tuples of these types
 course_weight_total = 100
 
 
 # Class to hold data pertinent to a course as per the spec, can return dictionary version of itself
 class Course:
+    __slots__ = ('id', 'name', 'teacher', 'course_average', 'test_weights')
+
     def __init__(self, course_id: int = None, name: str = None, teacher: str = None):
         self.id = course_id
         self.name = name
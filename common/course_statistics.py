@@ -0,0 +1,87 @@
+# Global values for course statistics
+distribution_bucket_width = 10  # Course averages are counted in buckets of 10 points (0-10, ..., 90-100)
+distribution_bucket_count = 10  # Last bucket also holds averages of exactly 100 (or above)
+course_statistics_suffix = '.courses.json'  # Written next to ndjson output, e.g. output.ndjson.courses.json
+
+
+# Sort key of a (course average, student id) score, highest average first and ties in order of student id
+def ranked_score_key(score: tuple):
+    return -score[0], score[1]
+
+
+# Class to collect each student's course averages as students are averaged, then compute statistics for each course
+class CourseStatistics:
+    __slots__ = ('course_scores',)
+
+    def __init__(self):
+        self.course_scores = {}  # Keys are course ids, values are lists of (course average, student id) of the course
+
+    # Record course averages of a student, must be called once averages are computed (see collect_students)
+    def add_student(self, student):
+        course_scores = self.course_scores
+        for course_id, course_average in student.course_averages.items():
+            scores = course_scores.get(course_id)
+            if scores is None:
+                scores = course_scores[course_id] = []
+            scores.append((course_average, student.id))
+
+    # Generator which records course averages of each student as it passes through, students are yielded unchanged
+    def collect_students(self, students):
+        """
+        :param students: Iterable of student objects with averages computed (e.g. generate_averaged_students)
+        :return: generator yielding each student, averages are recorded before the student is yielded (students may
+        release their averages once written, see generate_external_averaged_students)
+        """
+        for student in students:
+            self.add_student(student)
+            yield student
+
+    # Compute statistics of each course from recorded averages, sets course average of each course
+    def compute_course_statistics(self, course_data: dict):
+        """
+        Each course's averages are sorted once (highest first, ties in order of student id), ranks are shared by tied
+        averages (1, 2, 2, 4) and a student's percentile is the percent of the course scoring below them, counting half
+        of those tied with them.
+
+        :param course_data: Dictionary containing all courses (as objects, keys are course ids)
+        :return: list of course statistics dicts in order of course id, see course_statistics_entry
+        """
+        course_scores = self.course_scores
+        return [self.course_statistics_entry(course_data[c], sorted(course_scores.get(c, ()), key=ranked_score_key))
+                for c in sorted(course_data)]
+
+    # Compute statistics of a single course, entry holds course (as in Course.course_as_dict) with statistics added
+    def course_statistics_entry(self, course, scores: list):
+        """
+        :param course: Course object of course
+        :param scores: list of (course average, student id) of the course, highest average first (ties in order of id)
+        :return: course statistics dict of course
+        """
+        student_count = len(scores)
+        if student_count:
+            course.course_average = round(sum(s[0] for s in scores) / student_count, 2)
+
+        distribution = [0] * distribution_bucket_count
+        ranks = []
+        tied_start = tied_end = 0  # Positions of first score tied with the current score and of first score below it
+        for position, (course_average, student_id) in enumerate(scores):
+            if position == tied_end:  # First score of a group of tied scores, find where the group ends
+                tied_start = position
+                while tied_end < student_count and scores[tied_end][0] == course_average:
+                    tied_end += 1
+            below = student_count - tied_end
+            ranks.append({"id": student_id, "courseAverage": course_average, "rank": tied_start + 1,
+                          "percentile": round(100 * (below + (tied_end - tied_start) / 2) / student_count, 2)})
+            bucket = int(course_average // distribution_bucket_width)
+            distribution[min(max(bucket, 0), distribution_bucket_count - 1)] += 1
+
+        course_entry = course.course_as_dict()
+        if not student_count:  # No student has an average in the course, so neither does the course (null, not 0.0)
+            course_entry["courseAverage"] = None
+        course_entry["students"] = student_count
+        course_entry["distribution"] = {
+            f'{b * distribution_bucket_width}-{(b + 1) * distribution_bucket_width}': distribution[b]
+            for b in range(distribution_bucket_count)
+        }
+        course_entry["ranks"] = ranks
+        return course_entry
@@ -0,0 +1,121 @@
+# General imports
+import os
+import json
+
+# Local imports
+from common.handle_errors import handle_error
+from common.school_ids import SchoolIds
+
+
+# Describe courses and tests that saved sums of points were computed with, sums are only valid if these are unchanged
+def generate_delta_state_catalog(course_data: dict, test_data: dict):
+    """
+    :param course_data: Dictionary containing all courses (as objects, keys are course ids) with test weights added
+    :param test_data: Dictionary containing all tests (as objects, keys are test ids)
+    :return: dict with test weight totals of each course and the course id and weight of each test (keys are strings)
+    """
+    return {
+        "courseWeights": {str(c): course_data[c].test_weights for c in course_data},
+        "tests": {str(t): [test_data[t].course_id, test_data[t].weight] for t in test_data}
+    }
+
+
+# Ids of tests a student has a mark for in each course, read from the tests kept for each course (see add_course_test)
+def saved_course_tests(student, school_ids: SchoolIds):
+    """
+    :param student: Student with tests of its courses recorded as marks were summed
+    :param school_ids: SchoolIds of courses and tests the marks were summed with
+    :return: dict with keys as course ids and values as lists of test ids, only set bits of each course are visited so
+    cost grows with the marks of the student
+    """
+    course_tests = {}
+    for course_id, taken in (student.course_tests or {}).items():
+        tests = school_ids.course_test_indices[school_ids.course_indices[course_id]]
+        test_ids = course_tests[course_id] = []
+        while taken:
+            position = taken.bit_length() - 1  # Highest test marked, cleared once saved
+            test_ids.append(school_ids.tests[tests[position]].id)
+            taken ^= 1 << position
+        test_ids.reverse()
+
+    return course_tests
+
+
+# Save running sums of weighted points for each student, along with the courses and tests they were computed with
+def save_delta_state(state_file: str, student_data: dict, course_data: dict, test_data: dict):
+    """
+    State is saved after a run which used running sums of points (streaming mode), so a later run can add rows
+    appended to marks onto these sums instead of reading every row of marks again. Keys of the state file are:
+        "catalog": test weight totals of each course (as built by check_course_test_weights) and each test's course
+        and weight, see generate_delta_state_catalog
+        "students": course points (sums of mark * test weight for each course), course tests (ids of tests already
+        marked in each course, next to its points, so appended marks for those tests are rejected as duplicates) and
+        total average of each student
+
+    :param state_file: path to state file, written to a temporary file first so an interrupted save keeps the old state
+    :param student_data: Dictionary containing all students (as objects, keys are student ids) with averages computed
+    :param course_data: Dictionary containing all courses (as objects, keys are course ids) with test weights added
+    :param test_data: Dictionary containing all tests (as objects, keys are test ids)
+    :return: None, serves to write state to state_file
+    """
+    school_ids = SchoolIds(course_data, test_data)  # Tests taken are saved as test ids, as indices may change
+    state = {
+        "catalog": generate_delta_state_catalog(course_data, test_data),
+        "students": {s: {"coursePoints": student_data[s].course_points,
+                         "courseTests": saved_course_tests(student_data[s], school_ids),
+                         "totalAverage": student_data[s].total_average}
+                     for s in student_data}
+    }
+
+    try:  # Attempt to write state to a temporary file, then replace state file with it
+        with open(state_file + '.tmp', 'w') as temp_file:
+            json.dump(state, temp_file)
+        os.replace(state_file + '.tmp', state_file)
+    except OSError:
+        handle_error(f'There was an error saving state to file with path: {state_file}')
+
+
+# Load state saved by save_delta_state, seeding each student's course points with the saved running sums
+def load_delta_state(state_file: str, student_data: dict, school_ids: SchoolIds):
+    """
+    :param state_file: path to state file saved by save_delta_state
+    :param student_data: Dictionary containing all students (as objects, keys are student ids)
+    :param school_ids: SchoolIds of courses and tests, tests taken are seeded by test index
+    :return: tuple ordered as follows: saved catalog (see generate_delta_state_catalog) and dict of saved total average
+    of each student (keys are student ids)
+    """
+    try:  # Attempt to read state file
+        with open(state_file, 'r') as state_input:
+            state = json.load(state_input)
+    except (OSError, ValueError):
+        handle_error(f'There was an error loading state from file with path: {state_file}')
+
+    saved_total_averages = {}
+    for s, saved_student in state["students"].items():
+        try:  # Seed student with running sums of points from state, json keys are strings so they are converted
+            student = student_data[int(s)]
+        except KeyError:  # State no longer matches students input, a full run is needed to save a new state
+            handle_error(f'Student with id {s} in state file {state_file} does not exist in students input.')
+        student.course_points = {int(c): points for c, points in saved_student["coursePoints"].items()}
+        for c, test_ids in saved_student.get("courseTests", {}).items():
+            for t in test_ids:  # Tests no longer found are reported by check_delta_state_catalog
+                test_index = school_ids.test_indices.get(t)
+                if test_index is not None:
+                    student.add_course_test(int(c), school_ids.test_course_positions[test_index])
+        saved_total_averages[student.id] = saved_student["totalAverage"]
+
+    return state["catalog"], saved_total_averages
+
+
+# Validate courses and tests match those saved with state, saved sums of points are invalid otherwise
+def check_delta_state_catalog(state_file: str, course_data: dict, test_data: dict, saved_catalog: dict):
+    """
+    :param state_file: path to state file saved by save_delta_state
+    :param course_data: Dictionary containing all courses (as objects, keys are course ids) with test weights added
+    :param test_data: Dictionary containing all tests (as objects, keys are test ids)
+    :param saved_catalog: catalog from load_delta_state
+    :return: None, throws error and halts execution if courses, tests or weights have changed since state was saved
+    """
+    if generate_delta_state_catalog(course_data, test_data) != saved_catalog:
+        handle_error(f'Courses or tests have changed since state file {state_file} was saved. '
+                     f'Run without delta to save a new state.')
@@ -0,0 +1,247 @@
+# General imports
+import os
+import heapq
+import struct
+
+# Local imports
+from common.handle_errors import handle_error
+from common.parse_school_csvs import typed_row_as_dict
+from common.mark import desired_columns_marks
+from common.school_ids import SchoolIds
+from common.course_statistics import CourseStatistics
+
+# Global values for aggregating marks out of core
+spill_record = struct.Struct('<qqqq')  # Student id, test index, row number (in marks) and mark of a mark
+spill_entry_bytes = 190  # Estimated memory held by each mark before it is spilled (tuple of 4 ints and its list slot)
+score_record = struct.Struct('<qdq')  # Course id, negated course average and student id of a course average
+score_entry_bytes = 170  # Estimated memory held by each course average before it is spilled (tuple of 3 and its slot)
+student_entry_bytes = 450  # Estimated memory held by each student (object, name and slot in student dict) for a run
+spill_buffer_records = 4096  # Records read from each run at a time while merging
+
+
+# Bytes of a memory limit (in megabytes) left for records kept before spilling, once students of the run are counted
+def spill_memory_budget(memory_limit: int, student_count: int):
+    """
+    Students are held for the whole run, so they count against the limit. Courses and tests do not grow with marks or
+    students and are not counted.
+
+    :param memory_limit: memory limit in megabytes
+    :param student_count: number of students of the run
+    :return: bytes left for marks (or course averages) kept in memory before they are spilled to a run file
+    """
+    students_bytes = student_count * student_entry_bytes
+    if students_bytes >= memory_limit * (1 << 20):
+        handle_error(f'Memory limit of {memory_limit} megabytes is too small to hold {student_count} students. At '
+                     f'least {students_bytes // (1 << 20) + 1} megabytes are required.')
+
+    return memory_limit * (1 << 20) - students_bytes
+
+
+# Number of marks kept in memory before they are spilled to disk, for a memory limit in megabytes
+def spill_entry_limit(memory_limit: int, student_count: int):
+    return max(1, spill_memory_budget(memory_limit, student_count) // spill_entry_bytes)
+
+
+# Number of course averages kept in memory before they are spilled to disk, for a memory limit in megabytes
+def score_entry_limit(memory_limit: int, student_count: int):
+    return max(1, spill_memory_budget(memory_limit, student_count) // score_entry_bytes)
+
+
+# Write records to a run file sorted in order of their fields, the records are cleared once written
+def spill_records(records: list, record_struct: struct.Struct, spill_dir: str, run_name: str):
+    """
+    :param records: list of tuples packed with record_struct, sorted in place
+    :param record_struct: struct records are packed with
+    :param spill_dir: directory run files are written to
+    :param run_name: name of run file (unique within spill_dir)
+    :return: path to run file
+    """
+    run_file = os.path.join(spill_dir, run_name)
+    records.sort()
+    with open(run_file, 'wb') as run_output:
+        for record in records:
+            run_output.write(record_struct.pack(*record))
+    records.clear()
+
+    return run_file
+
+
+# Generator which reads records of a run file a buffer at a time
+def read_spill_run(run_file: str, record_struct: struct.Struct = spill_record):
+    """
+    :param run_file: path to run file written by spill_records
+    :param record_struct: struct records of run file were packed with
+    :return: generator yielding record tuples in order of run file
+    """
+    with open(run_file, 'rb') as run_input:
+        for block in iter(lambda: run_input.read(record_struct.size * spill_buffer_records), b''):
+            yield from record_struct.iter_unpack(block)
+
+
+# Find the first mark (in order of marks) for a test the student already has an earlier mark for, in spilled runs
+def first_duplicate_mark(run_files: list):
+    """
+    Runs are sorted by student id, test index and row number, so marks of a student for the same test are next to each
+    other once runs are merged, and every mark after the first of a test is a duplicate.
+
+    :param run_files: paths to run files from accumulate_spilled_marks
+    :return: (student id, test index, row number, mark) of the duplicate mark found first in marks, None if none
+    """
+    first_duplicate, previous = None, None
+    for record in heapq.merge(*(read_spill_run(f) for f in run_files)):
+        if previous is not None and record[:2] == previous[:2] and \
+                (first_duplicate is None or record[2] < first_duplicate[2]):
+            first_duplicate = record
+        previous = record
+
+    return first_duplicate
+
+
+# Report the first duplicate mark found in spilled runs as an error, as accumulate_student_course_points does
+def check_spilled_duplicate_marks(run_files: list, school_ids: SchoolIds):
+    duplicate = first_duplicate_mark(run_files)
+    if duplicate is not None:
+        student_id, test_index, _, mark = duplicate
+        test_id = school_ids.tests[test_index].id
+        handle_error(f'Duplicate mark found for test with id {test_id} and student with id {student_id}. Found in '
+                     f'marks with row: {typed_row_as_dict(desired_columns_marks, (test_id, student_id, mark))}')
+
+
+# Validate rows of marks and spill them to sorted run files on disk once there are too many to keep in memory
+def accumulate_spilled_marks(student_data: dict, school_ids: SchoolIds, marks_rows, spill_dir: str, max_entries: int):
+    """
+    Out of core counterpart to accumulate_student_course_points in main.py, rows are validated the same way and the
+    first bad row in marks is reported. Marks are spilled with their test index and row number, so a test listed more
+    than once for a student is found once runs are merged (see first_duplicate_mark) rather than with sets of tests
+    kept for each student.
+
+    :param student_data: Dictionary containing all students (as objects, keys are student ids)
+    :param school_ids: SchoolIds of courses and tests, marks are joined to courses and weights by test index
+    :param marks_rows: Iterable of typed rows (test_id, student_id, mark) from marks, e.g. from stream_typed_rows
+    :param spill_dir: directory run files are written to
+    :param max_entries: number of marks kept in memory before they are spilled, see spill_entry_limit
+    :return: list of paths to run files, each sorted by student id, test index and row number
+    """
+    test_indices = school_ids.test_indices
+    run_files, partial_marks = [], []
+    for row_number, r in enumerate(marks_rows):
+        test_id, student_id, mark = r
+        test_index = test_indices.get(test_id)
+        if student_id not in student_data or test_index is None:
+            # Any duplicate mark is in an earlier row, so it is reported first
+            if partial_marks:
+                run_files.append(spill_records(partial_marks, spill_record, spill_dir, f'run{len(run_files):06d}.bin'))
+            check_spilled_duplicate_marks(run_files, school_ids)
+            if student_id not in student_data:  # If no such student exists in the database, through an error
+                handle_error(f'No such student with id {student_id} exists. Found in marks with row: '
+                             f'{typed_row_as_dict(desired_columns_marks, r)}')
+            # If no such test exists in the database, through an error due to bad entry in marks
+            handle_error(f'No such test with id {test_id} exists. Found in marks with row: '
+                         f'{typed_row_as_dict(desired_columns_marks, r)}')
+
+        if len(partial_marks) >= max_entries:
+            run_files.append(spill_records(partial_marks, spill_record, spill_dir, f'run{len(run_files):06d}.bin'))
+        partial_marks.append((student_id, test_index, row_number, mark))
+
+    if partial_marks:
+        run_files.append(spill_records(partial_marks, spill_record, spill_dir, f'run{len(run_files):06d}.bin'))
+    check_spilled_duplicate_marks(run_files, school_ids)
+
+    return run_files
+
+
+# Generator which merges run files, summing weighted points of each student's marks for each course
+def merge_spill_runs(run_files: list, school_ids: SchoolIds):
+    """
+    :param run_files: paths to run files, each sorted by student id, test index and row number
+    :param school_ids: SchoolIds of courses and tests, marks are joined to courses and weights by test index
+    :return: generator yielding (student id, course points) in order of student id, where course points is a dict with
+    keys as course ids and values as sums of points
+    """
+    course_ids, test_course_indices, test_weights = \
+        school_ids.course_ids, school_ids.test_course_indices, school_ids.test_weights
+    student_id, student_courses = None, {}
+    for record_student, test_index, _, mark in heapq.merge(*(read_spill_run(f) for f in run_files)):
+        if record_student != student_id:
+            if student_id is not None:
+                yield student_id, student_courses
+            student_id, student_courses = record_student, {}
+        course_id = course_ids[test_course_indices[test_index]]
+        student_courses[course_id] = student_courses.get(course_id, 0) + mark * test_weights[test_index]
+
+    if student_id is not None:
+        yield student_id, student_courses
+
+
+# Generate students in order of id with averages computed from merged run files, students hold sums only while yielded
+def generate_external_averaged_students(student_data: dict, school_ids: SchoolIds, run_files: list):
+    """
+    :param student_data: Dictionary containing all students (as objects, keys are student ids)
+    :param school_ids: SchoolIds of courses and tests, see merge_spill_runs
+    :param run_files: paths to run files from accumulate_spilled_marks
+    :return: generator yielding student objects sorted by id with course averages and total average computed
+    """
+    merged_students = merge_spill_runs(run_files, school_ids)
+    next_student = next(merged_students, None)
+    for s_id in sorted(student_data):
+        student = student_data[s_id]
+        if next_student is not None and next_student[0] == s_id:
+            student.course_points = next_student[1]
+            next_student = next(merged_students, None)
+        student.compute_course_averages_from_points()
+        student.compute_total_average()
+
+        yield student
+
+        # Entry of student has been written, sums and course averages are released to keep memory bounded
+        student.course_points, student.course_averages = None, {}
+
+
+# Course statistics recorded within a memory limit, course averages are spilled to sorted run files once too many
+class SpilledCourseStatistics(CourseStatistics):
+    __slots__ = ('spill_dir', 'max_entries', 'run_files')
+
+    def __init__(self, spill_dir: str, max_entries: int):
+        """
+        :param spill_dir: directory run files are written to
+        :param max_entries: number of course averages kept in memory before they are spilled, see score_entry_limit
+        """
+        super().__init__()
+        self.course_scores = []  # (course id, negated course average, student id) of averages not yet spilled
+        self.spill_dir = spill_dir
+        self.max_entries = max_entries
+        self.run_files = []
+
+    # Record course averages of a student, spilling recorded averages once there are too many
+    def add_student(self, student):
+        course_scores = self.course_scores
+        for course_id, course_average in student.course_averages.items():
+            if len(course_scores) >= self.max_entries:
+                self.spill_course_scores()
+            course_scores.append((course_id, -course_average, student.id))
+
+    # Write recorded course averages to a run file sorted by course, average (highest first) and student id
+    def spill_course_scores(self):
+        self.run_files.append(spill_records(self.course_scores, score_record, self.spill_dir,
+                                            f'scores{len(self.run_files):06d}.bin'))
+
+    # Generate statistics of each course from merged run files, only averages of one course are held at a time
+    def compute_course_statistics(self, course_data: dict):
+        """
+        :param course_data: Dictionary containing all courses (as objects, keys are course ids)
+        :return: generator yielding course statistics dicts in order of course id, see
+        CourseStatistics.compute_course_statistics
+        """
+        if self.course_scores:
+            self.spill_course_scores()
+        merged_scores = heapq.merge(*(read_spill_run(f, score_record) for f in self.run_files))
+        next_score = next(merged_scores, None)
+        for c in sorted(course_data):
+            scores = []
+            while next_score is not None and next_score[0] < c:  # Averages of courses which do not exist are skipped
+                next_score = next(merged_scores, None)
+            while next_score is not None and next_score[0] == c:
+                scores.append((-next_score[1], next_score[2]))
+                next_score = next(merged_scores, None)
+
+            yield self.course_statistics_entry(course_data[c], scores)
@@ -0,0 +1,94 @@
+# General imports
+import os
+import time
+import hashlib
+
+# Local imports
+from common.JSONWriter import JSONWriter
+
+# Global values for watch mode
+default_watch_interval_ms = 500  # Input files are polled this often for changes
+default_debounce_ms = 1000  # Changed input files must be unchanged for this long before output is regenerated
+
+
+# Size and modified time of each input file (None for files which do not exist), a change to either is a change to file
+def read_file_fingerprints(input_files: list):
+    fingerprints = []
+    for f in input_files:
+        try:
+            file_stat = os.stat(f)
+        except OSError:
+            fingerprints.append(None)
+            continue
+        fingerprints.append((file_stat.st_size, file_stat.st_mtime_ns))
+
+    return fingerprints
+
+
+# Digest of bytes read from marks, used to find whether later marks only append rows to these bytes
+def marks_bytes_digest(marks_bytes: bytes):
+    return hashlib.blake2b(marks_bytes, digest_size=16).digest()
+
+
+# Class to poll input files for changes, waiting for a burst of writes to end before changes are reported
+class InputFileWatcher:
+    __slots__ = ('input_files', 'fingerprints')
+
+    def __init__(self, input_files: list):
+        self.input_files = input_files
+        self.fingerprints = read_file_fingerprints(input_files)
+
+    # Wait for input files to change, then for them to stay unchanged for debounce_ms (each write restarts the wait)
+    def wait_for_changes(self, watch_interval_ms: int = default_watch_interval_ms,
+                         debounce_ms: int = default_debounce_ms, stop_event=None):
+        """
+        :param watch_interval_ms: milliseconds between polls of input files
+        :param debounce_ms: milliseconds changed input files must be unchanged for before changes are reported
+        :param stop_event: threading.Event which stops waiting once set, None to wait until files change
+        :return: set of positions (file counts) of input files which changed, or None if stop_event was set
+        """
+        changed_since, last_fingerprints = None, self.fingerprints
+        while stop_event is None or not stop_event.is_set():
+            time.sleep(watch_interval_ms / 1000)
+            fingerprints = read_file_fingerprints(self.input_files)
+            if fingerprints != last_fingerprints:  # Written since last poll, wait for writes to end
+                changed_since, last_fingerprints = time.monotonic(), fingerprints
+            elif changed_since is not None and (time.monotonic() - changed_since) * 1000 >= debounce_ms:
+                changed_files = {i for i, (old, new) in enumerate(zip(self.fingerprints, fingerprints)) if old != new}
+                self.fingerprints = fingerprints
+                if changed_files:  # Files written back to how they were are not changes
+                    return changed_files
+                changed_since = None
+
+        return None
+
+
+# Class to hold a school's data between regenerations in watch mode, so only what a changed input file affects is redone
+class WatchedSchool:
+    __slots__ = ('input_files', 'json_writer', 'output_format', 'shard_size', 'course_stats', 'course_data',
+                 'student_data', 'test_data', 'school_ids', 'marks_size', 'marks_digest', 'marks_header')
+
+    def __init__(self, input_files: list, output_file: str, output_format: str = 'json', shard_size: int = None,
+                 course_stats: bool = False, compact: bool = False, compression: str = None,
+                 fast_encoder: bool = False):
+        self.input_files = input_files
+        self.json_writer = JSONWriter()  # Writer of the watched school, output file and format are kept between runs
+        self.json_writer.set_json_writer_output_file(output_file)
+        self.json_writer.set_json_writer_format(compact=compact, compression=compression, fast_encoder=fast_encoder)
+        self.output_format = output_format
+        self.shard_size = shard_size
+        self.course_stats = course_stats
+        self.course_data = self.student_data = self.test_data = None  # Set once inputs are loaded without error
+        self.school_ids = None  # SchoolIds of loaded courses and tests, see common/school_ids.py
+        self.marks_size = None  # Bytes of marks summed into students' course points, None if marks are compressed
+        self.marks_digest = None  # Digest of those bytes, see marks_bytes_digest
+        self.marks_header = None  # Bytes of marks up to and including header line, prepended to appended rows
+
+    # Whether school has been loaded, school is unloaded after an error so the next change loads every input file
+    @property
+    def loaded(self):
+        return self.student_data is not None
+
+    def unload(self):
+        self.course_data = self.student_data = self.test_data = self.school_ids = None
+        self.marks_size = self.marks_digest = self.marks_header = None
@@ -1,25 +1,43 @@
-# General imports
-import sys
+# Error raised when input data or arguments are invalid, message is written to output file of the run as an error JSON
+class AdminDataError(Exception):
+    def __init__(self, error_message: str):
+        super().__init__(error_message)
+        self.error_message = error_message
 
-# Local imports
-from common.JSONWriter import JSONWriter
+    # Error json written to output file of the run
+    def error_as_dict(self):
+        return {"error": self.error_message}
 
-# Global values for error handling
-out_writer = JSONWriter()  # Serves to hold writer object which can be set by set_error_JSONWriter
 
+# Error raised when validating input finds errors, the whole report of errors is written to output file
+class AdminValidationError(AdminDataError):
+    def __init__(self, error_message: str, error_report: dict):
+        super().__init__(error_message)
+        self.error_report = error_report  # See ValidationReport.report_as_dict in common/validation.py
 
-# Serves to set json writer object to use when writing output
-def set_error_json_writer(json_writer: JSONWriter = None):
-    global out_writer
-    out_writer = json_writer
+    def error_as_dict(self):
+        return self.error_report
 
 
-# Serves to write an "error" JSON object to an output file with a variable error message. Exits -1 on completion.
+# Serves to stop processing of a run with a variable error message. Nothing global is touched, so runs in other threads
+# or processes are unaffected. The run catching the error writes it to its own output file (see write_error_json).
 def handle_error(error_message: str):
+    raise AdminDataError(error_message)
+
+
+# Serves to write an "error" JSON object to an output file with a variable error message
+def write_error_json(error_message: str, json_writer, error_json: dict = None):
+    """
+    :param error_message: message of error which stopped processing
+    :param json_writer: JSONWriter of the run which produced the error
+    :param error_json: error json object to write in place of {"error": error_message} (e.g. a validation report)
+    :return: None, serves to print the error message and write it to the writer's output file (if one has been set)
+    """
     print(error_message)  # Print error message prior to writing it to output file
-    if out_writer.output_file is None:
-        print('No output file specified for JSONWriter in handle_errors.py. '
-              'Use set_error_json_writer to provide valid JSONWriter.')
-    error_json = {"error": error_message}  # Create error json object
-    out_writer.write_json_to_output_file(error_json)  # Send object to be written to output file
-    sys.exit(-1)  # Exit with error
+    if json_writer.output_file is None:  # Output file could not be set, so the error is only printed
+        print('No output file specified for JSONWriter, error message could not be written.')
+        return
+
+    if error_json is None:
+        error_json = {"error": error_message}  # Create error json object
+    json_writer.write_json_to_output_file(error_json)  # Send object to be written to output file
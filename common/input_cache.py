@@ -0,0 +1,164 @@
+# General imports
+import os
+import sys
+import json
+import hashlib
+import tempfile
+from array import array
+
+# Local imports
+from common.parse_school_csvs import open_school_data_file, input_column_types
+from common.integer_csv_reader import parse_typed_columns
+
+# Global values for caching typed rows of input files
+cache_format_version = 2  # Stored with each cache entry, entries of other versions are ignored
+hash_block_size = 1 << 20  # Bytes read at a time when hashing content of input files
+
+
+# Hash content of a file, used to find whether a file has changed when its size or modified time cannot tell
+def hash_file_content(f: str):
+    """
+    :param f: path to file
+    :return: hex digest of sha256 hash of file content
+    """
+    content_hash = hashlib.sha256()
+    with open(f, 'rb') as file:
+        for block in iter(lambda: file.read(hash_block_size), b''):
+            content_hash.update(block)
+
+    return content_hash.hexdigest()
+
+
+# Path to cache entry for an input file, entries are keyed by the absolute path of the input file
+def cache_entry_path(cache_dir: str, file_count: int, f: str):
+    """
+    :param cache_dir: path to directory holding cache entries
+    :param file_count: file count specifying which input file is cached (courses, students, tests, or marks)
+    :param f: path to input csv file
+    :return: path to cache entry file within cache_dir
+    """
+    entry_key = hashlib.sha256(f'{file_count}:{os.path.abspath(f)}'.encode()).hexdigest()
+    return os.path.join(cache_dir, entry_key + '.cache')
+
+
+# Read a cache entry, returns None if there is no entry or it cannot be used
+def read_cache_entry(entry_path: str):
+    """
+    Entries only hold data (a json header line followed by raw integer columns), so reading one never runs code. The
+    cache is best effort, an entry which cannot be read (missing, truncated, corrupt or of an older version) is a cache
+    miss and the input file is parsed again. Other errors (e.g. a bug) are raised rather than hidden as misses.
+
+    :param entry_path: path to cache entry from cache_entry_path
+    :return: dict holding fingerprint of input file and its columns (see write_cache_entry), or None
+    """
+    try:
+        with open(entry_path, 'rb') as entry_file:
+            entry = json.loads(entry_file.readline())
+            if entry.get('version') != cache_format_version:
+                return None
+            columns = []
+            for column in entry['columns']:
+                if 'values' in column:  # Column was stored in header as a json list
+                    columns.append(list(column['values']))
+                    continue
+                values = array('q')
+                values.frombytes(entry_file.read(column['int64'] * values.itemsize))
+                if len(values) != column['int64']:  # Entry was cut short
+                    return None
+                if sys.byteorder == 'big':  # Integer columns are stored little endian
+                    values.byteswap()
+                columns.append(values)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):  # ValueError covers bad json and UTF-8
+        return None
+    entry['columns'] = columns
+
+    return entry
+
+
+# Write a cache entry, the cache is best effort so an entry which cannot be written is skipped
+def write_cache_entry(entry_path: str, entry: dict):
+    """
+    Entry is written as a json header line holding its fingerprint and a description of each column, followed by the
+    bytes of each array('q') column (64 bit little endian integers). Columns of other values are held in the header.
+
+    :param entry_path: path to cache entry from cache_entry_path
+    :param entry: dict with keys: version, size, mtime_ns, sha256 (fingerprint of input file), and columns
+    :return: None, serves to write entry to entry_path
+    """
+    columns = entry['columns']
+    header = dict(entry, columns=[{'int64': len(c)} if isinstance(c, array) else {'values': c} for c in columns])
+    temp_path = None
+    try:  # Write to a uniquely named temporary file first, so a partially written entry is never read
+        entry_dir = os.path.dirname(entry_path)
+        os.makedirs(entry_dir, exist_ok=True)
+        temp_fd, temp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+        with os.fdopen(temp_fd, 'wb') as entry_file:
+            entry_file.write(json.dumps(header).encode() + b'\n')
+            for column in columns:
+                if not isinstance(column, array):
+                    continue
+                if sys.byteorder == 'big':
+                    column = array('q', column)
+                    column.byteswap()
+                column.tofile(entry_file)
+        os.replace(temp_path, entry_path)
+    except OSError:
+        if temp_path is not None:  # Entry could not be written whole, its temporary file is removed
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+# Load typed columns of an input file from cache if the file is unchanged, otherwise parse the file and cache them
+def load_typed_columns(file_count: int, f: str, cache_dir: str):
+    """
+    An input file is unchanged if its size and modified time match those cached with its rows. If only its modified
+    time differs (e.g. file was copied or touched), its content hash is compared with the cached hash instead.
+
+    :param file_count: file count specifying which input file is being loaded (courses, students, tests, or marks)
+    :param f: path to input csv file
+    :param cache_dir: path to directory holding cache entries
+    :return: list of columns of f, array('q') for integer columns (see pack_typed_rows), for consumers of columns
+    (e.g. the numpy engine) which need not build a tuple for each row
+    """
+    open_school_data_file(f).close()  # Missing and empty files produce the same errors as when parsing
+    file_stat = os.stat(f)  # Fingerprint is taken before parsing, a file changed while parsing is reparsed next time
+    entry_path = cache_entry_path(cache_dir, file_count, f)
+    entry = read_cache_entry(entry_path)
+
+    content_hash = None
+    if entry is not None and entry['size'] == file_stat.st_size:
+        if entry['mtime_ns'] == file_stat.st_mtime_ns:  # Unchanged, columns are loaded without hashing or parsing
+            return entry['columns']
+
+        content_hash = hash_file_content(f)
+        if content_hash == entry['sha256']:  # Unchanged content, store new modified time so it is not hashed again
+            entry['mtime_ns'] = file_stat.st_mtime_ns
+            write_cache_entry(entry_path, entry)
+            return entry['columns']
+
+    # No usable entry, parse input file and cache its typed rows
+    if content_hash is None:
+        content_hash = hash_file_content(f)
+    columns = parse_typed_columns(file_count, f)
+    write_cache_entry(entry_path, {
+        'version': cache_format_version,
+        'size': file_stat.st_size,
+        'mtime_ns': file_stat.st_mtime_ns,
+        'sha256': content_hash,
+        'columns': columns
+    })
+
+    return columns
+
+
+# Load typed rows of an input file from cache if the file is unchanged, otherwise parse the file and cache its rows
+def load_typed_rows(file_count: int, f: str, cache_dir: str):
+    """
+    :param file_count: file count specifying which input file is being loaded (courses, students, tests, or marks)
+    :param f: path to input csv file
+    :param cache_dir: path to directory holding cache entries
+    :return: list of typed rows (tuples) of f, see stream_typed_rows and load_typed_columns
+    """
+    return list(zip(*load_typed_columns(file_count, f, cache_dir)))
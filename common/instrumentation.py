@@ -0,0 +1,133 @@
+# General imports
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:  # resource is only available on unix, peak resident memory is not recorded without it
+    import resource
+except ImportError:
+    resource = None
+
+# Global values for instrumentation
+metrics_file_suffix = '.metrics.json'  # Metrics are written next to output file, e.g. output.json.metrics.json
+supported_metrics_modes = ('time', 'memory')  # Stage timings only (default), or timings with traced memory
+rss_units_bytes = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+
+
+# Convert value of --metrics flag, the flag alone (no value) records timings as metrics=True does
+def metrics_mode(value: str):
+    return value or True
+
+
+# Peak resident memory of this process so far in bytes, read from the operating system without tracing allocations
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_units_bytes
+
+
+# A class which records wall time, cpu time, peak memory and row counts for each stage of processing
+class StageMetrics:
+    def __init__(self, enabled: bool = False, trace_memory: bool = False):
+        """
+        :param enabled: boolean to determine whether metrics are recorded
+        :param trace_memory: boolean to determine whether memory allocated by each stage is traced with tracemalloc.
+        Tracing slows down every allocation several times over, so stage timings are only comparable to runs without
+        metrics when it is off (peak resident memory of the process is recorded either way)
+        """
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.stages = []  # Filled out with a dict for each finished stage, in the order stages were run
+        self.rows = {}  # Row counts of inputs and outputs, keys are names such as marks or students_written
+
+    # Start tracing memory allocations, only when memory is traced as tracing slows down allocations
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    # Stop tracing memory allocations started by start
+    def stop(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    # Context manager timing a stage, does nothing when instrumentation is off
+    def stage(self, name: str):
+        """
+        :param name: name of stage (e.g. parse, associate)
+        :return: context manager which records the stage's metrics when it exits
+        """
+        return self.record_stage(name) if self.enabled else nullcontext()
+
+    # Records metrics of a stage around the code run within it, peak traced memory is reset as the stage starts
+    @contextmanager
+    def record_stage(self, name: str):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+            stage_metrics = {
+                "stage": name,
+                "wallSeconds": round(wall, 6),
+                "cpuSeconds": round(cpu, 6),
+                "peakRssBytes": peak_rss_bytes()  # Peak resident memory of the process by the end of stage
+            }
+            if self.trace_memory:
+                current_memory, peak_memory = tracemalloc.get_traced_memory()
+                stage_metrics["peakTracedBytes"] = peak_memory  # Peak traced while stage ran, includes earlier data
+                stage_metrics["allocatedBytes"] = current_memory - start_memory  # Memory still held at end of stage
+            self.stages.append(stage_metrics)
+
+    # Count rows passing through an iterable (e.g. a generator of marks), returns the iterable itself when off
+    def count_rows(self, name: str, rows):
+        """
+        :param name: name row count is recorded under
+        :param rows: iterable of rows
+        :return: iterable yielding the same rows, counting them as they are consumed
+        """
+        if not self.enabled:
+            return rows
+        if isinstance(rows, list):  # Lists are counted without wrapping them
+            self.rows[name] = len(rows)
+            return rows
+
+        return self.counted_rows(name, rows)
+
+    # Generator which yields rows while keeping count of them under name
+    def counted_rows(self, name: str, rows):
+        self.rows[name] = 0
+        for r in rows:
+            self.rows[name] += 1
+            yield r
+
+    # Record a row count directly, e.g. number of students written to output
+    def set_row_count(self, name: str, count: int):
+        if self.enabled:
+            self.rows[name] = count
+
+    # Serves to write metrics as json to a file next to the output file
+    def write_metrics_file(self, output_file: str):
+        """
+        :param output_file: path to output file, metrics are written to this path with metrics_file_suffix added
+        :return: None, serves to write stages and row counts to metrics file when instrumentation is on
+        """
+        if not self.enabled:
+            return
+
+        metrics = {
+            "stages": self.stages,
+            "totalWallSeconds": round(sum(s["wallSeconds"] for s in self.stages), 6),
+            "totalCpuSeconds": round(sum(s["cpuSeconds"] for s in self.stages), 6),
+            "peakRssBytes": peak_rss_bytes()
+        }
+        if self.trace_memory:
+            metrics["peakTracedBytes"] = max((s["peakTracedBytes"] for s in self.stages), default=0)
+        metrics["rows"] = self.rows
+        with open(output_file + metrics_file_suffix, 'w') as metrics_file:
+            json.dump(metrics, metrics_file, indent=2)
+            metrics_file.write("\n")
@@ -0,0 +1,142 @@
+# General imports
+import json
+import mmap
+from array import array
+
+# Local imports
+from common.parse_school_csvs import open_school_data_file, stream_typed_rows, input_file_compression, \
+    input_columns, input_column_types
+
+# Global values for reading input files holding only integer columns
+integer_csv_bytes = b'0123456789-,\n\r \t'  # Bytes a file read by read_integer_csv_columns can hold after its header
+non_structure_bytes = bytes(b for b in range(256) if b not in b',\n')  # Removed when checking values per line
+read_chunk_bytes = 1 << 20  # Rows are parsed about 1 MiB (ending at a new line) at a time, bounding memory used
+
+
+# Whether all desired columns of an input file are integers (tests and marks), such files can be read from bytes
+def integer_input_file(file_count: int):
+    return all(t is int for t in input_column_types[file_count])
+
+
+# Store typed rows by column, integer columns are stored as compact arrays of 64 bit integers
+def pack_typed_rows(file_count: int, typed_rows: list):
+    """
+    :param file_count: file count specifying which input file the rows are from
+    :param typed_rows: list of typed rows (tuples) from stream_typed_rows
+    :return: list of columns, array('q') for integer columns and list of values otherwise
+    """
+    columns = []
+    for i, column_type in enumerate(input_column_types[file_count]):
+        values = [r[i] for r in typed_rows]
+        try:
+            columns.append(array('q', values) if column_type is int else values)
+        except OverflowError:  # Integers too large for 64 bits are stored as a list like other columns
+            columns.append(values)
+
+    return columns
+
+
+# Parse integer rows held in a byte range of a memory mapped file into columns, a chunk of lines at a time
+def parse_integer_csv_range(input_map: mmap.mmap, start: int, end: int, header: list, columns: tuple):
+    """
+    Each chunk of lines is checked to hold one value for each column on each line, then its values are parsed at once
+    (values separated by commas and new lines are read as one json list of integers) and added to the arrays of each
+    column. Only one chunk is copied out of the map at a time, so memory used beyond the arrays does not grow with the
+    size of the range.
+
+    :param input_map: memory mapped input file
+    :param start: byte offset of first line of range, the start of a line
+    :param end: byte offset range ends at (exclusive), the end of a line or of the file
+    :param header: column names of the file, in order of values on each line
+    :param columns: desired columns, ordering columns returned
+    :return: list of columns ordered as columns, each an array of 64 bit integers, or None if the range must be read
+    by the general parser (see read_integer_csv_columns)
+    """
+    if sorted(header) != sorted(columns):  # Other or repeated columns go to general parser
+        return None
+
+    column_count = len(columns)
+    line_values = b',' * (column_count - 1) + b'\n'
+    header_positions = {c: i for i, c in enumerate(header)}
+    column_positions = [header_positions[c] for c in columns]
+    column_arrays = [array('q') for _ in columns]
+    position = start
+    while position < end:
+        chunk_end = input_map.find(b'\n', min(position + read_chunk_bytes, end) - 1, end) + 1 or end
+        chunk = input_map[position:chunk_end]
+        position = chunk_end
+        if chunk.translate(None, integer_csv_bytes) or chunk[:1] in (b'\n', b'\r') or \
+                b'\n\n' in chunk or b'\n\r\n' in chunk:  # Other characters or blank lines (chunks start lines)
+            return None
+
+        # Each line must hold exactly one value for each column (one comma less than there are columns)
+        ends_with_new_line = chunk.endswith(b'\n')
+        line_structure = chunk.translate(None, non_structure_bytes) + (b'' if ends_with_new_line else b'\n')
+        line_count = line_structure.count(b'\n')
+        if line_structure != line_values * line_count:
+            return None
+
+        try:  # Json numbers are plain integers here (no quotes or letters), values such as 007 go to general parser
+            joined_values = chunk.replace(b'\n', b',')
+            values = json.loads(b'[' + (joined_values[:-1] if ends_with_new_line else joined_values) + b']')
+            if len(values) != line_count * column_count:
+                return None
+            for column_array, column_position in zip(column_arrays, column_positions):
+                column_array.extend(values[column_position::column_count])
+        except (ValueError, OverflowError):
+            return None
+
+    return column_arrays
+
+
+# Read integer columns of an input file straight from its bytes, without creating a string, list or dict for each row
+def read_integer_csv_columns(file_count: int, f: str):
+    """
+    The file is memory mapped and its rows are parsed a chunk at a time (see parse_integer_csv_range). Files this
+    cannot read exactly as the general parser would (see stream_typed_rows) are left to it: quoted values, columns
+    other than the desired columns, blank lines, or values which are not plain integers.
+
+    :param file_count: file count specifying which input file is being read (tests or marks)
+    :param f: path to input csv file, must have data in it
+    :return: list of columns ordered as input_columns[file_count], each an array of 64 bit integers, or None if the
+    file must be read by the general parser
+    """
+    with open(f, 'rb') as input_file, mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as input_map:
+        header_end = input_map.find(b'\n') + 1 or len(input_map)
+        try:
+            header = input_map[:header_end].rstrip(b'\r\n').decode().split(',')
+        except UnicodeDecodeError:
+            return None
+        return parse_integer_csv_range(input_map, header_end, len(input_map), header, input_columns[file_count])
+
+
+# Parse columns of an input file, integer files are read from bytes when they can be, otherwise rows are parsed
+def parse_typed_columns(file_count: int, f: str):
+    """
+    :param file_count: file count specifying which input file is being parsed (courses, students, tests, or marks)
+    :param f: path to input csv file
+    :return: list of columns of f (see pack_typed_rows), rows zipped from columns match stream_typed_rows
+    """
+    if integer_input_file(file_count) and input_file_compression(f) is None:  # Compressed files are read as streams
+        open_school_data_file(f).close()  # Missing and empty files produce the same errors as when parsing
+        integer_columns = read_integer_csv_columns(file_count, f)
+        if integer_columns is not None:
+            return integer_columns
+
+    return pack_typed_rows(file_count, list(stream_typed_rows(file_count, f)))
+
+
+# Parse typed rows of an input file, integer files are read from bytes when they can be, otherwise rows are parsed
+def parse_typed_rows(file_count: int, f: str):
+    """
+    :param file_count: file count specifying which input file is being parsed (courses, students, tests, or marks)
+    :param f: path to input csv file
+    :return: list of typed rows (tuples) of f, matching stream_typed_rows
+    """
+    if integer_input_file(file_count) and input_file_compression(f) is None:  # Compressed files are read as streams
+        open_school_data_file(f).close()  # Missing and empty files produce the same errors as when parsing
+        integer_columns = read_integer_csv_columns(file_count, f)
+        if integer_columns is not None:
+            return list(zip(*integer_columns))
+
+    return list(stream_typed_rows(file_count, f))
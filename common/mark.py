@@ -1,9 +1,12 @@
 # Global values for Test or test input data
 desired_columns_marks = ('test_id', 'student_id', 'mark')  # Referenced when parsing school data csv input
+column_types_marks = (int, int, int)  # Types of desired columns, rows are converted to tuples of these types
 
 
 # Class to hold data pertinent of a test as per the spec, can return dictionary version of itself
 class Mark:
+    __slots__ = ('test_id', 'student_id', 'mark')
+
     def __init__(self, test_id: int = None, student_id: int = None, mark: int = None):
         self.test_id = test_id
         self.student_id = student_id
@@ -0,0 +1,127 @@
+# General imports
+from array import array
+
+try:  # NumPy is an optional dependency, only the numpy engine makes use of it
+    import numpy as np
+except ImportError:
+    np = None
+
+# Local imports
+from common.handle_errors import handle_error
+
+# Global values for numpy aggregation engine
+numpy_engine_available = np is not None  # Checked before the numpy engine is selected
+
+
+# Find index of each id within an array of sorted unique ids, also returns whether each id was found
+def lookup_id_indices(sorted_ids, ids):
+    """
+    :param sorted_ids: numpy array of unique ids sorted in increasing order (e.g. all student ids)
+    :param ids: numpy array of ids to look up (e.g. student ids from each row of marks)
+    :return: tuple of numpy arrays, index of each id within sorted_ids and boolean array of whether each id was found
+    """
+    if len(sorted_ids) == 0:  # Nothing can be found, avoid indexing into an empty array
+        return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+
+    indices = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return indices, sorted_ids[indices] == ids
+
+
+# Turn typed columns of marks into integer arrays (student ids, test ids, and marks) without building a row tuple
+def marks_arrays_from_columns(marks_columns: list):
+    """
+    :param marks_columns: list of columns (test_id, student_id, mark) of marks, see parse_typed_columns in
+    common/integer_csv_reader.py. Columns of array('q') are viewed by numpy without copying
+    :return: tuple of numpy int64 arrays ordered as follows: student ids, test ids, and marks
+    """
+    test_ids, student_ids, marks = (np.frombuffer(c, dtype=np.int64) if isinstance(c, array)
+                                    else np.array(c, dtype=np.int64) for c in marks_columns)
+    return student_ids, test_ids, marks
+
+
+# Rebuild a row of marks from marks arrays, used to report the offending row in error messages
+def marks_row_as_dict(marks_arrays: tuple, row: int):
+    """
+    :param marks_arrays: tuple of arrays from marks_arrays_from_columns (student ids, test ids, and marks)
+    :param row: index of the row within marks
+    :return: dict with the row's values as strings, keyed by marks columns (as rows from csv.DictReader are)
+    """
+    student_ids, test_ids, marks = marks_arrays
+    return {'test_id': str(test_ids[row]), 'student_id': str(student_ids[row]), 'mark': str(marks[row])}
+
+
+# Compute course averages and total average of every student with grouped reductions over arrays of marks
+def compute_student_averages_numpy(student_data: dict, test_data: dict, marks_arrays: tuple):
+    """
+    Columnar counterpart to associate_student_marks, associate_student_courses and compute_student_averages in main.py.
+    Student and test ids from marks are mapped to dense indices, tests are mapped to their course and weight through
+    lookup arrays, and weighted marks are summed per (student, course) group in a single reduction. As with
+    associate_student_marks, a second mark for a student's test is an error.
+
+    :param student_data: Dictionary containing all students (as objects, keys are student ids)
+    :param test_data: Dictionary containing all tests (as objects, keys are test ids)
+    :param marks_arrays: tuple of arrays from marks_arrays_from_columns (student ids, test ids, and marks)
+    :return: None, serves to set course_averages and total_average for every student in student_data
+    """
+    marks_student_ids, marks_test_ids, marks = marks_arrays
+
+    # Dense indices for students and tests, with lookup arrays of course index and weight for each test index
+    student_ids = np.array(sorted(student_data), dtype=np.int64)
+    test_ids = np.array(sorted(test_data), dtype=np.int64)
+    test_course_ids = np.array([test_data[t].course_id for t in test_ids.tolist()], dtype=np.int64)
+    test_weights = np.array([test_data[t].weight for t in test_ids.tolist()], dtype=np.int64)
+    course_ids, test_course_indices = np.unique(test_course_ids, return_inverse=True)
+
+    # Map each mark to student and test indices, every row is checked at once and the error is for the first bad row in
+    # order of marks (as when rows are checked one at a time): unknown student, unknown test, or a (student, test) pair
+    # repeating a pair found in an earlier row
+    student_indices, student_found = lookup_id_indices(student_ids, marks_student_ids)
+    test_indices, test_found = lookup_id_indices(test_ids, marks_test_ids)
+    known_rows = np.flatnonzero(student_found & test_found)
+    _, pair_first_rows = np.unique(student_indices[known_rows] * len(test_ids) + test_indices[known_rows],
+                                   return_index=True)
+    good = np.zeros(len(marks), dtype=bool)
+    good[known_rows[pair_first_rows]] = True
+    if not good.all():
+        bad_row = int(np.argmin(good))
+        marks_row = marks_row_as_dict(marks_arrays, bad_row)
+        if not student_found[bad_row]:
+            handle_error(f'No such student with id {marks_student_ids[bad_row]} exists. Found in marks with row: '
+                         f'{marks_row}')
+        if not test_found[bad_row]:
+            handle_error(f'No such test with id {marks_test_ids[bad_row]} exists. Found in marks with row: {marks_row}')
+        handle_error(f'Duplicate mark found for test with id {marks_test_ids[bad_row]} and student with id '
+                     f'{marks_student_ids[bad_row]}. Found in marks with row: {marks_row}')
+
+    # Groups of marks for each (student, course), sorted by student then course
+    course_indices = test_course_indices[test_indices]
+    groups = np.unique(student_indices * len(course_ids) + course_indices)
+
+    # Sum mark * weight for each (student, course) group as whole numbers
+    mark_groups = np.searchsorted(groups, student_indices * len(course_ids) + course_indices)
+    # Float sums of whole numbers are exact below 2 ** 53, far above any sum of points
+    group_points = np.bincount(mark_groups, weights=marks * test_weights[test_indices], minlength=len(groups))
+    group_points = group_points.astype(np.int64)
+    group_students = groups // len(course_ids) if len(course_ids) else groups
+    group_courses = groups % len(course_ids) if len(course_ids) else groups
+    group_averages = group_points / 100  # Points are course averages in hundredths
+
+    # Total averages are means of course averages in hundredths rounded half up, see exact_total_average_hundredths
+    group_bounds = np.searchsorted(group_students, np.arange(len(student_ids) + 1))
+    student_course_counts = np.diff(group_bounds)
+    student_hundredths_sums = np.bincount(group_students, weights=group_points, minlength=len(student_ids))
+    student_hundredths_sums = student_hundredths_sums.astype(np.int64)
+    total_hundredths = (2 * student_hundredths_sums + student_course_counts) // np.maximum(2 * student_course_counts, 1)
+
+    # Copy results onto student objects
+    group_bounds = group_bounds.tolist()
+    group_course_ids = course_ids[group_courses].tolist()
+    group_averages = group_averages.tolist()
+    total_hundredths = total_hundredths.tolist()
+    for i, s_id in enumerate(student_ids.tolist()):
+        student = student_data[s_id]
+        start, end = group_bounds[i], group_bounds[i + 1]
+        student.course_averages = dict(zip(group_course_ids[start:end], group_averages[start:end]))
+        if start == end:  # A student without courses is an error, thrown by Student.compute_total_average
+            student.compute_total_average()
+        student.total_average = total_hundredths[i] / 100
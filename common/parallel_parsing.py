@@ -0,0 +1,160 @@
+# General imports
+import io
+import os
+import csv
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+
+# Local imports
+from common.handle_errors import AdminDataError
+from common.parse_school_csvs import open_school_data_file, read_typed_rows, input_file_compression, input_columns, \
+    marks_file_count
+from common.integer_csv_reader import parse_typed_rows, parse_typed_columns, parse_integer_csv_range, \
+    pack_typed_rows
+
+
+# Parse all typed rows of an input file, run in a process of the parsing pool for courses, students and tests
+def parse_typed_rows_list(file_count: int, f: str):
+    """
+    :param file_count: file count specifying which input file is being parsed (courses, students, tests, or marks)
+    :param f: path to input csv file
+    :return: list of typed rows (tuples) of f, see stream_typed_rows
+    """
+    return parse_typed_rows(file_count, f)
+
+
+# Read header of marks, finding the byte offset rows start at so the rest of the file can be split into byte ranges
+def read_marks_header(f: str):
+    """
+    :param f: path to marks csv file
+    :return: tuple ordered as follows: header (list of column names) and byte offset of the line after it. Header is
+    None if marks cannot be split into byte ranges (marks are compressed, or header is quoted or is missing desired
+    columns)
+    """
+    open_school_data_file(f).close()  # Missing and empty files produce the same errors as when parsing
+    if input_file_compression(f) is not None:  # Compressed marks are decompressed as a single stream
+        return None, 0
+    with open(f, 'rb') as marks_file:
+        for line in marks_file:
+            if b'"' in line:  # Quoted values may hold new lines, such files are parsed serially
+                return None, 0
+            header = next(csv.reader([line.decode()]), [])
+            if header:  # Blank lines before header are skipped, as in DictReader
+                if not set(input_columns[marks_file_count]).issubset(header):  # Error (if any) is left to serial parse
+                    return None, 0
+                return header, marks_file.tell()
+
+    return None, 0
+
+
+# Split marks into byte ranges of roughly equal size, each range starts at the beginning of a line
+def split_marks_byte_ranges(f: str, data_start: int, range_count: int):
+    """
+    :param f: path to marks csv file
+    :param data_start: byte offset of the first line after the header
+    :param range_count: number of ranges to split rows into (fewer are returned for small files)
+    :return: list of (start, end) byte offsets covering every row of f in order
+    """
+    file_size = os.path.getsize(f)
+    bounds = [data_start]
+    with open(f, 'rb') as marks_file:
+        for i in range(1, range_count):
+            marks_file.seek(max(data_start + (file_size - data_start) * i // range_count - 1, bounds[-1]))
+            marks_file.readline()  # Move to the start of the next line, a range never splits a line
+            if bounds[-1] < marks_file.tell() < file_size:
+                bounds.append(marks_file.tell())
+    bounds.append(file_size)
+
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+# Parse a byte range of marks into compact integer columns, run in a process of the parsing pool
+def parse_marks_byte_range(f: str, header: list, start: int, end: int = None, allow_quotes: bool = False):
+    """
+    :param f: path to marks csv file
+    :param header: column names of marks, rows are read against it as they are when parsing serially
+    :param start: byte offset of first line of range
+    :param end: byte offset range ends at (exclusive), None for the end of the file
+    :param allow_quotes: boolean to determine whether quoted values are parsed, only when no earlier range holds quotes
+    and the range runs to the end of the file (a quoted value holding new lines cannot cross into another range)
+    :return: list of columns (test_id, student_id, mark) as arrays of 64 bit integers (see pack_typed_rows), or None if
+    the range holds quoted values and marks must be parsed serially
+    """
+    with open(f, 'rb') as marks_file, mmap.mmap(marks_file.fileno(), 0, access=mmap.ACCESS_READ) as marks_map:
+        range_end = len(marks_map) if end is None else end
+        range_columns = parse_integer_csv_range(marks_map, start, range_end, header, input_columns[marks_file_count])
+        if range_columns is not None:  # Range of plain integers, read straight from mapped bytes
+            return range_columns
+        range_bytes = marks_map[start:range_end]
+    if b'"' in range_bytes and not allow_quotes:  # Quoted values may hold new lines, which can cross ranges
+        return None
+
+    # Rows are read as they are from marks opened in text mode (same encoding and handling of new lines)
+    range_lines = [','.join(header) + '\n']
+    range_lines.extend(io.TextIOWrapper(io.BytesIO(range_bytes), newline=None))
+    return pack_typed_rows(marks_file_count, list(read_typed_rows(marks_file_count, f, range_lines)))
+
+
+# Parse all of marks into compact integer columns, run in a process of the parsing pool for marks which cannot be split
+def parse_marks_columns(f: str):
+    """
+    :param f: path to marks csv file
+    :return: list of columns (test_id, student_id, mark) as arrays of 64 bit integers, see pack_typed_rows
+    """
+    return parse_typed_columns(marks_file_count, f)
+
+
+# Parse input files across a pool of processes, marks are split into byte ranges which are parsed at the same time
+def parse_school_data_files_parallel(input_files: list, parse_workers: int, marks_columns: bool = False):
+    """
+    Typed rows match those of parsing each file serially (see stream_typed_rows), and the first error found in order
+    of files (courses, students, tests, then marks) and of rows is the one raised. Marks holding quoted values are
+    parsed serially, as quoted values may hold new lines.
+
+    :param input_files: list with input csv files as strings ordered as follows: courses, students, tests, and marks
+    :param parse_workers: number of processes parsing input files
+    :param marks_columns: boolean to determine whether marks are returned as typed columns (test_id, student_id, mark)
+    joined from each range, rather than rows
+    :return: list with typed rows of inputs ordered as follows: courses, students, tests and marks (or its columns)
+    """
+    marks_file = input_files[marks_file_count]
+    with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+        catalog_parses = [executor.submit(parse_typed_rows_list, fc, f) for fc, f in enumerate(input_files[:-1])]
+
+        marks_error, range_parses = None, []
+        try:  # Errors of marks are raised once catalogs have been parsed, as catalogs are parsed before marks serially
+            header, data_start = read_marks_header(marks_file)
+            if header is not None:
+                range_parses = [executor.submit(parse_marks_byte_range, marks_file, header, start, end)
+                                for start, end in split_marks_byte_ranges(marks_file, data_start, parse_workers)]
+        except AdminDataError as error:
+            marks_error = error
+
+        input_files_rows = [p.result() for p in catalog_parses]
+        if marks_error is not None:
+            raise marks_error
+
+        ranges_columns = []
+        for p in range_parses:  # Errors of earlier ranges are raised first
+            range_columns = p.result()
+            if range_columns is None:  # Range holds quoted values, later ranges are not needed
+                header = None
+                break
+            ranges_columns.append(range_columns)
+
+    if header is None and marks_columns:  # Marks could not be split, so they are parsed serially
+        input_files_rows.append(parse_typed_columns(marks_file_count, marks_file))
+    elif header is None:
+        input_files_rows.append(parse_typed_rows_list(marks_file_count, marks_file))
+    elif marks_columns:  # Columns of each range are joined without building rows
+        joined_columns = pack_typed_rows(marks_file_count, [])
+        for range_columns in ranges_columns:
+            for i, range_column in enumerate(range_columns):
+                if isinstance(range_column, list) and not isinstance(joined_columns[i], list):  # Beyond 64 bits
+                    joined_columns[i] = list(joined_columns[i])
+                joined_columns[i].extend(range_column)
+        input_files_rows.append(joined_columns)
+    else:
+        input_files_rows.append([r for range_columns in ranges_columns for r in zip(*range_columns)])
+
+    return input_files_rows
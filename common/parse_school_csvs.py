@@ -1,13 +1,18 @@
 # General imports
+import io
 import os
 import csv
+import gzip
+import lzma
+import itertools
+from operator import itemgetter
 
 # Local imports
-from common.handle_errors import handle_error
-from common.course import desired_columns_courses
-from common.student import desired_columns_students
-from common.test import desired_columns_tests
-from common.mark import desired_columns_marks
+from common.handle_errors import AdminDataError, handle_error
+from common.course import desired_columns_courses, column_types_courses
+from common.student import desired_columns_students, column_types_students
+from common.test import desired_columns_tests, column_types_tests
+from common.mark import desired_columns_marks, column_types_marks
 
 # Global values related to parsing input csv data
 # Tuple with columns expected for each input file, used to error check columns in input
@@ -17,7 +22,22 @@ input_columns = (
     desired_columns_tests,      # Tests, file_count=2
     desired_columns_marks       # Marks, file_count=3
 )
+# Tuple with types of columns for each input file, typed rows are tuples of values ordered as the columns above
+input_column_types = (
+    column_types_courses,       # Courses, file_count=0
+    column_types_students,      # Students, file_count=1
+    column_types_tests,         # Tests, file_count=2
+    column_types_marks          # Marks, file_count=3
+)
+marks_file_count = 3  # Position of marks in input_columns, used when marks are streamed separately from other inputs
 bad_columns_msg = 'Columns in input file {0} are insufficient. It does not contain necessary column: {1}.'
+bad_value_msg = 'Values in input file {0} are invalid. Column {1} must be an integer. Found with row: {2}'
+short_row_msg = 'Row in input file {0} has fewer values than columns. Found with row: {1}'
+# Compressed input files are found by extension or by magic bytes at the start of the file, and read as a stream
+compressed_input_extensions = {'.gz': 'gzip', '.gzip': 'gzip', '.xz': 'xz'}
+compressed_input_magic = {b'\x1f\x8b': 'gzip', b'\xfd7zXZ\x00': 'xz'}
+compressed_input_openers = {'gzip': gzip.open, 'xz': lzma.open}
+decompression_errors = (OSError, EOFError, lzma.LZMAError)  # Raised by gzip and lzma for corrupt or truncated input
 
 
 # Validate input file row, column's which are cross checked determined by list of columns at input_columns[file_count]
@@ -37,6 +57,115 @@ def validate_input_rows(file_count: int, file_name: str, csv_row: dict, csv_file
             handle_error(bad_columns_msg.format(file_name, c))
 
 
+# Find compression of an input file from its extension, or from its first bytes when the extension is not known
+def input_file_compression(f: str):
+    """
+    :param f: path to input file
+    :return: name of compression (gzip or xz), or None for a file which is not compressed (or cannot be read)
+    """
+    compression = compressed_input_extensions.get(os.path.splitext(f)[1].lower())
+    if compression is None:
+        try:
+            with open(f, 'rb') as input_file:
+                first_bytes = input_file.read(max(len(m) for m in compressed_input_magic))
+        except OSError:
+            return None
+        compression = next((c for m, c in compressed_input_magic.items() if first_bytes.startswith(m)), None)
+
+    return compression
+
+
+# Text file of a compressed input file, decompressed as it is read. Corrupt data halts execution as an input error
+class CompressedInputFile(io.TextIOWrapper):
+    def __next__(self):
+        try:
+            return super().__next__()
+        except decompression_errors:
+            self.close()
+            handle_error(f'There was an error decompressing input file with path: {self.input_path}')
+
+
+# Open input file for reading, halts execution if the file cannot be found or has no data in it
+def open_school_data_file(f: str):
+    """
+    Compressed input files (gzip or xz, see input_file_compression) are decompressed as they are read, and must hold
+    data once decompressed.
+
+    :param f: path to input csv file
+    :return: opened file object for f, handle_error is called if the file is missing or empty
+    """
+    compression = input_file_compression(f)
+    if compression is not None:
+        return open_compressed_school_data_file(f, compression)
+
+    try:  # Try to open input file
+        csv_file = open(f, mode='r')
+    except FileNotFoundError:  # If file at f path is not found, throw error
+        handle_error(f'There was an error opening input file with path: {f}')
+
+    if os.stat(f).st_size == 0:  # Ensure that the provided file has data in it, else halt execution
+        csv_file.close()  # Close file as execution will stop
+        handle_error(f'Input file: {f}, has no data in it.')
+
+    return csv_file
+
+
+# Open compressed input file for reading as text, halts execution if it cannot be decompressed or has no data in it
+def open_compressed_school_data_file(f: str, compression: str):
+    """
+    :param f: path to compressed input csv file
+    :param compression: name of compression of f (gzip or xz)
+    :return: CompressedInputFile for f, reading lines as open(f, mode='r') would from the decompressed file
+    """
+    try:  # Try to open input file, reading its first decompressed bytes to check it has data in it
+        binary_file = compressed_input_openers[compression](f, 'rb')
+    except FileNotFoundError:  # If file at f path is not found, throw error
+        handle_error(f'There was an error opening input file with path: {f}')
+    try:
+        decompressed_empty = not binary_file.peek(1)
+    except decompression_errors:
+        binary_file.close()
+        handle_error(f'There was an error decompressing input file with path: {f}')
+
+    if decompressed_empty:  # Ensure that the decompressed file has data in it, else halt execution
+        binary_file.close()
+        handle_error(f'Input file: {f}, has no data in it.')
+
+    csv_file = CompressedInputFile(binary_file)
+    csv_file.input_path = f
+    return csv_file
+
+
+# Generator which yields validated rows from an input file one at a time, rows are never held together in memory
+def stream_school_data_rows(file_count: int, f: str):
+    """
+    :param file_count: file count specifying which input file is being parsed (courses, students, tests, or marks)
+    :param f: path to input csv file
+    :return: generator yielding each row of f as a validated dict with stripped values
+    """
+    csv_file = open_school_data_file(f)
+    with csv_file:
+        yield from read_school_data_rows(file_count, f, csv_file)
+
+
+# Generator which yields validated rows from an already opened input file (e.g. a file or marks uploaded to a service)
+def read_school_data_rows(file_count: int, file_name: str, csv_file):
+    """
+    :param file_count: file count specifying which input file is being parsed (courses, students, tests, or marks)
+    :param file_name: name of input csv file, used in error messages
+    :param csv_file: file object (or other iterable of csv lines) holding input data
+    :return: generator yielding each row of csv_file as a validated dict with stripped values
+    """
+    for r in csv.DictReader(csv_file):
+        # Validate rows for input file
+        validate_input_rows(file_count, file_name, r, csv_file)
+        # Strip extra spaces from beginning and end of row entries (e.g. " Mrs. P  " -> "Mrs. P")
+        for k in r:
+            r[k] = r[k].strip()
+
+        yield r
+
+
 # Parse Input Files
 def generate_school_data_row_lists(input_files: list[str]):
     """
@@ -46,33 +175,168 @@ def generate_school_data_row_lists(input_files: list[str]):
 
     # print('Generating lists of rows for school data files corresponding to: courses, students, tests, and marks')
     input_files_rows = []  # Serves to hold parsed rows from input files provided (ordered synonymous with input_files)
-    file_count = 0  # Serves as a pointer to what file in input_files is being parsed
-    for f in input_files:
-        try:  # Try to read input file
-            csv_file = open(f, mode='r')
+    for file_count, f in enumerate(input_files):  # file_count serves as a pointer to what file is being parsed
+        # Add valid, parsed rows from input file f to input_files_rows
+        input_files_rows.append(list(stream_school_data_rows(file_count, f)))
 
-            if os.stat(f).st_size == 0:  # Ensure that the provided file has data in it, else halt execution
-                csv_file.close()  # Close file as execution will stop
-                handle_error(f'Input file: {f}, has no data in it.')
+    return input_files_rows
 
-            csv_as_rows = list(csv.DictReader(csv_file))  # Retrieve data from csv as list with rows as dicts
 
-            for r in csv_as_rows:
-                # Validate rows for input file (uses first row as sample)
-                validate_input_rows(file_count, f, r, csv_file)
-                # Strip extra spaces from beginning and end of row entries (e.g. " Mrs. P  " -> "Mrs. P")
-                for k in r:
-                    r[k] = r[k].strip()
+# Convert a validated row of an input file to a typed row (tuple of values converted per input_column_types)
+def convert_typed_row(file_count: int, file_name: str, csv_row: dict):
+    """
+    :param file_count: file count specifying which input file the row is from
+    :param file_name: name of input csv file which provides csv_row
+    :param csv_row: validated row (values stripped) from input csv
+    :return: tuple of row values ordered as input_columns[file_count], throws error if a value cannot be converted
+    """
+    try:
+        return tuple(t(csv_row[c]) for c, t in zip(input_columns[file_count], input_column_types[file_count]))
+    except ValueError:  # Find which column could not be converted for the error message
+        for c, t in zip(input_columns[file_count], input_column_types[file_count]):
+            try:
+                t(csv_row[c])
+            except ValueError:
+                handle_error(bad_value_msg.format(file_name, c, csv_row))
 
-            # Add valid, parsed rows from input file f to input_files_rows
-            input_files_rows.append(csv_as_rows)
 
-            # Close file after reading is finished
+# Generator which yields typed rows from an input file one at a time (see read_typed_rows)
+def stream_typed_rows(file_count: int, f: str):
+    """
+    :param file_count: file count specifying which input file is being parsed (courses, students, tests, or marks)
+    :param f: path to input csv file
+    :return: generator yielding each row of f as a tuple of typed values
+    """
+    csv_file = open_school_data_file(f)
+    with csv_file:
+        yield from read_typed_rows(file_count, f, csv_file)
+
+
+# Validate header of an input file once, finding position of each desired column within rows of the file
+def validate_input_header(file_count: int, file_name: str, header: list, csv_file):
+    """
+    :param file_count: file count specifying which input file's header is being validated
+    :param file_name: name of input csv file which provides header
+    :param header: column names from first line of input csv
+    :param csv_file: File where the header is from, kept in reference to close it upon error
+    :return: tuple of positions of input_columns[file_count] in header, throws error if a column is missing
+    """
+    header_positions = {c: i for i, c in enumerate(header)}  # Later columns win for repeated names, as in DictReader
+    for c in input_columns[file_count]:
+        if c not in header_positions:  # Desired column name not found in header, input csv file has invalid rows
             csv_file.close()
+            handle_error(bad_columns_msg.format(file_name, c))
 
-        except FileNotFoundError:  # If file at f path is not found, throw error
-            handle_error(f'There was an error opening input file with path: {f}')
+    return tuple(header_positions[c] for c in input_columns[file_count])
 
-        file_count += 1  # Shift file pointer forward
 
-    return input_files_rows
+# Build a function converting a csv row (list of strings) to a typed row in one step, see read_typed_rows
+def typed_row_converter(file_count: int, column_positions: tuple):
+    """
+    :param file_count: file count specifying which input file rows are converted for
+    :param column_positions: positions of desired columns within rows, see validate_input_header
+    :return: function taking a csv row and returning a tuple of typed values, raises ValueError or IndexError if a
+    value cannot be converted or is missing
+    """
+    desired_values = itemgetter(*column_positions)
+    column_types = input_column_types[file_count]
+    if all(t is int for t in column_types):  # int() ignores surrounding spaces, so values need no stripping
+        return lambda row: tuple(map(int, desired_values(row)))
+
+    return lambda row: tuple(int(v) if t is int else v.strip() for v, t in zip(desired_values(row), column_types))
+
+
+# Generator which yields typed rows from an already opened input file, validating header once and converting each row
+# in a single pass (values of desired columns are stripped or converted to integers, other columns are skipped)
+def read_typed_rows(file_count: int, file_name: str, csv_file):
+    """
+    :param file_count: file count specifying which input file is being parsed (courses, students, tests, or marks)
+    :param file_name: name of input csv file, used in error messages
+    :param csv_file: file object (or other iterable of csv lines) holding input data
+    :return: generator yielding each row of csv_file as a tuple of typed values
+    """
+    csv_rows = filter(None, csv.reader(csv_file))  # Blank lines are skipped, as in DictReader
+    header = next(csv_rows, None)
+    first_row = next(csv_rows, None)
+    if first_row is None:  # Files with a header and no rows have nothing to validate
+        return
+
+    # Header is validated once rows are found, a header alone is not validated (as when rows were validated one by one)
+    convert_row = typed_row_converter(file_count, validate_input_header(file_count, file_name, header, csv_file))
+    row = first_row
+    try:
+        yield convert_row(row)
+        for row in csv_rows:
+            yield convert_row(row)
+    except (ValueError, IndexError):  # Find which value could not be converted for the error message
+        report_bad_typed_row(file_count, file_name, header, row)
+
+
+# Raise error for a csv row which could not be converted to a typed row, row is shown as DictReader would read it
+def report_bad_typed_row(file_count: int, file_name: str, header: list, row: list):
+    """
+    :param file_count: file count specifying which input file the row is from
+    :param file_name: name of input csv file which provides row
+    :param header: column names from first line of input csv
+    :param row: csv row which could not be converted
+    :return: None, throws error and halts execution
+    """
+    if len(row) < len(header):
+        handle_error(short_row_msg.format(file_name, dict(zip(header, row))))
+
+    convert_typed_row(file_count, file_name, {c: v.strip() for c, v in zip(header, row)})
+
+
+# Generator which yields typed rows of an input file which are valid, recording errors of other rows rather than halting
+def validate_typed_rows(file_count: int, f: str, validation_report):
+    """
+    Counterpart to stream_typed_rows used when validating input (see common/validation.py). Each error is recorded
+    with the same message a run would halt with, so every bad row of a file is found in one pass.
+
+    :param file_count: file count specifying which input file is being validated (courses, students, tests, or marks)
+    :param f: path to input csv file
+    :param validation_report: ValidationReport errors are recorded in, rows stop being read once its limit is reached
+    :return: generator yielding tuples ordered as follows: line number and typed row, for each valid row of f
+    """
+    if validation_report.limit_reached:  # Files are not read once the limit of errors has been reached
+        return
+    try:
+        csv_file = open_school_data_file(f)
+    except AdminDataError as file_error:
+        validation_report.add_error(f, None, file_error.error_message)
+        return
+
+    with csv_file:
+        csv_reader = csv.reader(csv_file)
+        csv_rows = filter(None, csv_reader)  # Blank lines are skipped, as in DictReader
+        header = next(csv_rows, None)
+        first_row = next(csv_rows, None)
+        if first_row is None:  # Files with a header and no rows have nothing to validate
+            return
+
+        try:
+            convert_row = typed_row_converter(file_count, validate_input_header(file_count, f, header, csv_file))
+        except AdminDataError as header_error:  # Rows cannot be read without desired columns
+            validation_report.add_error(f, 1, header_error.error_message)
+            return
+
+        for row in itertools.chain((first_row,), csv_rows):
+            try:
+                yield csv_reader.line_num, convert_row(row)
+            except (ValueError, IndexError):
+                try:
+                    report_bad_typed_row(file_count, f, header, row)
+                except AdminDataError as row_error:
+                    validation_report.add_error(f, csv_reader.line_num, row_error.error_message)
+            if validation_report.limit_reached:
+                return
+
+
+# Turn a typed row back into a dictionary of strings, as rows are found in input (used for error messages)
+def typed_row_as_dict(columns: tuple, typed_row: tuple):
+    """
+    :param columns: desired columns of the input file the row is from (e.g. desired_columns_courses)
+    :param typed_row: tuple of typed values ordered as columns
+    :return: dict with keys as columns and values as strings
+    """
+    return {c: str(v) for c, v in zip(columns, typed_row)}
@@ -0,0 +1,35 @@
+# Class to map ids of courses and tests to dense indices (0 to N - 1), with flat lists of what each index joins to
+# Joins made for every mark (test to course and weight) are then list indexing rather than dict lookups of objects
+class SchoolIds:
+    __slots__ = ('course_ids', 'courses', 'course_indices', 'course_test_indices', 'test_indices', 'tests',
+                 'test_course_indices', 'test_course_positions', 'test_weights')
+
+    def __init__(self, course_data: dict, test_data: dict):
+        """
+        Courses and tests are indexed in the order they were found in input files. A test of a course which does not
+        exist is given an index for its course id with no course (None in courses), so marks of the test can still be
+        associated and the missing course is reported once weights are checked (see check_course_test_weights).
+
+        :param course_data: Dictionary containing all courses (as objects, keys are course ids)
+        :param test_data: Dictionary containing all tests (as objects, keys are test ids)
+        """
+        self.course_ids = list(course_data)  # Course id of each course index
+        self.courses = list(course_data.values())  # Course object of each course index, None for missing courses
+        self.course_indices = course_indices = {c: i for i, c in enumerate(self.course_ids)}  # Keys are course ids
+        self.course_test_indices = [[] for _ in self.course_ids]  # Test indices of each course index, in order found
+
+        self.test_indices = {t: i for i, t in enumerate(test_data)}  # Keys are test ids, values are test indices
+        self.tests = list(test_data.values())  # Test object of each test index
+        self.test_course_indices = []  # Course index of each test index
+        self.test_course_positions = []  # Position of each test index among tests of its course
+        self.test_weights = [test.weight for test in self.tests]  # Weight of each test index
+        for test_index, test in enumerate(self.tests):
+            course_index = course_indices.get(test.course_id)
+            if course_index is None:
+                course_index = course_indices[test.course_id] = len(self.course_ids)
+                self.course_ids.append(test.course_id)
+                self.courses.append(None)
+                self.course_test_indices.append([])
+            self.test_course_indices.append(course_index)
+            self.test_course_positions.append(len(self.course_test_indices[course_index]))
+            self.course_test_indices[course_index].append(test_index)
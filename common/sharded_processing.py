@@ -0,0 +1,116 @@
+# General imports
+from concurrent.futures import ProcessPoolExecutor
+
+# Local imports
+from common.handle_errors import AdminDataError
+from common.student import Student
+from common.school_ids import SchoolIds
+from common.parallel_parsing import read_marks_header, split_marks_byte_ranges, parse_marks_byte_range
+
+
+# Parse, check and sum a byte range of marks into points for each student and course, run within a worker process
+def accumulate_marks_byte_range(marks_file: str, header: list, start: int, end: int, school_ids: SchoolIds):
+    """
+    Rows are checked as in accumulate_student_course_points (main.py), but a bad row is not reported here: the range
+    is given up on and marks are summed serially, so the first bad row in marks is the one reported. Students are not
+    known to workers, so ids of students are checked once sums are merged (see merge_range_course_points).
+
+    :param marks_file: path to marks csv file
+    :param header: column names of marks, see read_marks_header
+    :param start: byte offset of first line of range
+    :param end: byte offset range ends at (exclusive)
+    :param school_ids: SchoolIds of courses and tests, marks are joined to courses and weights by test index
+    :return: tuple ordered as follows: number of rows in range and list of (student id, course points, course tests)
+    of each student in range (see Student.add_course_points and Student.add_course_test), None if range holds a bad
+    row or quoted values
+    """
+    try:
+        range_columns = parse_marks_byte_range(marks_file, header, start, end)
+    except AdminDataError:  # Value which is not an integer, reported once marks are parsed serially
+        return None
+    if range_columns is None:  # Quoted values, marks are parsed serially
+        return None
+
+    test_indices, course_ids, test_course_indices, test_course_positions, test_weights = \
+        school_ids.test_indices, school_ids.course_ids, school_ids.test_course_indices, \
+        school_ids.test_course_positions, school_ids.test_weights
+    students = {}
+    for test_id, student_id, mark in zip(*range_columns):
+        test_index = test_indices.get(test_id)
+        if test_index is None:  # No such test
+            return None
+        try:
+            student = students[student_id]
+        except KeyError:
+            student = students[student_id] = Student(student_id)
+
+        course_id = course_ids[test_course_indices[test_index]]
+        if not student.add_course_test(course_id, test_course_positions[test_index]):  # Duplicate mark
+            return None
+        student.add_course_points(course_id, mark * test_weights[test_index])
+
+    return len(range_columns[0]), [(s.id, s.course_points, s.course_tests) for s in students.values()]
+
+
+# Merge sums of points of a range of marks onto students, tests marked in an earlier range are duplicate marks
+def merge_range_course_points(student_data: dict, range_students: list):
+    """
+    :param student_data: Dictionary containing all students (as objects, keys are student ids)
+    :param range_students: list of (student id, course points, course tests) from accumulate_marks_byte_range
+    :return: False if a student does not exist or a test is marked in more than one range, True otherwise
+    """
+    for student_id, course_points, course_tests in range_students:
+        student = student_data.get(student_id)
+        if student is None:  # No such student
+            return False
+        if student.course_tests is None:  # First range holding marks of the student, its sums are taken as they are
+            student.course_points, student.course_tests = course_points, course_tests
+            continue
+
+        student_course_tests = student.course_tests
+        for course_id, tests in course_tests.items():
+            marked_tests = student_course_tests.get(course_id, 0)
+            if marked_tests & tests:  # Duplicate mark
+                return False
+            student_course_tests[course_id] = marked_tests | tests
+            student.add_course_points(course_id, course_points[course_id])
+
+    return True
+
+
+# Sum marks into points for each student and course with a pool of processes, each parsing a byte range of marks
+def accumulate_sharded_course_points(student_data: dict, school_ids: SchoolIds, marks_file: str, workers: int):
+    """
+    Marks are split into byte ranges (see split_marks_byte_ranges) which are parsed, checked and summed by the process
+    they are sent to, only sums of points of each student are sent back and merged. Marks which cannot be split
+    (compressed, or holding quoted values) or which hold a bad row are left to accumulate_student_course_points, so
+    errors are the same as when marks are summed serially.
+
+    :param student_data: Dictionary containing all students (as objects, keys are student ids)
+    :param school_ids: SchoolIds of courses and tests, sent to each process with its range
+    :param marks_file: path to marks csv file
+    :param workers: number of processes in pool, marks are split into as many ranges
+    :return: number of rows in marks, None if marks must be summed serially (students are left without sums)
+    """
+    header, data_start = read_marks_header(marks_file)
+    if header is None:  # Compressed or quoted marks are parsed as a single stream
+        return None
+
+    row_count = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        range_sums = [pool.submit(accumulate_marks_byte_range, marks_file, header, start, end, school_ids)
+                      for start, end in split_marks_byte_ranges(marks_file, data_start, workers)]
+        for p in range_sums:  # Ranges are merged in order of marks as they finish
+            range_result = p.result()
+            if range_result is None or not merge_range_course_points(student_data, range_result[1]):
+                for f in range_sums:
+                    f.cancel()
+                row_count = None
+                break
+            row_count += range_result[0]
+
+    if row_count is None:  # Sums merged so far are dropped, marks are summed again serially
+        for student in student_data.values():
+            student.course_points = student.course_tests = None
+
+    return row_count
@@ -0,0 +1,203 @@
+# General imports
+import os
+import sqlite3
+
+# Local imports
+from common.handle_errors import handle_error
+from common.parse_school_csvs import typed_row_as_dict
+from common.mark import desired_columns_marks
+
+# Global values for the sqlite engine
+school_database_version = 2  # Stored as user_version of database, databases of other versions are emptied and rebuilt
+school_database_tables = ('courses', 'students', 'tests', 'marks', 'input_files')
+# Ids are primary keys (and so rowids), row_number of each table keeps rows in the order they were found in input files
+school_database_schema = '''
+CREATE TABLE IF NOT EXISTS courses (id INTEGER PRIMARY KEY, row_number INTEGER NOT NULL, name TEXT NOT NULL,
+                                    teacher TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS students (id INTEGER PRIMARY KEY, row_number INTEGER NOT NULL, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS tests (id INTEGER PRIMARY KEY, row_number INTEGER NOT NULL, course_id INTEGER NOT NULL,
+                                  weight INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS marks (row_number INTEGER PRIMARY KEY, test_id INTEGER NOT NULL,
+                                  student_id INTEGER NOT NULL, mark INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS input_files (file_count INTEGER PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL,
+                                        mtime_ns INTEGER NOT NULL);
+'''
+school_database_indexes = {  # Index names and columns indexed, ids of marks and tests are joined and grouped on
+    'marks_student_test': 'marks (student_id, test_id)',
+    'marks_test': 'marks (test_id)',
+    'tests_course': 'tests (course_id)'
+}
+# Sums of weighted points for each student and course, marks are checked for duplicates first (see
+# check_school_database_marks)
+student_course_points_query = '''
+SELECT m.student_id, t.course_id, SUM(m.mark * t.weight) AS points
+FROM marks m JOIN tests t ON t.id = m.test_id {student_filter}
+GROUP BY m.student_id, t.course_id
+'''
+# First row of marks (in order of file) for a student or test which does not exist
+unknown_marks_query = '''
+SELECT m.row_number, m.test_id, m.student_id, m.mark, s.id IS NULL AS unknown_student
+FROM marks m LEFT JOIN students s ON s.id = m.student_id LEFT JOIN tests t ON t.id = m.test_id
+WHERE s.id IS NULL OR t.id IS NULL ORDER BY m.row_number LIMIT 1
+'''
+# First row of marks (in order of file) for a test a student already has a mark for in an earlier row
+duplicate_marks_query = '''
+SELECT m.row_number, m.test_id, m.student_id, m.mark
+FROM marks m WHERE EXISTS (
+    SELECT 1 FROM marks e WHERE e.student_id = m.student_id AND e.test_id = m.test_id AND e.row_number < m.row_number
+) ORDER BY m.row_number LIMIT 1
+'''
+
+
+# Open school database, creating its tables if they do not exist yet
+def connect_school_database(database_file: str):
+    """
+    A database written by another version of the schema is emptied, so it is loaded from input files again.
+
+    :param database_file: path to sqlite database file (created if missing), or :memory: for a database of this run only
+    :return: sqlite3 connection to database
+    """
+    try:
+        connection = sqlite3.connect(database_file)
+        if connection.execute('PRAGMA user_version').fetchone()[0] != school_database_version:
+            with connection:
+                for table in school_database_tables:
+                    connection.execute(f'DROP TABLE IF EXISTS {table}')
+                connection.execute(f'PRAGMA user_version = {school_database_version}')
+        connection.executescript(school_database_schema)
+    except sqlite3.Error:
+        handle_error(f'There was an error opening database with path: {database_file}')
+
+    return connection
+
+
+# Size and modified time of each input file, database is loaded again once any of these change
+def input_file_fingerprints(input_files: list):
+    """
+    :param input_files: list with input csv files as strings ordered as follows: courses, students, tests, and marks
+    :return: list of (file count, absolute path, size, modified time (ns)) tuples, None for files which do not exist
+    """
+    fingerprints = []
+    for file_count, f in enumerate(input_files):
+        try:
+            file_stat = os.stat(f)
+        except OSError:
+            return None
+        fingerprints.append((file_count, os.path.abspath(f), file_stat.st_size, file_stat.st_mtime_ns))
+
+    return fingerprints
+
+
+# Whether database holds input files as they are now, in which case they need not be parsed again
+def school_database_current(connection, input_fingerprints: list):
+    """
+    :param connection: sqlite3 connection to school database
+    :param input_fingerprints: fingerprints of input files, see input_file_fingerprints
+    :return: True if database was loaded from input files with these fingerprints
+    """
+    loaded_fingerprints = connection.execute('SELECT file_count, path, size, mtime_ns FROM input_files '
+                                             'ORDER BY file_count').fetchall()
+    return input_fingerprints is not None and loaded_fingerprints == input_fingerprints
+
+
+# Paths of input files database was loaded from, ordered as follows: courses, students, tests, and marks
+def read_loaded_input_files(connection):
+    """
+    :param connection: sqlite3 connection to school database
+    :return: list of absolute paths to input files, empty if database has not been loaded
+    """
+    return [path for path, in connection.execute('SELECT path FROM input_files ORDER BY file_count')]
+
+
+# Replace contents of database with typed rows of input files, marks may be a generator read one row at a time
+def load_school_database(connection, input_fingerprints: list, courses_rows: list, students_rows: list,
+                         tests_rows: list, marks_rows):
+    """
+    :param connection: sqlite3 connection to school database
+    :param input_fingerprints: fingerprints of input files taken before they were parsed, see input_file_fingerprints
+    :param courses_rows: typed rows of courses, ids already checked for duplicates
+    :param students_rows: typed rows of students, ids already checked for duplicates
+    :param tests_rows: typed rows of tests, ids already checked for duplicates
+    :param marks_rows: iterable of typed rows (test_id, student_id, mark) of marks, kept in order of file
+    :return: None, serves to load rows into database in a single transaction
+    """
+    with connection:  # Commits once every row is loaded, an error while loading leaves the earlier contents
+        for index_name in school_database_indexes:  # Indexes are built once rows are loaded rather than row by row
+            connection.execute(f'DROP INDEX IF EXISTS {index_name}')
+        for table in school_database_tables:
+            connection.execute(f'DELETE FROM {table}')
+        connection.executemany('INSERT INTO courses (row_number, id, name, teacher) VALUES (?, ?, ?, ?)',
+                               ((row_number, *r) for row_number, r in enumerate(courses_rows)))
+        connection.executemany('INSERT INTO students (row_number, id, name) VALUES (?, ?, ?)',
+                               ((row_number, *r) for row_number, r in enumerate(students_rows)))
+        connection.executemany('INSERT INTO tests (row_number, id, course_id, weight) VALUES (?, ?, ?, ?)',
+                               ((row_number, *r) for row_number, r in enumerate(tests_rows)))
+        connection.executemany('INSERT INTO marks (test_id, student_id, mark) VALUES (?, ?, ?)', marks_rows)
+        for index_name, index_columns in school_database_indexes.items():
+            connection.execute(f'CREATE INDEX {index_name} ON {index_columns}')
+        connection.executemany('INSERT INTO input_files (file_count, path, size, mtime_ns) VALUES (?, ?, ?, ?)',
+                               input_fingerprints)
+
+
+# Read typed row of a single student from database
+def read_student_row(connection, student_id: int):
+    """
+    :param connection: sqlite3 connection to school database
+    :param student_id: id of student to read
+    :return: typed row (id, name) of student, or None if there is no such student
+    """
+    return connection.execute('SELECT id, name FROM students WHERE id = ?', (student_id,)).fetchone()
+
+
+# Read typed rows of courses, students and tests from database, in the order they were found in input files
+def read_catalog_rows(connection):
+    """
+    :param connection: sqlite3 connection to school database
+    :return: tuple of typed rows ordered as follows: courses, students and tests
+    """
+    return (connection.execute('SELECT id, name, teacher FROM courses ORDER BY row_number').fetchall(),
+            connection.execute('SELECT id, name FROM students ORDER BY row_number').fetchall(),
+            connection.execute('SELECT id, course_id, weight FROM tests ORDER BY row_number').fetchall())
+
+
+# Validate every mark belongs to an existing student and test, once only, error is for the first bad row of marks
+def check_school_database_marks(connection):
+    """
+    :param connection: sqlite3 connection to school database
+    :return: None, throws error and halts execution if a mark has no such student or test, or is a duplicate
+    """
+    unknown_mark = connection.execute(unknown_marks_query).fetchone()
+    duplicate_mark = connection.execute(duplicate_marks_query).fetchone()
+    if duplicate_mark is not None and (unknown_mark is None or duplicate_mark[0] < unknown_mark[0]):
+        _, test_id, student_id, mark = duplicate_mark
+        marks_row = typed_row_as_dict(desired_columns_marks, (test_id, student_id, mark))
+        handle_error(f'Duplicate mark found for test with id {test_id} and student with id {student_id}. Found in '
+                     f'marks with row: {marks_row}')
+    if unknown_mark is not None:
+        _, test_id, student_id, mark, unknown_student = unknown_mark
+        marks_row = typed_row_as_dict(desired_columns_marks, (test_id, student_id, mark))
+        if unknown_student:
+            handle_error(f'No such student with id {student_id} exists. Found in marks with row: {marks_row}')
+        handle_error(f'No such test with id {test_id} exists. Found in marks with row: {marks_row}')
+
+
+# Set sums of weighted points of each student's courses from a grouped query, averages are then computed from sums
+def compute_student_course_points_sqlite(connection, student_data: dict, student_id: int = None):
+    """
+    Course averages computed from sums (see Student.compute_course_averages_from_points) equal those computed test by
+    test, as sums of mark * weight are whole numbers. Totals do not depend on the order courses are set in, see
+    exact_total_average_hundredths in common/student.py.
+
+    :param connection: sqlite3 connection to school database
+    :param student_data: Dictionary containing students (as objects, keys are student ids)
+    :param student_id: id of a single student to set sums for, None for every student
+    :return: None, serves to set course_points of each student found in marks
+    """
+    if student_id is None:
+        query_rows = connection.execute(student_course_points_query.format(student_filter=''))
+    else:
+        query_rows = connection.execute(student_course_points_query.format(student_filter='WHERE m.student_id = ?'),
+                                        (student_id,))
+
+    for s_id, course_id, points in query_rows:
+        student_data[s_id].add_course_points(course_id, points)
@@ -1,16 +1,54 @@
+# Local imports
+from common.handle_errors import handle_error
+
 # Public values related to Student or student input data
 desired_columns_students = ('id', 'name')  # Referenced when parsing school data csv input
+column_types_students = (int, str)  # Types of desired columns, rows are converted to tuples of these types
+
+
+# Error message for a student without marks, who has no courses to average (same message when running and validating)
+def student_without_marks_message(student_id: int):
+    return f'Student with id {student_id} has no marks, so no total average can be computed.'
+
+
+# Total average in hundredths from the sum of a student's course averages in hundredths, computed with whole numbers
+def exact_total_average_hundredths(course_hundredths_sum: int, courses_taken: int):
+    """
+    Every engine and mode rounds totals with this rule: the mean is rounded to the nearest hundredth, and a mean exactly
+    half way between two hundredths is rounded up. The total does not depend on the order courses are added in.
+
+    :param course_hundredths_sum: sum of course averages of a student, in hundredths (course average * 100)
+    :param courses_taken: number of courses of student, at least 1 (see Student.compute_total_average)
+    :return: total average in hundredths, rounded half up to a whole number
+    """
+    return (2 * course_hundredths_sum + courses_taken) // (2 * courses_taken)
 
 
 # Class to hold data pertinent to a student as per the spec, can return dictionary version of itself
+# Slots keep students free of a per object __dict__, there can be millions of students in an input
 class Student:
+    __slots__ = ('id', 'name', 'total_average', 'courses', 'course_averages', 'marks', '_course_points', 'course_tests')
+
     def __init__(self, student_id: int = None, name: str = None):
         self.id = student_id
         self.name = name
         self.total_average = 0.0  # To be computed from all weighted average of each course average
         self.courses = {}  # Filled out after init, will hold a students set of courses and test scores for the course
         self.course_averages = {}  # Filled out after init, will hold keys as course_ids and values as course averages
-        self.marks = {}  # Filled out after init, keys are test_id and values are marks on said test for this student
+        self.marks = {}  # Filled out after init, keys are test indices (see SchoolIds) and values are marks on tests
+        self._course_points = None  # Streaming mode only, created on first use (see course_points property)
+        self.course_tests = None  # Modes summing points only, created on first use (see add_course_test)
+
+    # Course points dict of student (keys are course_ids, values are running sums of mark*weight), created on use
+    @property
+    def course_points(self):
+        if self._course_points is None:
+            self._course_points = {}
+        return self._course_points
+
+    @course_points.setter
+    def course_points(self, course_points: dict):
+        self._course_points = course_points
 
     # # Turn student into a dictionary object
     def student_as_dict(self):
@@ -18,23 +56,57 @@ class Student:
 
     # Generate course average for a student given courses with tests and marks for a student
     def compute_course_averages(self):
-        total_points = 0
         for c in self.courses:
-            course_tests = self.courses[c]
-            tests_taken = len(course_tests)
-            course_average = 0.0  # Will hold value determined by the mark they get in each test and test's weight
-            for test in course_tests:  # Iterate through tests and scores for student in course c, find course average
-                # test contains: (test_id (int), student marks on test (int), test weight (int))
-                course_average += test[1] * test[2]/100  # Add student_marks multiplied by (test_weight / 100) to avg
+            course_points = 0  # Sum of mark * test weight (whole numbers), divided and rounded once for the course
+            for test in self.courses[c]:  # Iterate through tests and scores for student in course c
+                # test contains: (test index (int), student marks on test (int), test weight (int))
+                course_points += test[1] * test[2]
+
+            # Test weights for a course add up to 100, course average is rounded to 2 decimals
+            self.course_averages[c] = round(course_points / 100, 2)
+
+    # Add weighted points (mark * test weight) to the running sum kept for a course, used when streaming marks
+    def add_course_points(self, course_id: int, points: int):
+        course_points = self._course_points
+        if course_points is None:
+            course_points = self._course_points = {}
+        course_points[course_id] = course_points.get(course_id, 0) + points
 
-            self.course_averages[c] = round(course_average, 2)  # Store course average for course, rounded to 2 decimals
+    # Record a test the student has a mark for next to the running sum of its course, a test can only be marked once
+    def add_course_test(self, course_id: int, test_position: int):
+        """
+        Tests are kept for each course as bits of a whole number (keys of course_tests are course ids, bit i is set once
+        the i-th test of the course is marked), so memory used grows with the courses of a student and the tests of
+        those courses only.
+
+        :param course_id: id of course of test
+        :param test_position: position of test among tests of its course, see SchoolIds.test_course_positions
+        :return: False if student already has a mark for the test (a duplicate mark), True otherwise
+        """
+        course_tests = self.course_tests
+        if course_tests is None:
+            course_tests = self.course_tests = {}
+        taken = course_tests.get(course_id, 0)
+        test_bit = 1 << test_position
+        if taken & test_bit:
+            return False
+        course_tests[course_id] = taken | test_bit
+        return True
+
+    # Generate course averages for a student from running sums of weighted points (see add_course_points)
+    def compute_course_averages_from_points(self):
+        for c in self.course_points:
+            # Points are sums of mark * test weight, test weights for a course add up to 100
+            self.course_averages[c] = round(self.course_points[c] / 100, 2)
 
     # Generate total average for a student given courses with a course average for the student
     def compute_total_average(self):
-        courses_taken = 0
-        total_marks = 0
-        for course_id in self.course_averages:
-            total_marks += self.course_averages[course_id]
-            courses_taken += 1
-
-        self.total_average = round(total_marks / courses_taken, 2)
+        """
+        Course averages are sums of mark * test weight divided by 100, so each is a whole number of hundredths and
+        nothing is rounded before the mean. The mean is rounded once, see exact_total_average_hundredths.
+        """
+        courses_taken = len(self.course_averages)
+        if not courses_taken:  # Student has no marks, throw an error rather than divide by zero
+            handle_error(student_without_marks_message(self.id))
+        course_hundredths_sum = sum(round(a * 100) for a in self.course_averages.values())  # Exact, not rounded
+        self.total_average = exact_total_average_hundredths(course_hundredths_sum, courses_taken) / 100
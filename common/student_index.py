@@ -0,0 +1,69 @@
+# General imports
+import json
+import mmap
+import struct
+
+# Local imports
+from common.handle_errors import handle_error
+
+# Global values for newline delimited json output and its index
+student_index_suffix = '.index'  # Index is written next to output file, e.g. output.ndjson.index
+student_index_header = struct.Struct('<8sI')  # Magic bytes and shard size (0 when output is not sharded)
+student_index_record = struct.Struct('<qIQI')  # Student id, shard, byte offset and byte length of student's line
+student_index_magic = b'SIDX\x00\x00\x00\x01'
+
+
+# Path to file holding a shard of newline delimited json output
+def ndjson_shard_file(output_file: str, shard: int):
+    """
+    :param output_file: path to output file
+    :param shard: number of shard, shards hold students in order of id
+    :return: path to shard file, e.g. output.ndjson.0003
+    """
+    return f'{output_file}.{shard:04d}'
+
+
+# Read a single student's entry from newline delimited json output, seeking straight to its line
+def read_student_entry(output_file: str, student_id: int):
+    """
+    Index records are ordered by student id (students are written in order of id), so the record of a student is
+    found by binary search over the memory mapped index before one seek into the output (or shard) file.
+
+    :param output_file: path to output file written with output format ndjson
+    :param student_id: id of student to read
+    :return: student entry dict (as in output file), or None if there is no student with student_id in output
+    """
+    try:
+        index_file = open(output_file + student_index_suffix, 'rb')
+    except OSError:
+        handle_error(f'There was an error opening index of output file with path: {output_file}')
+
+    with index_file:
+        index_header = index_file.read(student_index_header.size)
+        if len(index_header) < student_index_header.size or index_header[:8] != student_index_magic:
+            handle_error(f'Index of output file {output_file} is not a student index.')
+        _, shard_size = student_index_header.unpack(index_header)
+        record_count = (index_file.seek(0, 2) - student_index_header.size) // student_index_record.size
+        if record_count == 0:
+            return None
+
+        with mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index_map:
+            low, high = 0, record_count
+            while low < high:  # Find first record with id not less than student_id
+                middle = (low + high) // 2
+                if struct.unpack_from('<q', index_map, student_index_header.size +
+                                      middle * student_index_record.size)[0] < student_id:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == record_count:
+                return None
+            record_id, shard, offset, length = student_index_record.unpack_from(
+                index_map, student_index_header.size + low * student_index_record.size)
+
+    if record_id != student_id:
+        return None
+
+    with open(ndjson_shard_file(output_file, shard) if shard_size else output_file, 'rb') as data_file:
+        data_file.seek(offset)
+        return json.loads(data_file.read(length))
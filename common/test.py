@@ -1,9 +1,12 @@
 # Global values for Test or test input data
 desired_columns_tests = ('id', 'course_id', 'weight')  # Referenced when parsing school data csv input
+column_types_tests = (int, int, int)  # Types of desired columns, rows are converted to tuples of these types
 
 
 # Class to hold data pertinent of a test as per the spec, can return dictionary version of itself
 class Test:
+    __slots__ = ('id', 'course_id', 'weight')
+
     def __init__(self, test_id: int = None, course_id: int = None, weight: int = None):
         self.id = test_id
         self.course_id = course_id
@@ -0,0 +1,131 @@
+# Local imports
+from common.handle_errors import AdminValidationError
+from common.parse_school_csvs import validate_typed_rows, typed_row_as_dict
+from common.course import desired_columns_courses, course_weight_total
+from common.student import desired_columns_students, student_without_marks_message
+from common.test import desired_columns_tests
+from common.mark import desired_columns_marks
+
+# Global values for validating input
+default_error_limit = 100  # Errors recorded before validation stops, keeps reports of badly broken inputs small
+
+
+# A class which records errors found while validating input, up to a limit
+class ValidationReport:
+    def __init__(self, error_limit: int = default_error_limit):
+        self.error_limit = error_limit
+        self.errors = []  # Filled out with a dict for each error (file, line and error message) in the order found
+
+    # Whether the limit of errors has been reached, no more errors are recorded once it has
+    @property
+    def limit_reached(self):
+        return len(self.errors) >= self.error_limit
+
+    # Record an error found in an input file
+    def add_error(self, file_name: str, line: int, error_message: str):
+        """
+        :param file_name: path to input file the error was found in
+        :param line: line number of the row with the error (header is line 1), None for errors of the whole file
+        :param error_message: message of error, the same message a run would halt with
+        :return: None, serves to record error unless limit has been reached
+        """
+        if not self.limit_reached:
+            self.errors.append({"file": file_name, "line": line, "error": error_message})
+
+    # Turn report into a dictionary object, written to output file
+    def report_as_dict(self):
+        return {"errorCount": len(self.errors), "errorLimitReached": self.limit_reached, "errors": self.errors}
+
+
+# Collect ids of rows of courses, students or tests, recording duplicates as a run would
+def validate_data_ids(file_count: int, f: str, columns: tuple, validation_report: ValidationReport):
+    """
+    :param file_count: file count specifying which input file is being validated (courses, students, or tests)
+    :param f: path to input csv file
+    :param columns: desired columns of input file, used to write rows back out in error messages
+    :param validation_report: ValidationReport errors are recorded in
+    :return: dict with keys as ids and values as typed rows, first row found is kept for duplicate ids
+    """
+    data_rows = {}
+    for line, r in validate_typed_rows(file_count, f, validation_report):
+        if r[0] in data_rows:
+            validation_report.add_error(f, line, f'Duplicate found with id {r[0]}. Found with row: '
+                                                 f'{typed_row_as_dict(columns, r)}')
+        else:
+            data_rows[r[0]] = r
+
+    return data_rows
+
+
+# Turn a typed row of marks back into a dictionary of strings, used in error messages
+def marks_row_as_dict(marks_row: tuple):
+    return typed_row_as_dict(desired_columns_marks, marks_row)
+
+
+# Validate all input files in one pass, recording every error found (up to a limit) rather than halting on the first
+def validate_admin_data(input_files: list, error_limit: int = default_error_limit):
+    """
+    Rows of each file are checked as a run checks them: columns, integer values, duplicate ids, test weight totals of
+    each course, as well as the course of each test and the student and test of each mark existing (with each test
+    marked once for a student), and every student having a mark. Marks are read one row at a time, so memory used does
+    not depend on the number of rows in marks.
+
+    :param input_files: list with input csv files as strings ordered as follows: courses, students, tests, and marks
+    :param error_limit: number of errors recorded before validation stops
+    :return: ValidationReport of input, throws AdminValidationError holding the report if any errors were found
+    """
+    courses_file, students_file, tests_file, marks_file = input_files
+    validation_report = ValidationReport(error_limit)
+
+    course_rows = validate_data_ids(0, courses_file, desired_columns_courses, validation_report)
+    student_rows = validate_data_ids(1, students_file, desired_columns_students, validation_report)
+    test_rows = validate_data_ids(2, tests_file, desired_columns_tests, validation_report)
+
+    # Tests must belong to an existing course, and weights of tests in a course cannot add up to more than 100
+    course_weights = {}
+    for test_id, r in test_rows.items():
+        if r[1] not in course_rows:
+            validation_report.add_error(tests_file, None, f'No such course with id {r[1]} exists. Found in tests with '
+                                                          f'row: {typed_row_as_dict(desired_columns_tests, r)}')
+        course_weights[r[1]] = course_weights.get(r[1], 0) + r[2]
+    for course_id, weight_total in course_weights.items():
+        if course_id in course_rows and weight_total > course_weight_total:
+            validation_report.add_error(tests_file, None, f'Invalid course weights. Course has id: {course_id}, '
+                                                          f'weight total is not {course_weight_total}. '
+                                                          f'Total: {weight_total}')
+
+    # Marks must be for an existing student and test, and a test can only be marked once for a student
+    test_positions, course_test_counts = {}, {}  # Position of each test among tests of its course, as in SchoolIds
+    for test_id, r in test_rows.items():
+        test_positions[test_id] = course_test_counts.get(r[1], 0)
+        course_test_counts[r[1]] = test_positions[test_id] + 1
+    course_tests = {}  # Keys are (student id, course id), bit i of values is set once the i-th test of course is marked
+    marked_students = set()  # Ids of students with a mark for an existing test
+    for line, r in validate_typed_rows(3, marks_file, validation_report):
+        test_id, student_id, _ = r
+        if student_id not in student_rows:
+            validation_report.add_error(marks_file, line, f'No such student with id {student_id} exists. Found in '
+                                                          f'marks with row: {marks_row_as_dict(r)}')
+        if test_id not in test_rows:
+            validation_report.add_error(marks_file, line, f'No such test with id {test_id} exists. Found in marks '
+                                                          f'with row: {marks_row_as_dict(r)}')
+        elif student_id in student_rows:
+            course_key, test_bit = (student_id, test_rows[test_id][1]), 1 << test_positions[test_id]
+            if course_tests.get(course_key, 0) & test_bit:
+                validation_report.add_error(marks_file, line, f'Duplicate mark found for test with id {test_id} and '
+                                                              f'student with id {student_id}. Found in marks with '
+                                                              f'row: {marks_row_as_dict(r)}')
+            course_tests[course_key] = course_tests.get(course_key, 0) | test_bit
+            marked_students.add(student_id)
+
+    # A student without marks has no total average, a run stops with the same error (lowest id first, as written)
+    for student_id in sorted(student_rows):
+        if student_id not in marked_students:
+            validation_report.add_error(students_file, None, student_without_marks_message(student_id))
+
+    if validation_report.errors:
+        limit_note = ' (error limit reached, input may hold more errors)' if validation_report.limit_reached else ''
+        raise AdminValidationError(f'Validation found {len(validation_report.errors)} errors in input files'
+                                   f'{limit_note}.', validation_report.report_as_dict())
+
+    return validation_report
@@ -1,16 +1,77 @@
 # General Imports
+import io
+import os
 import sys
+import asyncio
+import tempfile
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
 
 # Local Imports
-from common.handle_errors import set_error_json_writer, handle_error
-from common.parse_school_csvs import generate_school_data_row_lists
-from common.JSONWriter import JSONWriter
-from common.course import Course
-from common.student import Student
-from common.test import Test
+from common.handle_errors import AdminDataError, handle_error, write_error_json
+from common.admin_run import AdminRunContext, AdminRunResult
+from common.validation import validate_admin_data, default_error_limit
+from common.parse_school_csvs import stream_typed_rows, read_typed_rows, open_school_data_file, \
+    input_file_compression, typed_row_as_dict, marks_file_count
+from common.input_cache import load_typed_rows, load_typed_columns
+from common.parallel_parsing import parse_school_data_files_parallel, parse_typed_rows_list, read_marks_header, \
+    split_marks_byte_ranges, parse_marks_byte_range, parse_marks_columns
+from common.integer_csv_reader import parse_typed_rows, parse_typed_columns
+from common.JSONWriter import JSONWriter, compressed_file_suffixes
+from common.course import Course, desired_columns_courses
+from common.student import Student, desired_columns_students
+from common.test import Test, desired_columns_tests
+from common.mark import desired_columns_marks
+from common.school_ids import SchoolIds
+from common.sharded_processing import accumulate_sharded_course_points
+from common.delta_state import save_delta_state, load_delta_state, check_delta_state_catalog
+from common.instrumentation import StageMetrics, supported_metrics_modes, metrics_mode
+from common.course_statistics import CourseStatistics, course_statistics_suffix
+from common.file_watch import InputFileWatcher, WatchedSchool, marks_bytes_digest, default_watch_interval_ms, \
+    default_debounce_ms
+from common.external_aggregation import spill_entry_limit, score_entry_limit, accumulate_spilled_marks, \
+    generate_external_averaged_students, SpilledCourseStatistics
+from common.numpy_engine import numpy_engine_available, marks_arrays_from_columns, compute_student_averages_numpy
+from common.sqlite_engine import connect_school_database, input_file_fingerprints, school_database_current, \
+    load_school_database, read_catalog_rows, read_student_row, check_school_database_marks, read_loaded_input_files, \
+    compute_student_course_points_sqlite
 
 # Global values pertinent to driver code for admin data tool
-json_writer = JSONWriter()
+# Optional command line flags (given as --option or --option=value) and the type their value is converted to
+supported_options = {
+    'streaming': bool,
+    'engine': str,
+    'workers': int,
+    'state': str,
+    'delta': bool,
+    'cache-dir': str,
+    'metrics': metrics_mode,
+    'batch': bool,
+    'batch-workers': int,
+    'validate': bool,
+    'error-limit': int,
+    'parse-workers': int,
+    'output-format': str,
+    'shard-size': int,
+    'memory-limit': int,
+    'database': str,
+    'course-stats': bool,
+    'compact': bool,
+    'compression': str,
+    'fast-encoder': bool,
+    'watch': bool,
+    'watch-interval-ms': int,
+    'debounce-ms': int,
+    'pipeline': bool
+}
+supported_engines = ('python', 'numpy', 'sqlite')  # Engines which can compute averages, numpy requires NumPy installed
+supported_output_formats = ('json', 'ndjson')  # Single json object, or one student per line with an index
+watch_supported_options = ('output_format', 'shard_size', 'course_stats', 'compact', 'compression', 'fast_encoder')
+pipeline_range_bytes = 4 << 20  # Marks are split into byte ranges of about 4 MiB, each parsed in a process of the pool
+pipeline_ranges_per_worker = 2  # Ranges parsed or waiting to be aggregated for each parse worker (bounds memory)
+pipeline_student_batch_size = 1000  # Students handed to the writer thread at a time
+pipeline_student_batches = 4  # Batches of students waiting to be written (bounds memory)
+batch_input_file_names = ('courses.csv', 'students.csv', 'tests.csv', 'marks.csv')  # Input files of each batch school
 
 
 # Generate JSON Output Dictionary to be written to output file
@@ -50,9 +111,24 @@ def generate_school_data_json_object(students: dict, courses: dict):
     # Save sorted id order of students, ensures order by id in output
     student_id_order = sorted(students.keys())
 
-    json_sd_output = {"students": []}  # This dict will hold output json data
-    for s_id in student_id_order:
-        student_obj = students[s_id]
+    # This dict will hold output json data
+    json_sd_output = {"students": list(generate_school_data_student_entries((students[s_id] for s_id in student_id_order),
+                                                                            courses))}
+
+    return json_sd_output
+
+
+# Generate student entries for JSON output one at a time, allows output to be written as entries are created
+def generate_school_data_student_entries(students, courses: dict):
+    """
+    Builds entries of the "students" list described in generate_school_data_json_object. Entries are yielded one at a
+    time so that a writer (see JSONWriter.write_students_to_output_file) can write each entry once it is created.
+
+    :param students: Iterable of student objects (e.g. generator), entries are yielded in the same order
+    :param courses: Contains data of courses such as ids, course names, and teacher names
+    :return: generator yielding a student entry dict for each student
+    """
+    for student_obj in students:
         student_entry = {  # Create skeleton student entry with course list placeholder
             "id": student_obj.id,
             "name": student_obj.name,
@@ -63,30 +139,69 @@ def generate_school_data_json_object(students: dict, courses: dict):
         # Fill out courses list for student
         course_id_order = sorted(student_obj.course_averages)
         for course in course_id_order:
+            course_obj = courses[course]  # Looked up once for both name and teacher
             course_entry = {  # Create course entry dict pulling info from courses dict and curr student object
                 "id": course,
-                "name": courses[course].name,
-                "teacher": courses[course].teacher,
+                "name": course_obj.name,
+                "teacher": course_obj.teacher,
                 "courseAverage": student_obj.course_averages[course]
             }
 
             student_entry["courses"].append(course_entry)
 
-        # Add completed student entry to output
-        json_sd_output["students"].append(student_entry)
+        yield student_entry
 
-    return json_sd_output
+
+# Generate students in order of id, computing each student's averages just before it is yielded
+def generate_averaged_students(student_data: dict, from_points: bool = False):
+    """
+    :param student_data: Dictionary containing all students (as objects, keys are student ids)
+    :param from_points: boolean to determine whether course averages come from running sums of points (streaming mode)
+    :return: generator yielding student objects sorted by id with course averages and total average computed
+    """
+    for s_id in sorted(student_data):
+        student = student_data[s_id]
+        if from_points:
+            student.compute_course_averages_from_points()
+        else:
+            student.compute_course_averages()
+        student.compute_total_average()
+
+        yield student
+
+
+# Generate students in order of id for marks appended since state was saved, reusing saved averages where possible
+def generate_delta_averaged_students(student_data: dict, delta_student_ids: set, saved_total_averages: dict):
+    """
+    :param student_data: Dictionary containing all students (as objects, keys are student ids), course points seeded
+    :param delta_student_ids: ids of students found in appended marks, only these have their total average recomputed
+    :param saved_total_averages: dict of total average of each student saved with state (keys are student ids)
+    :return: generator yielding student objects sorted by id with course averages and total average set
+    """
+    for s_id in sorted(student_data):
+        student = student_data[s_id]
+        student.compute_course_averages_from_points()  # Course averages are read straight off of the running sums
+        if s_id in delta_student_ids or s_id not in saved_total_averages:
+            student.compute_total_average()
+        else:  # Student has no appended marks, total average is unchanged
+            student.total_average = saved_total_averages[s_id]
+
+        yield student
 
 
 # Compute student averages (course averages, then total average)
-def compute_student_averages(student_data: dict):
+def compute_student_averages(student_data: dict, from_points: bool = False):
     """
     :param student_data: Dictionary containing all students (as objects, keys are student ids)
+    :param from_points: boolean to determine whether course averages come from running sums of points (streaming mode)
     :return: None, serves to compute course averages and total average for student
     """
     # Compute course averages for each student
     for s in student_data:
-        student_data[s].compute_course_averages()
+        if from_points:
+            student_data[s].compute_course_averages_from_points()
+        else:
+            student_data[s].compute_course_averages()
 
     # With course averages computed, now compute total average for each student
     for s in student_data:
@@ -94,158 +209,1101 @@ def compute_student_averages(student_data: dict):
 
 
 # Add test weights for courses to ensure they add up to desired amount
-def check_course_test_weights(course_data: dict, test_data: dict):
+def check_course_test_weights(school_ids: SchoolIds):
     """
-    :param course_data: Dictionary containing all courses (as objects, keys are courses ids)
-    :param test_data: Dictionary containing all tests (as objects, keys are test ids)
+    :param school_ids: SchoolIds of courses and tests (see common/school_ids.py)
     :return: None, serves to add test weights for each course, ensures amount adds up to 100 (else error)
     """
-    for test in test_data:
-        course_id_for_test = test_data[test].course_id
+    courses, test_weights = school_ids.courses, school_ids.test_weights
+    for test_index, course_index in enumerate(school_ids.test_course_indices):
+        course = courses[course_index]
+        if course is None:  # If no such course exists in the database, through an error due to bad entry in tests
+            test = school_ids.tests[test_index]
+            handle_error(f'No such course with id {test.course_id} exists. Found in tests with row: '
+                         f'{typed_row_as_dict(desired_columns_tests, (test.id, test.course_id, test.weight))}')
         # Add weight to respective course, allows for validation of test weight totals for courses
-        course_data[course_id_for_test].add_test_weight(test_data[test].weight)
+        course.add_test_weight(test_weights[test_index])
 
 
 # Associate course participation and test results for said course, for each student
-def associate_student_courses(student_data: dict, test_data: dict):
+def associate_student_courses(student_data: dict, school_ids: SchoolIds):
     """
-    :param student_data: Dictionary containing all students (as objects, keys are student ids)
-    :param test_data: Dictionary containing all tests (as objects, keys are test ids)
+    :param student_data: Dictionary containing all students (as objects, keys are student ids), marks associated
+    :param school_ids: SchoolIds of courses and tests, keys of each student's marks are its test indices
     :return: None, serves to find courses students have taken and associates their test scores for that course (id)
     """
-    for s in student_data:
-        student = student_data[s]
+    course_ids, test_course_indices, test_weights = \
+        school_ids.course_ids, school_ids.test_course_indices, school_ids.test_weights
+    for student in student_data.values():
+        student_courses = student.courses
         # Correlate what courses a student is involved in from marks and tests data
-        for test in student.marks:
-            course_id_for_test = test_data[test].course_id  # Grab course id
+        for test, mark in student.marks.items():
+            course_id_for_test = course_ids[test_course_indices[test]]  # Grab course id
             try:  # Add test, mark and test weight for student's list of tests, marks and weights for a given course
-                student.courses[course_id_for_test].append((test, student.marks[test], test_data[test].weight))
+                student_courses[course_id_for_test].append((test, mark, test_weights[test]))
             except KeyError:  # Init list to hold tuples of tests, marks and weights for a student in given course
-                student.courses[course_id_for_test] = [(test, student.marks[test], test_data[test].weight)]
+                student_courses[course_id_for_test] = [(test, mark, test_weights[test])]
 
 
-# Associate mark data to students marks dictionary (keys: test_id, value: marks aka test score)
-def associate_student_marks(student_data: dict, marks_rows: list):
+# Associate mark data to students marks dictionary (keys: test index, value: marks aka test score)
+def associate_student_marks(student_data: dict, marks_rows: list, school_ids: SchoolIds):
     """
+    Test ids of marks are interned as they are associated: each student's marks dict is keyed by the index of the test
+    in school_ids (as in every mode which keeps marks, see common/sharded_processing.py). A row of a student or test
+    which does not exist raises an error, as does a second mark for a test a student already has a mark for (in every
+    mode and engine, so reports never depend on which of the marks is used).
+
     :param student_data: Dictionary containing all students (as objects, keys are student ids)
-    :param marks_rows: List containing rows parsed from marks input file
+    :param marks_rows: List containing typed rows (test_id, student_id, mark) parsed from marks input file
+    :param school_ids: SchoolIds of courses and tests (see common/school_ids.py), maps test ids to test indices
     :return: None, serves to parse rows in marks and save off test information to student's marks dict (test results)
     """
+    test_indices = school_ids.test_indices
     for r in marks_rows:
-        try:  # Try to associate test and student test score (mark) with student
-            student_id = int(r['student_id'])
-            test_id = int(r['test_id'])
+        test_id, student_id, mark = r
+        try:  # Try to find student the mark belongs to
             student = student_data[student_id]
-            student.marks[test_id] = int(r['mark'])  # Convert student marks for test (test score) to integer
         except KeyError:  # If no such student exists in the database, through an error due to bad entry in marks
-            handle_error(f'No such student with id {r["student_id"]} exists. Found in marks with row: {r}')
+            handle_error(f'No such student with id {student_id} exists. Found in marks with row: '
+                         f'{typed_row_as_dict(desired_columns_marks, r)}')
+
+        try:  # Try to find test the mark was given for
+            test_index = test_indices[test_id]
+        except KeyError:  # If no such test exists in the database, through an error due to bad entry in marks
+            handle_error(f'No such test with id {test_id} exists. Found in marks with row: '
+                         f'{typed_row_as_dict(desired_columns_marks, r)}')
+
+        if test_index in student.marks:  # A test can only be marked once for a student
+            handle_error(f'Duplicate mark found for test with id {test_id} and student with id {student_id}. Found in '
+                         f'marks with row: {typed_row_as_dict(desired_columns_marks, r)}')
+        student.marks[test_index] = mark  # Associate test and student test score (mark) with student
+
+
+# Fold rows of marks into running sums of weighted points per student and course, rows are consumed one at a time
+def accumulate_student_course_points(student_data: dict, school_ids: SchoolIds, marks_rows):
+    """
+    Streaming counterpart to associate_student_marks and associate_student_courses. Instead of saving each mark to a
+    student, mark * test weight is added to a running sum for the course of the test. Memory used depends on the number
+    of students and their courses rather than the number of rows in marks: marks are not kept, only which tests of each
+    course a student has a mark for (see Student.add_course_test), so a duplicate mark raises the same error as it does
+    in associate_student_marks.
+
+    :param student_data: Dictionary containing all students (as objects, keys are student ids)
+    :param school_ids: SchoolIds of courses and tests, marks are joined to courses and weights by test index
+    :param marks_rows: Iterable of typed rows (test_id, student_id, mark) from marks, e.g. from stream_typed_rows
+    :return: None, serves to add weighted test scores to each student's course_points dict (keys are course ids)
+    """
+    test_indices, course_ids, test_course_indices, test_course_positions, test_weights = \
+        school_ids.test_indices, school_ids.course_ids, school_ids.test_course_indices, \
+        school_ids.test_course_positions, school_ids.test_weights
+    for r in marks_rows:
+        test_id, student_id, mark = r
+        try:  # Try to find student the mark belongs to
+            student = student_data[student_id]
+        except KeyError:  # If no such student exists in the database, through an error due to bad entry in marks
+            handle_error(f'No such student with id {student_id} exists. Found in marks with row: '
+                         f'{typed_row_as_dict(desired_columns_marks, r)}')
+
+        try:  # Try to find test the mark was given for, test index joins to course and weight
+            test_index = test_indices[test_id]
+        except KeyError:  # If no such test exists in the database, through an error due to bad entry in marks
+            handle_error(f'No such test with id {test_id} exists. Found in marks with row: '
+                         f'{typed_row_as_dict(desired_columns_marks, r)}')
+
+        course_id = course_ids[test_course_indices[test_index]]
+        if not student.add_course_test(course_id, test_course_positions[test_index]):  # Tests are marked once only
+            handle_error(f'Duplicate mark found for test with id {test_id} and student with id {student_id}. Found in '
+                         f'marks with row: {typed_row_as_dict(desired_columns_marks, r)}')
+        student.add_course_points(course_id, mark * test_weights[test_index])
+
+
+# Read typed rows of input files, from cache if a cache directory is given and an input file is unchanged
+def generate_school_data_typed_rows(input_files: list, stream_marks: bool = False, cache_dir: str = None,
+                                    parse_workers: int = 1, marks_columns: bool = False):
+    """
+    :param input_files: list with input csv files as strings ordered as follows: courses, students, tests, and marks
+    :param stream_marks: boolean to determine whether marks are returned as a generator reading one row at a time
+    :param cache_dir: path to directory of cached typed rows (see common/input_cache.py), None to always parse input
+    :param parse_workers: number of processes parsing input files when marks are not streamed or cached, marks are
+    split into byte ranges parsed at the same time (see common/parallel_parsing.py)
+    :param marks_columns: boolean to determine whether marks which are not streamed are returned as typed columns
+    (test_id, student_id, mark) rather than rows, see parse_typed_columns
+    :return: list with typed rows of inputs ordered as follows: courses, students, tests and marks
+    """
+    if parse_workers > 1 and not stream_marks and cache_dir is None:
+        return parse_school_data_files_parallel(input_files, parse_workers, marks_columns=marks_columns)
+
+    input_files_rows = []
+    for file_count, f in enumerate(input_files):
+        if stream_marks and file_count == marks_file_count:  # Check marks exists and has data before it is streamed
+            open_school_data_file(f).close()
+            input_files_rows.append(stream_typed_rows(file_count, f))
+        elif cache_dir is not None and marks_columns and file_count == marks_file_count:
+            input_files_rows.append(load_typed_columns(file_count, f, cache_dir))
+        elif cache_dir is not None:
+            input_files_rows.append(load_typed_rows(file_count, f, cache_dir))
+        elif marks_columns and file_count == marks_file_count:
+            input_files_rows.append(parse_typed_columns(file_count, f))
+        else:  # Tests and marks are read straight from bytes when they hold only plain integers
+            input_files_rows.append(parse_typed_rows(file_count, f))
+
+    return input_files_rows
 
 
 # Function to generate a dictionary of objects from rows of input data (type can be set to Course, Student, or Test)
 def generate_data_dict(input_rows: list, isCourse: bool = False, isStudent: bool = False, isTest: bool = False):
     """
-    :param input_rows: Contains each row in csv file containing course data
+    :param input_rows: Contains each typed row in csv file (tuples ordered as desired columns, id first)
     :param isCourse: boolean to determine whether rows being processed are course data
     :param isStudent: boolean to determine whether rows being processed are student data
     :param isTest: boolean to determine whether rows being processed are test data
     :return: a dictionary of objects with keys as the data id of the row (type determined by boolean arguments)
     """
+    # Object type and columns of rows (columns are used to write rows back out in error messages)
+    if isCourse:
+        data_type, columns = Course, desired_columns_courses
+    elif isStudent:
+        data_type, columns = Student, desired_columns_students
+    else:
+        data_type, columns = Test, desired_columns_tests
+
     data = {}
     for r in input_rows:
-        data_id = int(r['id'])  # Convert object (row) id to integer
-        try:  # Check for duplicates, if object with duplicate id is received, produce error
-            v = data[data_id]
-            handle_error(f'Duplicate found with id {data_id}. Found with row: {r}')
-        except KeyError:  # Unique object
-            if isCourse:
-                data[data_id] = Course(data_id, r['name'], r['teacher'])
-            elif isStudent:
-                data[data_id] = Student(data_id, r['name'])
-            elif isTest:
-                data[data_id] = Test(data_id, int(r['course_id']), int(r['weight']))
+        data_id = r[0]  # Object (row) id, already converted to integer
+        if data_id in data:  # Check for duplicates, if object with duplicate id is received, produce error
+            handle_error(f'Duplicate found with id {data_id}. Found with row: {typed_row_as_dict(columns, r)}')
+
+        data[data_id] = data_type(*r)  # Typed rows are ordered as the arguments of each object's constructor
 
     return data
 
 
-# Serves to process data from input files and convert them to json
-def process_admin_data(courses_file: str, students_file: str, tests_file: str, marks_file: str, output_file: str):
+# Validate options deciding how output is written, see generate_admin_data
+def check_output_options(output_format: str, shard_size: int = None, compression: str = None):
+    if output_format not in supported_output_formats:
+        handle_error(f'Unknown output format specified: {output_format}. Supported output formats are: '
+                     f'{", ".join(supported_output_formats)}.')
+    if shard_size is not None and (shard_size < 1 or output_format != 'ndjson'):
+        handle_error(f'Invalid shard size specified: {shard_size}. Shards of at least 1 student can only be written '
+                     f'with the ndjson output format.')
+    if compression is not None and output_format == 'ndjson':  # Index offsets are byte offsets into uncompressed lines
+        handle_error('Compression can only be used with the json output format, ndjson output is indexed by offset.')
+
+
+# Serves to process data from input files and write them as json to the output file of a json writer
+def generate_admin_data(json_writer: JSONWriter, courses_file: str, students_file: str, tests_file: str,
+                        marks_file: str, output_file: str, streaming: bool = False, engine: str = 'python',
+                        workers: int = 1, state: str = None, delta: bool = False, cache_dir: str = None,
+                        metrics: bool | str = False, validate: bool = False, error_limit: int = default_error_limit,
+                        parse_workers: int = 1, output_format: str = 'json', shard_size: int = None,
+                        memory_limit: int = None, database: str = None, course_stats: bool = False,
+                        compact: bool = False, compression: str = None, fast_encoder: bool = False,
+                        pipeline: bool = False):
     """
-    This is the main driver function for this library. It is separated from the main start below so one can write unit
-    test cases from other files and directly call this function. Such a file that makes use of this is the unit test
-    file for this library called docs/test_admin_tool.py.
+    Errors in input data or options raise AdminDataError (see common/handle_errors.py), they are written to output file
+    by run_admin_data. Nothing global is used, so runs with separate json writers can take place at the same time.
 
+    :param json_writer: JSONWriter of the run, used for writing output
     :param courses_file: Contains path to courses csv file
     :param students_file: Contains path to students csv file
     :param tests_file: Contains path to tests csv file
     :param marks_file: Contains path to marks csv file
     :param output_file: Contains path to desired output file
-    :return: Nothing, this function cues the parsing of input data, correlation between inputs, generating output JSON
+    :param streaming: boolean to determine whether marks are read one row at a time into running sums (large inputs)
+    :param engine: name of engine computing averages, python (per object loops), numpy (grouped array reductions) or
+    sqlite (grouped queries over an indexed database, see common/sqlite_engine.py)
+    :param workers: number of processes summing marks, marks are split into one byte range per process and only sums
+    of points are merged (see common/sharded_processing.py), averages are then computed as when streaming
+    :param state: path to state file holding running sums of points for each student, saved once averages are computed
+    (implies streaming)
+    :param delta: boolean to determine whether marks_file only holds rows appended to marks since state was saved, in
+    which case sums from state are updated and only students found in marks_file have their total average recomputed
+    :param cache_dir: path to directory caching typed rows of input files, unchanged input files are not parsed again
+    (marks are only cached when they are not streamed)
+    :param metrics: boolean to determine whether wall time, cpu time, peak resident memory and row counts of each stage
+    are recorded and written next to output file (see common/instrumentation.py), or one of supported_metrics_modes:
+    time (as True) or memory (memory allocated by each stage is also traced, which slows down the run)
+    :param validate: boolean to determine whether input files are only validated, every error found (up to error_limit)
+    is written to output file as a report rather than halting on the first (see common/validation.py)
+    :param error_limit: number of errors recorded before validation stops
+    :param parse_workers: number of processes parsing input files, marks are split into byte ranges parsed at the same
+    time (marks which are streamed or cached are parsed serially)
+    :param output_format: format of output, json (single object) or ndjson (one student per line in order of id, with
+    an index of each student's line written next to output file, see common/student_index.py)
+    :param shard_size: number of students in each ndjson shard file (1 for a file per student), output file then lists
+    shard files instead of holding students
+    :param memory_limit: megabytes of memory held by students and marks, marks are streamed and spilled to sorted run
+    files once over the limit, then merged in order of student id and summed into points for each course (see
+    common/external_aggregation.py). Course averages of course_stats are spilled the same way, courses and tests are
+    still held in memory.
+    :param database: path to database file of the sqlite engine, input files are loaded into it once and later runs
+    query it until an input file changes (None for a database held in memory for this run only)
+    :param course_stats: boolean to determine whether statistics of each course (class average, distribution of course
+    averages, and each student's rank and percentile) are computed as students are averaged and written after students
+    (in a "courses" section, or next to output file for ndjson, see common/course_statistics.py)
+    :param compact: boolean to determine whether json output is written without indent or spaces after separators
+    :param compression: name of compression json output is written with as it is written (gzip or xz), None for none
+    :param fast_encoder: boolean to determine whether json is encoded by orjson when it is installed (see JSONWriter)
+    :param pipeline: boolean to determine whether stages overlap (see generate_admin_data_pipelined), catalogs and byte
+    ranges of marks are parsed across parse_workers processes while parsed ranges are summed into running sums of
+    points (as when streaming), and students are written by a thread while later students are averaged
+    :return: number of students written to output file (0 when validating)
     """
 
     # Set JSONWriter object output file path, validates permission to use output file as well
     json_writer.set_json_writer_output_file(output_file)
-    # Send created json writer to be used for writing error messages in handle_errors.py
-    set_error_json_writer(json_writer)
+    check_output_options(output_format, shard_size, compression)
+    json_writer.set_json_writer_format(compact=compact, compression=compression, fast_encoder=fast_encoder)
+
+    if validate:  # Validate input files in one pass, an empty report is written if no errors are found
+        if error_limit < 1:
+            handle_error(f'Invalid error limit specified: {error_limit}. At least 1 error must be recorded.')
+        validation_report = validate_admin_data([courses_file, students_file, tests_file, marks_file], error_limit)
+        json_writer.write_json_to_output_file(validation_report.report_as_dict())
+        return 0
+
+    # Validate engine prior to reading input, the numpy engine can only be used if NumPy can be imported
+    if engine not in supported_engines:
+        handle_error(f'Unknown engine specified: {engine}. Supported engines are: {", ".join(supported_engines)}.')
+    elif engine == 'numpy' and not numpy_engine_available:
+        handle_error('The numpy engine was specified, but NumPy is not installed.')
+    if workers < 1:
+        handle_error(f'Invalid number of workers specified: {workers}. At least 1 worker is required.')
+    if parse_workers < 1:
+        handle_error(f'Invalid number of parse workers specified: {parse_workers}. At least 1 worker is required.')
+    elif workers > 1 and engine != 'python':
+        handle_error(f'Multiple workers can only be used with the python engine, {engine} engine was specified.')
+    if delta and state is None:
+        handle_error('A state file must be specified to process marks appended since state was saved (delta).')
+    elif state is not None and (engine != 'python' or workers > 1):
+        handle_error('A state file can only be used with the python engine and a single worker.')
+    if isinstance(metrics, str) and metrics not in supported_metrics_modes:
+        handle_error(f'Unknown metrics specified: {metrics}. Supported metrics are: '
+                     f'{", ".join(supported_metrics_modes)}.')
+    if memory_limit is not None and memory_limit < 1:
+        handle_error(f'Invalid memory limit specified: {memory_limit}. At least 1 megabyte is required.')
+    elif memory_limit is not None and (engine != 'python' or workers > 1 or state is not None):
+        handle_error('A memory limit can only be used with the python engine, a single worker and no state file.')
+    if database is not None and engine != 'sqlite':
+        handle_error(f'A database can only be used with the sqlite engine, {engine} engine was specified.')
+    elif engine == 'sqlite' and (workers > 1 or state is not None or memory_limit is not None):
+        handle_error('The sqlite engine can only be used with a single worker, no state file and no memory limit.')
+    if pipeline and (engine != 'python' or workers > 1 or state is not None or memory_limit is not None or
+                     cache_dir is not None):
+        handle_error('Pipelined stages can only be used with the python engine, a single worker, no state file, no '
+                     'memory limit and no cache directory.')
+    streaming = streaming or state is not None  # State holds running sums of points, which are kept when streaming
+
+    # Stage metrics (timing, memory and row counts) are only recorded if metrics are switched on
+    stage_metrics = StageMetrics(enabled=bool(metrics), trace_memory=metrics == 'memory')
+    stage_metrics.start()
+    try:  # Run files of sums spilled to disk (memory limit only) are removed once output is written
+        if engine == 'sqlite':  # Rows are joined and summed by the database rather than by python loops
+            input_files = [courses_file, students_file, tests_file, marks_file]
+            students_written = generate_sqlite_admin_data_stages(json_writer, input_files, cache_dir, parse_workers,
+                                                                 output_format, shard_size, database, course_stats,
+                                                                 stage_metrics)
+        elif pipeline:  # Stages overlap, run on an event loop of this run only
+            input_files = [courses_file, students_file, tests_file, marks_file]
+            students_written = asyncio.run(generate_admin_data_pipelined(json_writer, input_files, parse_workers,
+                                                                         output_format, shard_size, course_stats,
+                                                                         stage_metrics))
+        else:
+            spill_context = tempfile.TemporaryDirectory(prefix='admin_tool_spill_') if memory_limit else nullcontext()
+            with spill_context as spill_dir:
+                students_written = generate_admin_data_stages(json_writer, courses_file, students_file, tests_file,
+                                                              marks_file, streaming, engine, workers, state, delta,
+                                                              cache_dir, parse_workers, output_format, shard_size,
+                                                              memory_limit, course_stats, spill_dir, stage_metrics)
+    finally:  # Memory tracing is stopped even when a run is stopped by an error
+        stage_metrics.stop()
 
-    # Generate row lists for courses, students, tests, and marks
-    courses_rows, students_rows, tests_rows, marks_rows = generate_school_data_row_lists([courses_file,
-                                                                                          students_file,
-                                                                                          tests_file,
-                                                                                          marks_file])
+    # Write metrics next to output file (only if metrics are switched on)
+    stage_metrics.write_metrics_file(json_writer.output_file)
+
+    return students_written
+
+
+# Write entries of averaged students to output file in the output format, with statistics of each course if desired
+def write_student_entries(json_writer: JSONWriter, averaged_students, course_data: dict, output_format: str,
+                          shard_size: int = None, course_stats: bool = False,
+                          course_statistics: CourseStatistics = None):
+    """
+    :param json_writer: JSONWriter of the run, output file already set
+    :param averaged_students: Iterable of student objects in order of id with averages computed
+    :param course_data: Dictionary containing all courses (as objects, keys are course ids)
+    :param output_format: format of output, json or ndjson (see generate_admin_data)
+    :param shard_size: number of students in each ndjson shard file, None for a single file
+    :param course_stats: boolean to determine whether course statistics are recorded as students are written
+    :param course_statistics: CourseStatistics statistics are recorded with (e.g. SpilledCourseStatistics within a
+    memory limit), None for a CourseStatistics held in memory
+    :return: number of students written to output file
+    """
+    if course_stats and course_statistics is None:
+        course_statistics = CourseStatistics()
+    elif not course_stats:
+        course_statistics = None
+    if course_statistics is not None:  # Averages are recorded in the same pass that writes each student's entry
+        averaged_students = course_statistics.collect_students(averaged_students)
+    student_entries = generate_school_data_student_entries(averaged_students, course_data)
+
+    if output_format == 'ndjson':
+        students_written = json_writer.write_students_to_ndjson_file(student_entries, shard_size)
+        if course_statistics is not None:  # Lines only hold students, so statistics are written next to output file
+            JSONWriter(json_writer.output_file + course_statistics_suffix).write_students_to_output_file(
+                course_statistics.compute_course_statistics(course_data), list_name="courses")
+    elif course_statistics is not None:
+        students_written = json_writer.write_students_to_output_file(
+            student_entries, lambda: {"courses": course_statistics.compute_course_statistics(course_data)})
+    else:
+        students_written = json_writer.write_students_to_output_file(student_entries)
+
+    return students_written
+
+
+# Run each stage of processing (parse, generate_data_dict, associate, check_weights, averages_and_write, save_state)
+def generate_admin_data_stages(json_writer: JSONWriter, courses_file: str, students_file: str, tests_file: str,
+                               marks_file: str, streaming: bool, engine: str, workers: int, state: str, delta: bool,
+                               cache_dir: str, parse_workers: int, output_format: str, shard_size: int,
+                               memory_limit: int, course_stats: bool, spill_dir: str, stage_metrics: StageMetrics):
+    """
+    :param json_writer: JSONWriter of the run, output file already set
+    :param spill_dir: directory run files are spilled to when a memory limit is given, None otherwise
+    :param stage_metrics: StageMetrics of the run, records each stage when metrics are switched on
+    (other parameters are validated options, see generate_admin_data)
+    :return: number of students written to output file
+    """
+
+    # Generate typed row lists for courses, students, tests, and marks. When marks are streamed, they are read one row at
+    # a time once catalogs are built (a generator is returned for marks). Engines which keep all marks use cached rows,
+    # or rows parsed across parse workers. Workers parse byte ranges of marks themselves, streamed rows are only read
+    # if marks must be summed serially. The numpy engine keeps marks as columns (parsed or cached), viewed as arrays.
+    marks_columns = engine == 'numpy'
+    stream_marks = not marks_columns and (streaming or memory_limit is not None or (cache_dir is None and workers > 1))
+    with stage_metrics.stage('parse'):
+        input_files = [courses_file, students_file, tests_file, marks_file]
+        courses_rows, students_rows, tests_rows, marks_rows = generate_school_data_typed_rows(
+            input_files, stream_marks=stream_marks, cache_dir=cache_dir, parse_workers=parse_workers,
+            marks_columns=marks_columns)
+    if marks_columns:
+        stage_metrics.set_row_count('marks', len(marks_rows[0]))
+    else:
+        marks_rows = stage_metrics.count_rows('marks', marks_rows)  # Streamed marks are counted as they are consumed
 
     # After lists of rows for each input file have been generated, we generate dicts to hold courses, students and tests
     # Generating Course, Student and Test data dict to hold objects representing rows in respective input files
-    course_data = generate_data_dict(courses_rows, isCourse=True)
-    student_data = generate_data_dict(students_rows, isStudent=True)
-    test_data = generate_data_dict(tests_rows, isTest=True)
+    with stage_metrics.stage('generate_data_dict'):
+        course_data = generate_data_dict(stage_metrics.count_rows('courses', courses_rows), isCourse=True)
+        student_data = generate_data_dict(stage_metrics.count_rows('students', students_rows), isStudent=True)
+        test_data = generate_data_dict(stage_metrics.count_rows('tests', tests_rows), isTest=True)
+        school_ids = SchoolIds(course_data, test_data)  # Dense indices of courses and tests, joined on by index
 
-    # We can parse marks to correlate tests with students, and by proxy correlate student to courses they are in
-    associate_student_marks(student_data, marks_rows)
+    with stage_metrics.stage('associate'):
+        if engine == 'numpy':  # Load marks as integer arrays, averages are computed with grouped array reductions
+            compute_student_averages_numpy(student_data, test_data, marks_arrays_from_columns(marks_rows))
+        elif workers > 1:  # Byte ranges of marks are parsed, checked and summed across a pool of processes
+            marks_count = None if cache_dir is not None else \
+                accumulate_sharded_course_points(student_data, school_ids, marks_file, workers)
+            if marks_count is None:  # Cached, compressed or quoted marks, or a bad row (reported as when streaming)
+                accumulate_student_course_points(student_data, school_ids, marks_rows)
+            else:
+                stage_metrics.set_row_count('marks', marks_count)
+        elif delta:  # Seed running sums from state, then add marks appended since state was saved to those sums
+            saved_catalog, saved_total_averages = load_delta_state(state, student_data, school_ids)
+            delta_marks_rows = list(marks_rows)
+            accumulate_student_course_points(student_data, school_ids, delta_marks_rows)
+            delta_student_ids = {student_id for _, student_id, _ in delta_marks_rows}
+        elif memory_limit is not None:  # Marks are spilled to sorted run files on disk once over memory limit
+            spill_runs = accumulate_spilled_marks(student_data, school_ids, marks_rows, spill_dir,
+                                                  spill_entry_limit(memory_limit, len(student_data)))
+        elif streaming:  # Add each mark's weighted score to running sums for the student's course as marks are read
+            accumulate_student_course_points(student_data, school_ids, marks_rows)
+        else:
+            # We can parse marks to correlate tests with students, and by proxy correlate student to courses they are in
+            associate_student_marks(student_data, marks_rows, school_ids)
 
-    # Fill out student's courses dictionary with courses and respective tests, test weights, and student's test marks
-    associate_student_courses(student_data, test_data)
+            # Fill out student's courses dictionary with courses and respective tests, test weights, and student's marks
+            associate_student_courses(student_data, school_ids)
 
     # We can validate the courses by guaranteeing the weights of tests in a class add up to desired amount (default 100)
-    check_course_test_weights(course_data, test_data)
+    with stage_metrics.stage('check_weights'):
+        check_course_test_weights(school_ids)
+        if delta:  # Saved sums of points are only valid if courses and tests are unchanged
+            check_delta_state_catalog(state, course_data, test_data, saved_catalog)
+
+    # Compute averages for students in order of id, each student's entry is written to output as soon as it is ready
+    with stage_metrics.stage('averages_and_write'):
+        if engine == 'numpy':  # Averages have already been computed by the numpy engine
+            averaged_students = (student_data[s_id] for s_id in sorted(student_data))
+        elif memory_limit is not None:  # Run files are merged in order of student id as entries are written
+            averaged_students = generate_external_averaged_students(student_data, school_ids, spill_runs)
+        elif delta:  # Only students with appended marks have their total average recomputed
+            averaged_students = generate_delta_averaged_students(student_data, delta_student_ids, saved_total_averages)
+        else:
+            averaged_students = generate_averaged_students(student_data, from_points=streaming or workers > 1)
+        course_statistics = None  # Course averages are recorded in memory, unless held within the memory limit
+        if memory_limit is not None and course_stats:
+            course_statistics = SpilledCourseStatistics(spill_dir, score_entry_limit(memory_limit, len(student_data)))
+        students_written = write_student_entries(json_writer, averaged_students, course_data, output_format,
+                                                 shard_size, course_stats, course_statistics)
+        stage_metrics.set_row_count('students_written', students_written)
+
+    if state is not None:  # Save running sums of points so marks appended later can be processed with delta
+        with stage_metrics.stage('save_state'):
+            save_delta_state(state, student_data, course_data, test_data)
+
+    return students_written
+
+
+# Run each stage of processing with the sqlite engine, input files are loaded into the database unless already loaded
+def generate_sqlite_admin_data_stages(json_writer: JSONWriter, input_files: list, cache_dir: str, parse_workers: int,
+                                      output_format: str, shard_size: int, database: str, course_stats: bool,
+                                      stage_metrics: StageMetrics):
+    """
+    Marks are checked and summed into points for each student and course by grouped queries (a test listed more than
+    once for a student is an error, as in associate_student_marks), averages are computed from the sums.
+
+    :param json_writer: JSONWriter of the run, output file already set
+    :param input_files: list with input csv files as strings ordered as follows: courses, students, tests, and marks
+    :param stage_metrics: StageMetrics of the run, records each stage when metrics are switched on
+    (other parameters are validated options, see generate_admin_data)
+    :return: number of students written to output file
+    """
+    connection = connect_school_database(database if database is not None else ':memory:')
+    try:
+        # Input files are only parsed if they changed since they were loaded, marks are streamed into the database
+        with stage_metrics.stage('parse'):
+            input_fingerprints = input_file_fingerprints(input_files)
+            database_current = school_database_current(connection, input_fingerprints)
+            if database_current:
+                courses_rows, students_rows, tests_rows = read_catalog_rows(connection)
+            else:
+                courses_rows, students_rows, tests_rows, marks_rows = generate_school_data_typed_rows(
+                    input_files, stream_marks=cache_dir is None and parse_workers == 1, cache_dir=cache_dir,
+                    parse_workers=parse_workers)
+
+        # Duplicates are checked before loading, so the database only ever holds catalogs with unique ids
+        with stage_metrics.stage('generate_data_dict'):
+            course_data = generate_data_dict(stage_metrics.count_rows('courses', courses_rows), isCourse=True)
+            student_data = generate_data_dict(stage_metrics.count_rows('students', students_rows), isStudent=True)
+            test_data = generate_data_dict(stage_metrics.count_rows('tests', tests_rows), isTest=True)
+
+        if not database_current:
+            with stage_metrics.stage('load_database'):
+                load_school_database(connection, input_fingerprints, courses_rows, students_rows, tests_rows,
+                                     stage_metrics.count_rows('marks', marks_rows))
+
+        with stage_metrics.stage('associate'):
+            check_school_database_marks(connection)
+            compute_student_course_points_sqlite(connection, student_data)
+
+        with stage_metrics.stage('check_weights'):
+            check_course_test_weights(SchoolIds(course_data, test_data))
+
+        with stage_metrics.stage('averages_and_write'):
+            averaged_students = generate_averaged_students(student_data, from_points=True)
+            students_written = write_student_entries(json_writer, averaged_students, course_data, output_format,
+                                                     shard_size, course_stats)
+            stage_metrics.set_row_count('students_written', students_written)
+    finally:
+        connection.close()
+
+    return students_written
+
+
+# Queue parses of byte ranges of marks in order, the bounded queue holds back parsing once aggregation falls behind
+async def produce_marks_range_parses(executor: ProcessPoolExecutor, marks_file: str, header: list, data_start: int,
+                                     range_queue: asyncio.Queue):
+    """
+    :param executor: pool of processes parsing input files
+    :param marks_file: path to marks csv file
+    :param header: column names of marks (see read_marks_header), None if marks cannot be split into byte ranges
+    :param data_start: byte offset of the line after the header
+    :param range_queue: queue of (start of range, parse of range) tuples, None is queued once every range is queued
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    if header is None:  # Marks are parsed as a single range
+        await range_queue.put((None, loop.run_in_executor(executor, parse_marks_columns, marks_file)))
+    else:
+        range_count = max(1, (os.path.getsize(marks_file) - data_start) // pipeline_range_bytes)
+        for start, end in split_marks_byte_ranges(marks_file, data_start, range_count):
+            await range_queue.put((start, loop.run_in_executor(executor, parse_marks_byte_range, marks_file, header,
+                                                               start, end)))
+    await range_queue.put(None)
+
+
+# Sum parsed ranges of marks into running sums of points in order of file, as ranges are parsed
+async def accumulate_marks_range_parses(executor: ProcessPoolExecutor, marks_file: str, header: list,
+                                        range_queue: asyncio.Queue, student_data: dict, school_ids: SchoolIds):
+    """
+    :param executor: pool of processes parsing input files
+    :param marks_file: path to marks csv file
+    :param header: column names of marks, used to parse the rest of marks once a range holds quoted values
+    :param range_queue: queue filled by produce_marks_range_parses
+    :param student_data: Dictionary containing all students (as objects, keys are student ids)
+    :param school_ids: SchoolIds of courses and tests, marks are joined to courses and weights by test index
+    :return: number of rows of marks summed
+    """
+    loop = asyncio.get_running_loop()
+    marks_count = 0
+    while (queued_range := await range_queue.get()) is not None:
+        start, range_parse = queued_range
+        marks_columns = await range_parse  # Errors of earlier ranges are raised first
+        if marks_columns is None:  # Range holds quoted values, which may hold new lines, so the rest is one range
+            marks_columns = await loop.run_in_executor(executor, parse_marks_byte_range, marks_file, header, start,
+                                                       None, True)
+            queued_range = None
+        accumulate_student_course_points(student_data, school_ids, zip(*marks_columns))
+        marks_count += len(marks_columns[0])
+        if queued_range is None:
+            break
+
+    return marks_count
+
+
+# Write students in order of id from a writer thread while later students are averaged, students are handed in batches
+async def write_students_pipelined(json_writer: JSONWriter, student_data: dict, course_data: dict, output_format: str,
+                                   shard_size: int, course_stats: bool):
+    """
+    :return: number of students written to output file, see write_student_entries
+    """
+    loop = asyncio.get_running_loop()
+    student_queue = asyncio.Queue(maxsize=pipeline_student_batches)  # None is queued once every student is queued
+
+    # Run in the writer thread, waits for the event loop to hand over the next batch
+    def next_batch():
+        return asyncio.run_coroutine_threadsafe(student_queue.get(), loop).result()
+
+    queued_students = (s for batch in iter(next_batch, None) for s in batch)
+    writer = loop.run_in_executor(None, write_student_entries, json_writer, queued_students, course_data,
+                                  output_format, shard_size, course_stats)
+
+    async def hand_to_writer(batch):
+        if writer.done():  # Writer only finishes before every batch is handed over if it stopped with an error
+            return await writer
+        put = asyncio.ensure_future(student_queue.put(batch))
+        await asyncio.wait((put, writer), return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():  # Writer stopped with an error while the queue was full
+            put.cancel()
+            return await writer
+
+    try:
+        batch = []
+        for student in generate_averaged_students(student_data, from_points=True):
+            batch.append(student)
+            if len(batch) == pipeline_student_batch_size:
+                await hand_to_writer(batch)
+                batch = []
+        await hand_to_writer(batch)
+    finally:  # Writer thread always finishes, even when averaging is stopped by an error
+        await hand_to_writer(None)
+
+    return await writer
+
+
+# Run stages of processing at the same time with bounded queues between them, output matches streaming
+async def generate_admin_data_pipelined(json_writer: JSONWriter, input_files: list, parse_workers: int,
+                                        output_format: str, shard_size: int, course_stats: bool,
+                                        stage_metrics: StageMetrics):
+    """
+    Catalogs and byte ranges of marks are parsed at the same time across a pool of parse_workers processes. Parsed
+    ranges are summed into running sums of points in order of file while later ranges are still being parsed, and
+    once every mark is summed students are averaged while a thread writes earlier students. Errors are the same as when
+    streaming: catalogs are checked first, then marks. As each stage overlaps the next, they are recorded as a single
+    pipeline stage when metrics are switched on.
 
-    # Compute averages for students in student_data
-    compute_student_averages(student_data)
+    :param json_writer: JSONWriter of the run, output file already set
+    :param input_files: list with input csv files as strings ordered as follows: courses, students, tests, and marks
+    :param stage_metrics: StageMetrics of the run, records each stage when metrics are switched on
+    (other parameters are validated options, see generate_admin_data)
+    :return: number of students written to output file
+    """
+    loop = asyncio.get_running_loop()
+    marks_file = input_files[marks_file_count]
+    with stage_metrics.stage('pipeline'), ProcessPoolExecutor(max_workers=parse_workers) as executor:
+        catalog_parses = [loop.run_in_executor(executor, parse_typed_rows_list, fc, f)
+                          for fc, f in enumerate(input_files[:-1])]
+        marks_error, marks_producer = None, None
+        range_queue = asyncio.Queue(maxsize=parse_workers * pipeline_ranges_per_worker)
+        try:
+            try:  # Errors of marks are raised once catalogs have been parsed, as when marks are streamed
+                header, data_start = read_marks_header(marks_file)
+                marks_producer = asyncio.create_task(produce_marks_range_parses(executor, marks_file, header,
+                                                                                data_start, range_queue))
+            except AdminDataError as error:
+                marks_error = error
+
+            # Catalogs are awaited in order of file, so the error reported is the one of the first bad file
+            courses_rows, students_rows, tests_rows = [await catalog_parse for catalog_parse in catalog_parses]
+            if marks_error is not None:
+                raise marks_error
+            course_data = generate_data_dict(stage_metrics.count_rows('courses', courses_rows), isCourse=True)
+            student_data = generate_data_dict(stage_metrics.count_rows('students', students_rows), isStudent=True)
+            test_data = generate_data_dict(stage_metrics.count_rows('tests', tests_rows), isTest=True)
+            school_ids = SchoolIds(course_data, test_data)
+
+            marks_count = await accumulate_marks_range_parses(executor, marks_file, header, range_queue,
+                                                              student_data, school_ids)
+            stage_metrics.set_row_count('marks', marks_count)
+        finally:  # Parses not yet needed are dropped when a catalog or range stops with an error
+            for catalog_parse in catalog_parses:
+                if not catalog_parse.cancel() and not catalog_parse.cancelled():  # Errors of later files are dropped
+                    catalog_parse.exception()
+            if marks_producer is not None:
+                marks_producer.cancel()
+            while not range_queue.empty():
+                queued_range = range_queue.get_nowait()
+                if queued_range is not None:
+                    queued_range[1].cancel()
+
+        check_course_test_weights(school_ids)
+        students_written = await write_students_pipelined(json_writer, student_data, course_data, output_format,
+                                                          shard_size, course_stats)
+        stage_metrics.set_row_count('students_written', students_written)
+
+    return students_written
+
+
+# Look up a single student's entry in a database loaded by the sqlite engine, without reading input files
+def generate_sqlite_student_entry(database: str, student_id: int):
+    """
+    Input files are not parsed, so a database whose input files changed (or are missing) since it was loaded is an
+    error rather than a source of stale averages. A run with the sqlite engine and the same database loads it again.
+
+    :param database: path to database file loaded by a run with the sqlite engine
+    :param student_id: id of student to look up
+    :return: student entry dict (as in output file), or None if there is no student with student_id in database
+    """
+    connection = connect_school_database(database)
+    try:
+        loaded_input_files = read_loaded_input_files(connection)
+        if not loaded_input_files:
+            handle_error(f'Database with path {database} has not been loaded from input files.')
+        elif not school_database_current(connection, input_file_fingerprints(loaded_input_files)):
+            handle_error(f'Database with path {database} is out of date, its input files changed since it was loaded. '
+                         f'Run the admin tool with the sqlite engine and this database to load it again.')
+        student_row = read_student_row(connection, student_id)
+        if student_row is None:
+            return None
+        student_data = generate_data_dict([student_row], isStudent=True)
+        course_data = generate_data_dict(read_catalog_rows(connection)[0], isCourse=True)
+        compute_student_course_points_sqlite(connection, student_data, student_id)
+    finally:
+        connection.close()
+
+    return next(generate_school_data_student_entries(generate_averaged_students(student_data, from_points=True),
+                                                     course_data))
+
+
+# Serves to run the admin tool for a single context, returns a result rather than exiting so it can be called repeatedly
+def run_admin_data(context: AdminRunContext):
+    """
+    Errors other than AdminDataError (bugs, or errors of the system such as a full disk) also only stop this run, so
+    callers running many runs (e.g. schools of a batch) carry on.
+
+    :param context: AdminRunContext holding input files, output file, options and json writer of the run
+    :return: AdminRunResult, holding error message of run if an error stopped it (error is written to output file)
+    """
+    try:
+        students_written = generate_admin_data(context.json_writer, *context.input_files, context.output_file,
+                                               **context.options)
+    except AdminDataError as error:  # Write error (or report of errors when validating) to output file of this run only
+        write_error_json(error.error_message, context.json_writer, error.error_as_dict())
+        return AdminRunResult(context.output_file, error_message=error.error_message)
+    except Exception as error:  # Unexpected errors are written as an error json too, rather than left to the caller
+        error_message = f'Unexpected error while processing admin data: {type(error).__name__}: {error}'
+        try:
+            write_error_json(error_message, context.json_writer)
+        except OSError:  # Output file cannot be written, error is still held by the result
+            pass
+        return AdminRunResult(context.output_file, error_message=error_message)
 
-    # Generate school data json object for output
-    json_output = generate_school_data_json_object(student_data, course_data)
+    return AdminRunResult(context.output_file, students_written=students_written)
 
-    # Write school data json object to output file
-    json_writer.write_json_to_output_file(json_output)
+
+# Serves to process data from input files and convert them to json
+def process_admin_data(courses_file: str, students_file: str, tests_file: str, marks_file: str, output_file: str,
+                       **options):
+    """
+    This is the main driver function for this library. It is separated from the main start below so one can write unit
+    test cases from other files and directly call this function. Such a file that makes use of this is the unit test
+    file for this library called docs/test_admin_tool.py. To process data without exiting, use run_admin_data.
+
+    :param courses_file: Contains path to courses csv file
+    :param students_file: Contains path to students csv file
+    :param tests_file: Contains path to tests csv file
+    :param marks_file: Contains path to marks csv file
+    :param output_file: Contains path to desired output file
+    :param options: optional keyword arguments of generate_admin_data (e.g. streaming, engine, workers)
+    :return: Nothing, exits with 0 if processing finished successfully and -1 if an error stopped it
+    """
+    result = run_admin_data(AdminRunContext(courses_file, students_file, tests_file, marks_file, output_file,
+                                            **options))
 
     # Print successful finish and exit
-    print(f'Execution finished successfully, output can be viewed at {output_file}')
-    sys.exit(0)
+    if result.succeeded:
+        print(f'Execution finished successfully, output can be viewed at {output_file}')
+    sys.exit(result.exit_code)
+
+
+# Find school datasets in a directory, each subdirectory holding all of the input csv files is a school
+def find_school_datasets(schools_dir: str):
+    """
+    :param schools_dir: path to directory with a subdirectory for each school
+    :return: sorted list of names of school subdirectories holding courses, students, tests and marks csv files
+    """
+    try:
+        school_names = sorted(os.listdir(schools_dir))
+    except OSError:
+        handle_error(f'Cannot read schools directory with path: {schools_dir}')
+
+    return [n for n in school_names
+            if all(os.path.isfile(os.path.join(schools_dir, n, f)) for f in batch_input_file_names)]
+
+
+# Run the admin tool for a single school of a batch, called within a process of the batch worker pool
+def run_school_admin_data(school_dir: str, output_file: str, options: dict):
+    """
+    :param school_dir: path to school subdirectory holding input csv files (see batch_input_file_names)
+    :param output_file: path to output file of school
+    :param options: keyword arguments of generate_admin_data
+    :return: dict of AdminRunResult of school (see result_as_dict), a failed result if any error stopped the school
+    """
+    input_files = [os.path.join(school_dir, f) for f in batch_input_file_names]
+    return run_admin_data(AdminRunContext(*input_files, output_file, **options)).result_as_dict()
+
+
+# Serves to process a directory of schools at once, each school is processed in a process of a worker pool
+def process_admin_data_batch(schools_dir: str, output_dir: str, batch_workers: int = 1, **options):
+    """
+    An interpreter is started once for all schools, rather than once for each school. Each school's output (or error)
+    is written to output_dir/<school>.json, an error in one school does not stop other schools from being processed.
+
+    :param schools_dir: path to directory with a subdirectory for each school, see find_school_datasets
+    :param output_dir: path to directory output files are written to, created if it does not exist
+    :param batch_workers: number of processes schools are processed across
+    :param options: keyword arguments of generate_admin_data applied to every school (state and delta are not allowed)
+    :return: dict with keys as school names and values as dicts of each school's result (see result_as_dict)
+    """
+    if batch_workers < 1:
+        handle_error(f'Invalid number of batch workers specified: {batch_workers}. At least 1 worker is required.')
+    if options.get('state') is not None or options.get('delta'):
+        handle_error('A state file cannot be used when processing a batch of schools.')
+
+    school_names = find_school_datasets(schools_dir)
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+    except OSError:
+        handle_error(f'Cannot create output directory with path: {output_dir}')
+
+    output_suffix = '.json' + compressed_file_suffixes.get(options.get('compression'), '')  # e.g. .json.gz
+    with ProcessPoolExecutor(max_workers=batch_workers) as executor:
+        school_runs = {n: executor.submit(run_school_admin_data, os.path.join(schools_dir, n),
+                                          os.path.join(output_dir, n + output_suffix), options)
+                       for n in school_names}
+
+        return {n: school_runs[n].result() for n in school_names}
 
 
 # Supply File Path Arguments of Input to main
 def supply_arguments():
     """
-    :return: paths to output file and necessary csv inputs: courses, students, tests, and marks
+    :return: paths to output file and necessary csv inputs: courses, students, tests, and marks (or schools directory
+    and output directory when --batch is given), as well as a dict of options given as flags (keys are keyword
+    arguments of process_admin_data or process_admin_data_batch)
     """
-    # Validate number of arguments to be 5 filenames (strings: input filenames + output filename)
-    args = sys.argv
-    num_args = len(args) - 1  # -1 to negate entry for main.py (at sys.argv[0]) in length
-    if num_args < 5:  # Not enough file names specified
+    # Separate optional flags (e.g. --streaming) from file names, sys.argv[0] is main.py
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    options = supply_options([a for a in sys.argv[1:] if a.startswith('--')])
+
+    # Validate number of arguments to be 5 filenames (strings: input filenames + output filename), or 2 directories
+    num_args = len(args)
+    expected_args = 2 if options.get('batch') else 5
+    if num_args < expected_args:  # Not enough file names specified
         handle_error('Too few file names specified in command line arguments.')
-    elif num_args > 5:  # Too many file names specified
+    elif num_args > expected_args:  # Too many file names specified
         handle_error('Too many file names specified in command line arguments.')
 
-    return args[1:]
+    return args, options
+
+
+# Convert optional flags from command line into keyword arguments for process_admin_data
+def supply_options(flags: list):
+    """
+    :param flags: list of command line arguments beginning with -- (e.g. --streaming)
+    :return: dict with keys as option names (dashes replaced by underscores) and values converted per supported_options
+    """
+    options = {}
+    for flag in flags:
+        name, _, value = flag[2:].partition('=')
+        if name not in supported_options:  # Unknown option
+            handle_error(f'Unknown option specified in command line arguments: {flag}')
+
+        option_type = supported_options[name]
+        if option_type is bool:  # Boolean options are switched on by their flag alone
+            options[name.replace('-', '_')] = True
+            continue
+
+        try:  # Other options are converted from the value given after =
+            options[name.replace('-', '_')] = option_type(value)
+        except ValueError:
+            handle_error(f'Invalid value specified for option in command line arguments: {flag}')
+
+    return options
+
+
+# Read bytes of marks of a watched school up to and including its header line, rows appended later are read after it
+def marks_header_bytes(marks_bytes: bytes):
+    """
+    :param marks_bytes: bytes of marks csv file
+    :return: bytes of marks up to the end of the first line which is not blank (the header), None if there is none
+    """
+    header_end = 0
+    for line in marks_bytes.splitlines(keepends=True):
+        header_end += len(line)
+        if line.strip(b'\r\n'):  # Blank lines before header are skipped, as when parsing
+            return marks_bytes[:header_end]
+
+    return None
+
+
+# Read typed rows of marks of a watched school, recording the bytes read so rows appended to them can be found later
+def read_watched_marks(watched_school: WatchedSchool):
+    """
+    :param watched_school: WatchedSchool whose marks are read
+    :return: iterable of typed rows of marks, read from a single snapshot of the file's bytes
+    """
+    marks_file = watched_school.input_files[marks_file_count]
+    watched_school.marks_size = watched_school.marks_digest = watched_school.marks_header = None
+    open_school_data_file(marks_file).close()  # Missing and empty files produce the same errors as when parsing
+    if input_file_compression(marks_file) is not None:  # Compressed marks are read again in full once changed
+        return stream_typed_rows(marks_file_count, marks_file)
+
+    with open(marks_file, 'rb') as marks_input:
+        marks_bytes = marks_input.read()
+    if marks_bytes.endswith(b'\n'):  # Rows can only be appended after a complete last line
+        watched_school.marks_size, watched_school.marks_digest = len(marks_bytes), marks_bytes_digest(marks_bytes)
+        watched_school.marks_header = marks_header_bytes(marks_bytes)
+
+    # Rows are read as they are from marks opened in text mode (same encoding and handling of new lines)
+    return read_typed_rows(marks_file_count, marks_file, io.TextIOWrapper(io.BytesIO(marks_bytes), newline=None))
+
+
+# Read typed rows appended to marks of a watched school since its marks were last read
+def read_appended_watched_marks(watched_school: WatchedSchool):
+    """
+    :param watched_school: WatchedSchool whose marks are read
+    :return: list of typed rows appended to marks, or None if marks changed in any other way (then marks are read again
+    in full, see read_watched_marks)
+    """
+    marks_file = watched_school.input_files[marks_file_count]
+    if watched_school.marks_header is None or input_file_compression(marks_file) is not None:
+        return None
+    try:
+        with open(marks_file, 'rb') as marks_input:
+            marks_bytes = marks_input.read()
+    except OSError:
+        return None
+    marks_size = watched_school.marks_size
+    if len(marks_bytes) <= marks_size or not marks_bytes.endswith(b'\n') or \
+            marks_bytes_digest(marks_bytes[:marks_size]) != watched_school.marks_digest:
+        return None
+
+    appended_lines = io.TextIOWrapper(io.BytesIO(watched_school.marks_header + marks_bytes[marks_size:]), newline=None)
+    appended_rows = list(read_typed_rows(marks_file_count, marks_file, appended_lines))
+    watched_school.marks_size, watched_school.marks_digest = len(marks_bytes), marks_bytes_digest(marks_bytes)
+
+    return appended_rows
+
+
+# Compute course averages and total average of students whose course points changed
+def compute_watched_student_averages(student_data: dict, student_ids):
+    for s_id in student_ids:
+        student = student_data[s_id]
+        student.course_averages = {}  # Cleared so averages match those of a student averaged once
+        student.compute_course_averages_from_points()
+        student.compute_total_average()
+
+
+# Load every input file of a watched school, summing marks into running sums of points (as when streaming)
+def load_watched_school(watched_school: WatchedSchool):
+    """
+    :param watched_school: WatchedSchool to load, unloaded first so a load stopped by an error leaves nothing behind
+    :return: None, serves to set courses, students and tests of watched school with averages of each student computed
+    """
+    watched_school.unload()
+    courses_file, students_file, tests_file, _ = watched_school.input_files
+    courses_rows, students_rows, tests_rows = [parse_typed_rows(fc, f) for fc, f in
+                                               enumerate((courses_file, students_file, tests_file))]
+    marks_rows = read_watched_marks(watched_school)
+
+    course_data = generate_data_dict(courses_rows, isCourse=True)
+    student_data = generate_data_dict(students_rows, isStudent=True)
+    test_data = generate_data_dict(tests_rows, isTest=True)
+    school_ids = SchoolIds(course_data, test_data)
+    accumulate_student_course_points(student_data, school_ids, marks_rows)
+    check_course_test_weights(school_ids)
+    compute_watched_student_averages(student_data, student_data)
+
+    watched_school.course_data, watched_school.student_data, watched_school.test_data, watched_school.school_ids = \
+        course_data, student_data, test_data, school_ids
+
+
+# Regenerate output of a watched school once input files change, redoing only what the changed files affect
+def regenerate_watched_admin_data(watched_school: WatchedSchool, changed_files: set):
+    """
+    Changed tests, or courses and students whose ids changed, reload every input file. Otherwise changed courses and
+    students only update names and teachers in entries (averages are kept), rows appended to marks are added to
+    running sums of the students they belong to (only these students are averaged again), and other changes to marks
+    sum every row of marks again without parsing courses, students or tests.
+
+    :param watched_school: WatchedSchool to regenerate output of (loaded in full if it is not loaded)
+    :param changed_files: positions (file counts) of input files which changed since output was last written
+    :return: description of what was regenerated
+    """
+    courses_file, students_file, _, _ = watched_school.input_files
+    regenerated = []
+    if not watched_school.loaded or 2 in changed_files:
+        load_watched_school(watched_school)
+        regenerated.append('every input file loaded')
+    else:
+        if 0 in changed_files:  # Course names and teachers are rendered in entries, averages do not depend on them
+            course_data = generate_data_dict(parse_typed_rows(0, courses_file), isCourse=True)
+            if course_data.keys() != watched_school.course_data.keys():
+                return regenerate_watched_admin_data(watched_school, {2})
+            school_ids = SchoolIds(course_data, watched_school.test_data)
+            check_course_test_weights(school_ids)
+            watched_school.course_data, watched_school.school_ids = course_data, school_ids
+            regenerated.append('course entries rerendered')
+
+        if 1 in changed_files:
+            student_data = generate_data_dict(parse_typed_rows(1, students_file), isStudent=True)
+            if student_data.keys() != watched_school.student_data.keys():
+                return regenerate_watched_admin_data(watched_school, {2})
+            for s_id in student_data:
+                watched_school.student_data[s_id].name = student_data[s_id].name
+            regenerated.append('student names rerendered')
+
+        if marks_file_count in changed_files:
+            student_data, school_ids = watched_school.student_data, watched_school.school_ids
+            appended_rows = read_appended_watched_marks(watched_school)
+            if appended_rows is None:  # Marks were rewritten, sums of every student are computed again
+                for student in student_data.values():
+                    student.course_points = student.course_tests = None
+                accumulate_student_course_points(student_data, school_ids, read_watched_marks(watched_school))
+                compute_watched_student_averages(student_data, student_data)
+                regenerated.append('every student recomputed')
+            else:
+                accumulate_student_course_points(student_data, school_ids, appended_rows)
+                appended_student_ids = {student_id for _, student_id, _ in appended_rows}
+                compute_watched_student_averages(student_data, appended_student_ids)
+                regenerated.append(f'{len(appended_student_ids)} students with appended marks recomputed')
+
+    student_data = watched_school.student_data
+    write_student_entries(watched_school.json_writer, (student_data[s_id] for s_id in sorted(student_data)),
+                          watched_school.course_data, watched_school.output_format, watched_school.shard_size,
+                          watched_school.course_stats)
+
+    return ', '.join(regenerated) if regenerated else 'nothing changed'
+
+
+# Serves to keep output up to date with input files, regenerating it whenever input files change until stopped
+def watch_admin_data(courses_file: str, students_file: str, tests_file: str, marks_file: str, output_file: str,
+                     watch_interval_ms: int = default_watch_interval_ms, debounce_ms: int = default_debounce_ms,
+                     stop_event=None, **options):
+    """
+    Input files are polled every watch_interval_ms, and once changed files are unchanged for debounce_ms output is
+    regenerated (see regenerate_watched_admin_data). Marks are summed into running sums of points, as when streaming.
+    Errors are written to output file and watching goes on, the next change loads every input file.
+
+    :param watch_interval_ms: milliseconds between polls of input files
+    :param debounce_ms: milliseconds changed input files must be unchanged for before output is regenerated
+    :param stop_event: threading.Event which stops watching once set, None to watch until interrupted
+    :param options: options deciding how output is written, see watch_supported_options and generate_admin_data
+    :return: None
+    """
+    unsupported_options = [o for o in options if o not in watch_supported_options]
+    if unsupported_options:
+        handle_error(f'Option {unsupported_options[0]} cannot be used with watch mode. Options which can be used are: '
+                     f'{", ".join(watch_supported_options)}.')
+    if watch_interval_ms < 1 or debounce_ms < 0:
+        handle_error(f'Invalid watch interval or debounce specified: {watch_interval_ms} ms, {debounce_ms} ms.')
+    check_output_options(options.get('output_format', 'json'), options.get('shard_size'), options.get('compression'))
+
+    input_files = [courses_file, students_file, tests_file, marks_file]
+    watched_school = WatchedSchool(input_files, output_file, **options)
+    input_file_watcher = InputFileWatcher(input_files)  # Changes made while output is first generated are found
+    changed_files = set()
+    while changed_files is not None:
+        try:
+            regenerated = regenerate_watched_admin_data(watched_school, changed_files)
+            print(f'Output regenerated ({regenerated}), output can be viewed at {output_file}')
+        except AdminDataError as error:  # Error is written to output file, every input file is loaded on next change
+            write_error_json(error.error_message, watched_school.json_writer, error.error_as_dict())
+            watched_school.unload()
+
+        changed_files = input_file_watcher.wait_for_changes(watch_interval_ms, debounce_ms, stop_event)
 
 
 # Example run of main.py
 # python main.py courses.csv students.csv tests.csv marks.csv output.json
+# python main.py courses.csv students.csv tests.csv marks.csv output.json --streaming
+# python main.py courses.csv students.csv tests.csv marks.csv output.json --engine=numpy
+# python main.py courses.csv students.csv tests.csv marks.csv output.json --workers=8
+# python main.py courses.csv students.csv tests.csv marks.csv output.json --state=state.json
+# python main.py courses.csv students.csv tests.csv marks_appended.csv output.json --state=state.json --delta
+# python main.py courses.csv students.csv tests.csv marks.csv output.json --cache-dir=.admin_tool_cache
+# python main.py courses.csv students.csv tests.csv marks.csv output.json --metrics
+# python main.py schools/ outputs/ --batch --batch-workers=8
+# python main.py courses.csv students.csv tests.csv marks.csv report.json --validate --error-limit=1000
+# python main.py courses.csv students.csv tests.csv marks.csv output.ndjson --output-format=ndjson --shard-size=10000
+# python main.py courses.csv students.csv tests.csv marks.csv output.json --memory-limit=256
+# python main.py courses.csv students.csv tests.csv marks.csv output.json --engine=sqlite --database=school.db
+# python main.py courses.csv students.csv tests.csv marks.csv output.json --course-stats
+# python main.py courses.csv students.csv tests.csv marks.csv output.json.gz --compact --compression=gzip --fast-encoder
+# python main.py courses.csv students.csv tests.csv marks.csv output.json --watch --debounce-ms=2000
+# python main.py courses.csv students.csv tests.csv marks.csv output.json --pipeline --parse-workers=4
 if __name__ == '__main__':
     print("Starting admin tool from main...")
-    # Retrieve command line arguments and store necessary file paths (args validated in supply_arguments), create writer
-    courses_file_path, students_file_path, tests_file_path, marks_file_path, output_file_path = supply_arguments()
+    # Retrieve command line arguments and store necessary file paths (args validated in supply_arguments)
+    try:
+        file_paths, admin_options = supply_arguments()
+    except AdminDataError as argument_error:  # No output file is known yet, so the error is only printed
+        print(argument_error.error_message)
+        sys.exit(-1)
+
+    if admin_options.pop('batch', False):  # Process each school in schools directory, then print a summary
+        schools_dir_path, output_dir_path = file_paths
+        try:
+            batch_results = process_admin_data_batch(schools_dir_path, output_dir_path, **admin_options)
+        except AdminDataError as batch_error:
+            print(batch_error.error_message)
+            sys.exit(-1)
+
+        failed_schools = [n for n in batch_results if not batch_results[n]['succeeded']]
+        print(f'Batch finished, {len(batch_results) - len(failed_schools)} of {len(batch_results)} schools processed '
+              f'successfully, output can be viewed at {output_dir_path}')
+        for n in failed_schools:
+            print(f'School {n} failed: {batch_results[n]["error"]}')
+        sys.exit(-1 if failed_schools else 0)
+
+    courses_file_path, students_file_path, tests_file_path, marks_file_path, output_file_path = file_paths
+    admin_options.pop('batch_workers', None)  # Only used in batch mode
+
+    if admin_options.pop('watch', False):  # Keep output up to date as input files change, until interrupted
+        try:
+            watch_admin_data(courses_file_path, students_file_path, tests_file_path, marks_file_path, output_file_path,
+                             **admin_options)
+        except AdminDataError as watch_error:
+            print(watch_error.error_message)
+            sys.exit(-1)
+        except KeyboardInterrupt:
+            print('Stopped watching input files.')
+        sys.exit(0)
 
-    # Send file paths from supplied arguments to process_admin_data
-    process_admin_data(courses_file_path, students_file_path, tests_file_path, marks_file_path, output_file_path)
+    # Send file paths and options from supplied arguments to process_admin_data
+    process_admin_data(courses_file_path, students_file_path, tests_file_path, marks_file_path, output_file_path,
+                       **admin_options)
 
     sys.exit(0)
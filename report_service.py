@@ -0,0 +1,247 @@
+# General imports
+import io
+import os
+import sys
+import json
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Local imports
+from main import generate_data_dict, check_course_test_weights, associate_student_marks, associate_student_courses, \
+    accumulate_student_course_points, generate_averaged_students, generate_school_data_student_entries
+from common.handle_errors import AdminDataError, handle_error
+from common.parse_school_csvs import stream_typed_rows, read_typed_rows, open_school_data_file, marks_file_count
+from common.JSONWriter import JSONWriter
+from common.school_ids import SchoolIds
+
+# Global values for the report service
+catalog_file_counts = (0, 1, 2)  # File counts of courses, students and tests, see common/parse_school_csvs.py
+uploaded_marks_name = 'uploaded marks'  # Name of marks sent in a request body, used in error messages
+default_service_port = 8080
+
+
+# Fingerprint of a catalog file, a file is reloaded once its size or modified time changes
+def catalog_file_fingerprint(f: str):
+    """
+    :param f: path to catalog csv file
+    :return: tuple ordered as follows: size and modified time (ns) of f
+    """
+    open_school_data_file(f).close()  # Missing and empty files produce the same errors as when parsing
+    file_stat = os.stat(f)
+    return file_stat.st_size, file_stat.st_mtime_ns
+
+
+# A class which keeps courses, students and tests loaded between reports, reloading a file only once it changes
+class WarmCatalog:
+    def __init__(self, courses_file: str, students_file: str, tests_file: str):
+        self.catalog_files = [courses_file, students_file, tests_file]
+        self.fingerprints = [None, None, None]  # Fingerprint of each catalog file when it was last loaded
+        self.catalog_rows = [None, None, None]  # Typed rows of each catalog file
+        self.course_data = None  # Courses with test weights checked, shared by reports as they are never modified
+        self.test_data = None
+        self.school_ids = None  # Dense indices of courses and tests, see common/school_ids.py
+        self.reload_count = 0  # Number of catalog files loaded, including the first load of each file
+        self.lock = threading.Lock()  # Held while checking and reloading files, requests are handled in threads
+
+    # Reload catalog files which have changed since they were last loaded, returns the catalog reports should use
+    def refresh(self):
+        """
+        :return: tuple ordered as follows: course data, student typed rows, test data and school ids. Students are
+        created from rows for each report, as students are filled out with marks and averages while a report is
+        generated.
+        """
+        with self.lock:
+            changed = [fc for fc in catalog_file_counts
+                       if catalog_file_fingerprint(self.catalog_files[fc]) != self.fingerprints[fc]]
+            if changed:
+                self.reload_catalog_files(changed)
+
+            return self.course_data, self.catalog_rows[1], self.test_data, self.school_ids
+
+    # Parse changed catalog files and validate them as a run of the admin tool would, catalog is kept if one is invalid
+    def reload_catalog_files(self, changed: list):
+        """
+        :param changed: file counts of catalog files to reload
+        :return: None, serves to replace rows, courses and tests of catalog once all of them are valid
+        """
+        fingerprints, catalog_rows = list(self.fingerprints), list(self.catalog_rows)
+        for fc in changed:  # Fingerprint is taken before parsing, a file changed while parsing is reloaded next time
+            fingerprints[fc] = catalog_file_fingerprint(self.catalog_files[fc])
+            catalog_rows[fc] = list(stream_typed_rows(fc, self.catalog_files[fc]))
+
+        # Courses are created again as checking weights adds test weights to them
+        course_data = generate_data_dict(catalog_rows[0], isCourse=True)
+        generate_data_dict(catalog_rows[1], isStudent=True)  # Students are checked for duplicates once on load
+        test_data = generate_data_dict(catalog_rows[2], isTest=True)
+        school_ids = SchoolIds(course_data, test_data)
+        check_course_test_weights(school_ids)
+
+        self.fingerprints, self.catalog_rows = fingerprints, catalog_rows
+        self.course_data, self.test_data, self.school_ids = course_data, test_data, school_ids
+        self.reload_count += len(changed)
+
+
+# Generate a report from marks against a warm catalog, report text matches an output file written by main.py
+def generate_report(catalog: WarmCatalog, marks_name: str, marks_file, streaming: bool = False):
+    """
+    :param catalog: WarmCatalog of courses, students and tests, refreshed before marks are processed
+    :param marks_name: name of marks input (path or uploaded_marks_name), used in error messages
+    :param marks_file: opened marks csv file (or text stream of an uploaded marks csv)
+    :param streaming: boolean to determine whether marks are added to running sums of points (see main.py)
+    :return: report json as a string, throws AdminDataError if catalog or marks are invalid
+    """
+    course_data, students_rows, _, school_ids = catalog.refresh()
+    student_data = generate_data_dict(students_rows, isStudent=True)
+    marks_rows = read_typed_rows(marks_file_count, marks_name, marks_file)
+
+    if streaming:
+        accumulate_student_course_points(student_data, school_ids, marks_rows)
+    else:
+        associate_student_marks(student_data, marks_rows, school_ids)
+        associate_student_courses(student_data, school_ids)
+
+    report = io.StringIO()
+    JSONWriter().write_students_to_file(report, generate_school_data_student_entries(
+        generate_averaged_students(student_data, from_points=streaming), course_data))
+
+    return report.getvalue()
+
+
+# A class which handles report requests, marks are given as a path (GET) or uploaded as a csv request body (POST)
+#   GET /report?marks=path/to/marks.csv
+#   POST /report with marks csv as body
+# Adding streaming=1 to the query adds marks to running sums of points, as --streaming does in main.py
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    # Serves report for marks at a path on the machine running the service
+    def do_GET(self):
+        request_url = urlparse(self.path)
+        query = parse_qs(request_url.query)
+        if request_url.path != '/report':
+            self.send_json(404, {"error": f'No such path: {request_url.path}'})
+        elif 'marks' not in query:
+            self.send_json(400, {"error": 'Path to marks must be given as marks in query of request.'})
+        else:
+            self.send_report(query, lambda: open_school_data_file(query['marks'][0]), query['marks'][0])
+
+    # Serves report for marks uploaded as the body of the request
+    def do_POST(self):
+        request_url = urlparse(self.path)
+        if request_url.path != '/report':
+            self.send_json(404, {"error": f'No such path: {request_url.path}'})
+            return
+
+        content_length = self.headers.get('Content-Length', '0')
+        try:
+            content_length = int(content_length)
+            if content_length < 0:
+                raise ValueError(content_length)
+        except ValueError:
+            self.send_json(400, {"error": f'Invalid Content-Length of request: {content_length}.'})
+            return
+        try:
+            marks_content = self.rfile.read(content_length).decode('utf-8')
+        except UnicodeDecodeError:
+            self.send_json(400, {"error": 'Uploaded marks must be encoded as UTF-8.'})
+            return
+
+        self.send_report(parse_qs(request_url.query), lambda: open_uploaded_marks(marks_content), uploaded_marks_name)
+
+    # Generate report and send it, errors in catalog or marks are sent as an error json (as written by main.py)
+    def send_report(self, query: dict, open_marks, marks_name: str):
+        """
+        :param query: parsed query of request
+        :param open_marks: function returning opened marks file, called once the report is being generated
+        :param marks_name: name of marks input, used in error messages
+        :return: None, serves to send report (200), error in input (400) or unexpected error (500) as response
+        """
+        try:
+            with open_marks() as marks_file:
+                report = generate_report(self.server.catalog, marks_name, marks_file,
+                                         streaming=query.get('streaming', ['0'])[0] not in ('0', 'false'))
+        except AdminDataError as error:
+            self.send_json(400, {"error": error.error_message})
+            return
+        except Exception as error:  # Any other error is sent rather than leaving the request without a response
+            self.send_json(500, {"error": f'Unexpected error while generating report: {type(error).__name__}: {error}'})
+            return
+
+        self.send_response_body(200, report)
+
+    # Send a dict as a json response, formatted as JSONWriter formats output files
+    def send_json(self, status: int, json_data: dict):
+        self.send_response_body(status, json.dumps(json_data, indent=2) + "\n")
+
+    # Send a json string as a response
+    def send_response_body(self, status: int, body: str):
+        encoded_body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded_body)))
+        self.end_headers()
+        self.wfile.write(encoded_body)
+
+
+# Open marks uploaded in a request as a text stream, empty uploads produce the same error as empty files
+def open_uploaded_marks(marks_content: str):
+    """
+    :param marks_content: csv content of uploaded marks
+    :return: text stream of marks_content
+    """
+    if not marks_content:
+        handle_error(f'Input file: {uploaded_marks_name}, has no data in it.')
+
+    return io.StringIO(marks_content)
+
+
+# A class which serves reports over HTTP, each request is handled in its own thread against the same warm catalog
+class ReportServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address: tuple, catalog: WarmCatalog):
+        super().__init__(server_address, ReportRequestHandler)
+        self.catalog = catalog
+
+
+# Serves to load the catalog once, then serve reports until interrupted
+def serve_reports(courses_file: str, students_file: str, tests_file: str, host: str = '127.0.0.1',
+                  port: int = default_service_port):
+    """
+    :param courses_file: Contains path to courses csv file
+    :param students_file: Contains path to students csv file
+    :param tests_file: Contains path to tests csv file
+    :param host: address to listen on, local only by default
+    :param port: port to listen on
+    :return: None, serves reports until interrupted (Ctrl+C)
+    """
+    catalog = WarmCatalog(courses_file, students_file, tests_file)
+    catalog.refresh()  # Load catalog before serving, so invalid catalogs are found on start
+
+    with ReportServer((host, port), catalog) as report_server:
+        print(f'Serving reports at http://{host}:{report_server.server_address[1]}/report')
+        try:
+            report_server.serve_forever()
+        except KeyboardInterrupt:
+            print('Report service stopped.')
+
+
+# Example run of report_service.py, reports can then be requested as below
+# python report_service.py courses.csv students.csv tests.csv --port=8080
+# curl 'http://127.0.0.1:8080/report?marks=marks.csv'
+# curl --data-binary @marks.csv 'http://127.0.0.1:8080/report'
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve reports for marks against courses, students and tests kept '
+                                                 'loaded in memory.')
+    parser.add_argument('courses_file', help='path to courses csv file')
+    parser.add_argument('students_file', help='path to students csv file')
+    parser.add_argument('tests_file', help='path to tests csv file')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=default_service_port, help='port to listen on')
+    args = parser.parse_args()
+
+    try:
+        serve_reports(args.courses_file, args.students_file, args.tests_file, args.host, args.port)
+    except AdminDataError as catalog_error:
+        print(catalog_error.error_message)
+        sys.exit(-1)
@@ -1,9 +1,43 @@
 # General imports
+import os
+import time
 import unittest
+import tempfile
 import json
+import shutil
+import gzip
+import lzma
+import threading
+import tracemalloc
+import sqlite3
+import urllib.request
+import urllib.error
+import http.client
+from unittest import mock
 
 # Local Imports
-from main import process_admin_data
+from concurrent.futures import ThreadPoolExecutor
+from main import process_admin_data, run_admin_data, process_admin_data_batch, generate_sqlite_student_entry, \
+    regenerate_watched_admin_data, watch_admin_data, associate_student_marks, associate_student_courses, \
+    check_course_test_weights, supply_options, generate_data_dict, accumulate_student_course_points
+from common.file_watch import WatchedSchool
+from common.admin_run import AdminRunContext
+from common.handle_errors import AdminDataError
+from common.parse_school_csvs import stream_typed_rows
+from common.parallel_parsing import parse_school_data_files_parallel
+from common.integer_csv_reader import read_integer_csv_columns, parse_typed_rows
+from common.student_index import read_student_entry
+from report_service import WarmCatalog, ReportServer
+from common.student import Student
+from common.course import Course
+from common.test import Test as CourseTest  # Aliased so test runners do not collect it
+from common.numpy_engine import numpy_engine_available
+from common.JSONWriter import JSONWriter, fast_encoder_available
+from common.school_ids import SchoolIds
+from common.course_statistics import CourseStatistics
+from common.sharded_processing import accumulate_sharded_course_points
+from common.sqlite_engine import connect_school_database, read_catalog_rows
+from benchmarks.generate_school_data import generate_school_data
 
 
 def print_test_header(test_name: str = ""):
@@ -283,6 +317,1115 @@ class TestSchoolAdminTool(unittest.TestCase):
 
         print_test_finished(test_name)
 
+    def test_example_1_streaming(self):
+        test_name = 'Example 1 Test (Streaming Marks)'
+        print_test_header(test_name)
+
+        input_files = ["tests/Example1/courses.csv",  # Course data
+                       "tests/Example1/students.csv",  # Student data
+                       "tests/Example1/tests.csv",  # Test data
+                       "tests/Example1/marks.csv",  # Marks data
+                       "tests/test_outputs/outputExample1Streaming.json"]  # Desired output file
+
+        # Set output json to compare against
+        desired_output = "tests/Example1/output.json"  # Desired output for example 1 input, provided by project spec
+
+        # Run test, check output against desired output
+        with self.assertRaises(SystemExit) as system_exit:
+            process_admin_data(input_files[0], input_files[1], input_files[2], input_files[3], input_files[4],
+                               streaming=True)
+
+        self.assertEqual(system_exit.exception.code, 0)
+        self.assertTrue(json_content_equal("tests/test_outputs/outputExample1Streaming.json", desired_output, True,
+                                           True))
+
+        print_test_finished(test_name)
+
+    def test_duplicate_students_streaming(self):
+        test_name = "Duplicate Students (Streaming Marks)"
+        print_test_header(test_name)
+
+        input_files = ["tests/Example7DuplicateStudents/courses.csv",  # Course data
+                       "tests/Example7DuplicateStudents/students.csv",  # Student data
+                       "tests/Example7DuplicateStudents/tests.csv",  # Test data
+                       "tests/Example7DuplicateStudents/marks.csv",  # Marks data
+                       "tests/test_outputs/outputExample7DuplicateStudentsStreaming.json"]  # Desired output file
+
+        # Set output json to compare against
+        desired_output = {"error": "Duplicate found with id 1. Found with row: {'id': '1', 'name': 'D'}"}
+
+        # Run test, check output against desired output
+        with self.assertRaises(SystemExit) as system_exit:
+            process_admin_data(input_files[0], input_files[1], input_files[2], input_files[3], input_files[4],
+                               streaming=True)
+
+        self.assertEqual(system_exit.exception.code, -1)
+        self.assertTrue(
+            json_content_equal("tests/test_outputs/outputExample7DuplicateStudentsStreaming.json", desired_output,
+                               True, False))
+
+        print_test_finished(test_name)
+
+    def test_streamed_output_matches_known_output(self):
+        test_name = 'Streamed JSON Output Is Byte Identical To Known Outputs'
+        print_test_header(test_name)
+
+        # Examples with students and without any rows, outputs are written one student entry at a time
+        for example in ["Example1", "Example2", "Example3ColsNoRows"]:
+            output_file = "tests/test_outputs/output{0}.json".format(example)
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data("tests/{0}/courses.csv".format(example),
+                                   "tests/{0}/students.csv".format(example),
+                                   "tests/{0}/tests.csv".format(example),
+                                   "tests/{0}/marks.csv".format(example),
+                                   output_file)
+
+            self.assertEqual(system_exit.exception.code, 0)
+            with open(output_file, 'rb') as output, \
+                    open("tests/known_test_outputs/output{0}.json".format(example), 'rb') as known_output:
+                self.assertEqual(output.read(), known_output.read())
+
+        print_test_finished(test_name)
+
+
+    @unittest.skipUnless(numpy_engine_available, 'NumPy is not installed')
+    def test_example_2_numpy_engine(self):
+        test_name = 'Example 2 Test (NumPy Engine)'
+        print_test_header(test_name)
+
+        input_files = ["tests/Example2/courses.csv",  # Course data
+                       "tests/Example2/students.csv",  # Student data
+                       "tests/Example2/tests.csv",  # Test data
+                       "tests/Example2/marks.csv",  # Marks data
+                       "tests/test_outputs/outputExample2NumPy.json"]  # Desired output file
+
+        # Set output json to compare against
+        desired_output = "tests/Example2/output.json"  # Desired output for example 2 input, provided by project spec
+
+        # Run test, check output against desired output
+        with self.assertRaises(SystemExit) as system_exit:
+            process_admin_data(input_files[0], input_files[1], input_files[2], input_files[3], input_files[4],
+                               engine='numpy')
+
+        self.assertEqual(system_exit.exception.code, 0)
+        self.assertTrue(json_content_equal("tests/test_outputs/outputExample2NumPy.json", desired_output, True, True))
+
+        print_test_finished(test_name)
+
+    def test_example_1_workers(self):
+        test_name = 'Example 1 Test (Sharded Across Worker Processes)'
+        print_test_header(test_name)
+
+        input_files = ["tests/Example1/courses.csv",  # Course data
+                       "tests/Example1/students.csv",  # Student data
+                       "tests/Example1/tests.csv",  # Test data
+                       "tests/Example1/marks.csv",  # Marks data
+                       "tests/test_outputs/outputExample1Workers.json"]  # Desired output file
+
+        # Run test, sharded output must match known output byte for byte
+        with self.assertRaises(SystemExit) as system_exit:
+            process_admin_data(input_files[0], input_files[1], input_files[2], input_files[3], input_files[4],
+                               workers=2)
+
+        self.assertEqual(system_exit.exception.code, 0)
+        with open(input_files[4], 'rb') as output, open("tests/known_test_outputs/outputExample1.json", 'rb') as known:
+            self.assertEqual(output.read(), known.read())
+
+        # Each worker sums its own byte range of marks, merged sums match sums of marks streamed serially
+        course_data = generate_data_dict(stream_typed_rows(0, input_files[0]), isCourse=True)
+        test_data = generate_data_dict(stream_typed_rows(2, input_files[2]), isTest=True)
+        school_ids = SchoolIds(course_data, test_data)
+        sharded_students, streamed_students = [generate_data_dict(stream_typed_rows(1, input_files[1]), isStudent=True)
+                                               for _ in range(2)]
+        self.assertEqual(accumulate_sharded_course_points(sharded_students, school_ids, input_files[3], 3), 19)
+        accumulate_student_course_points(streamed_students, school_ids, stream_typed_rows(3, input_files[3]))
+        for s_id in streamed_students:
+            self.assertEqual((sharded_students[s_id].course_points, sharded_students[s_id].course_tests),
+                             (streamed_students[s_id].course_points, streamed_students[s_id].course_tests))
+
+        # A test marked in two ranges is found as sums are merged, marks are then left to be summed serially
+        with tempfile.TemporaryDirectory() as data_dir:
+            with open(input_files[3], 'r') as marks_input, open(data_dir + "/marks.csv", 'w') as marks_output:
+                marks_output.write(marks_input.read() + "2,1,60\n")
+            sharded_students = generate_data_dict(stream_typed_rows(1, input_files[1]), isStudent=True)
+            marks_count = accumulate_sharded_course_points(sharded_students, school_ids, data_dir + "/marks.csv", 3)
+            self.assertIsNone(marks_count)
+            self.assertTrue(all(s.course_tests is None for s in sharded_students.values()))
+
+        print_test_finished(test_name)
+
+    def test_delta_marks(self):
+        test_name = 'Marks Appended Since State Was Saved (Delta)'
+        print_test_header(test_name)
+
+        # Marks of Example 1 are split in two, the second file holds rows appended after the first run
+        input_files = ["tests/Example10DeltaMarks/courses.csv",  # Course data
+                       "tests/Example10DeltaMarks/students.csv",  # Student data
+                       "tests/Example10DeltaMarks/tests.csv",  # Test data
+                       "tests/Example10DeltaMarks/marks.csv",  # Marks data
+                       "tests/test_outputs/outputExample10DeltaMarks.json"]  # Desired output file
+        delta_marks_file = "tests/Example10DeltaMarks/marks_delta.csv"
+        state_file = "tests/test_outputs/stateExample10DeltaMarks.json"
+
+        # Run over initial marks, saving state
+        with self.assertRaises(SystemExit) as system_exit:
+            process_admin_data(input_files[0], input_files[1], input_files[2], input_files[3], input_files[4],
+                               state=state_file)
+        self.assertEqual(system_exit.exception.code, 0)
+
+        # Tests already marked are saved next to the points of their course
+        with open(state_file, 'r') as state_input:
+            saved_student = json.load(state_input)["students"]["1"]
+        self.assertEqual(saved_student["courseTests"].keys(), saved_student["coursePoints"].keys())
+
+        # Run over appended marks only, output must match a full run over all marks of Example 1
+        with self.assertRaises(SystemExit) as system_exit:
+            process_admin_data(input_files[0], input_files[1], input_files[2], delta_marks_file, input_files[4],
+                               state=state_file, delta=True)
+
+        self.assertEqual(system_exit.exception.code, 0)
+        with open(input_files[4], 'rb') as output, open("tests/known_test_outputs/outputExample1.json", 'rb') as known:
+            self.assertEqual(output.read(), known.read())
+
+        print_test_finished(test_name)
+
+    def test_example_1_cached_inputs(self):
+        test_name = 'Example 1 Test (Cached Typed Rows Of Inputs)'
+        print_test_header(test_name)
+
+        input_files = ["tests/Example1/courses.csv",  # Course data
+                       "tests/Example1/students.csv",  # Student data
+                       "tests/Example1/tests.csv",  # Test data
+                       "tests/Example1/marks.csv",  # Marks data
+                       "tests/test_outputs/outputExample1Cached.json"]  # Desired output file
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # First run parses every input file and caches its typed rows
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data(input_files[0], input_files[1], input_files[2], input_files[3], input_files[4],
+                                   cache_dir=cache_dir)
+            self.assertEqual(system_exit.exception.code, 0)
+
+            # Second run must not parse any input file, every file is loaded from cache
+            with mock.patch('common.input_cache.parse_typed_columns', side_effect=AssertionError('Input was parsed')):
+                with self.assertRaises(SystemExit) as system_exit:
+                    process_admin_data(input_files[0], input_files[1], input_files[2], input_files[3], input_files[4],
+                                       cache_dir=cache_dir)
+            self.assertEqual(system_exit.exception.code, 0)
+            self.assertFalse([f for f in os.listdir(cache_dir) if f.endswith('.tmp')])  # Entries were all replaced
+
+            # Cached marks are handed to the numpy engine as columns, output is the same
+            if numpy_engine_available:
+                with open(input_files[4], 'rb') as output:
+                    cached_output = output.read()
+                no_parse = mock.patch('common.input_cache.parse_typed_columns', side_effect=AssertionError('Parsed'))
+                with no_parse, self.assertRaises(SystemExit) as system_exit:
+                    process_admin_data(input_files[0], input_files[1], input_files[2], input_files[3], input_files[4],
+                                       cache_dir=cache_dir, engine='numpy')
+                self.assertEqual(system_exit.exception.code, 0)
+                with open(input_files[4], 'rb') as output:
+                    self.assertEqual(output.read(), cached_output)
+
+            # Entries which cannot be read (here truncated, or not cache entries at all) are misses, inputs are parsed
+            entry_paths = sorted(os.path.join(cache_dir, f) for f in os.listdir(cache_dir))
+            for entry_number, entry_path in enumerate(entry_paths):
+                with open(entry_path, 'rb') as entry_file:
+                    entry_bytes = entry_file.read()
+                with open(entry_path, 'wb') as entry_file:
+                    entry_file.write(entry_bytes[:-4] if entry_number % 2 else b'\x80\x04\x95garbage')
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data(input_files[0], input_files[1], input_files[2], input_files[3], input_files[4],
+                                   cache_dir=cache_dir)
+
+        self.assertEqual(system_exit.exception.code, 0)
+        with open(input_files[4], 'rb') as output, open("tests/known_test_outputs/outputExample1.json", 'rb') as known:
+            self.assertEqual(output.read(), known.read())
+
+        print_test_finished(test_name)
+
+    def test_generated_school_data(self):
+        test_name = 'Generated School Data Is Valid'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            row_counts = generate_school_data(data_dir, 500, courses=4, seed=1)
+            self.assertGreaterEqual(row_counts['marks'], 500)
+
+            # Test weights of each generated course add up to 100
+            with open(data_dir + "/tests.csv", 'r') as tests_file:
+                course_weights = {}
+                for test_row in list(tests_file)[1:]:
+                    _, course_id, weight = test_row.strip().split(',')
+                    course_weights[course_id] = course_weights.get(course_id, 0) + int(weight)
+            self.assertEqual(set(course_weights.values()), {100})
+
+            # Generated data can be processed, every generated student is in output
+            output_file = data_dir + "/output.json"
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data(data_dir + "/courses.csv", data_dir + "/students.csv", data_dir + "/tests.csv",
+                                   data_dir + "/marks.csv", output_file)
+            self.assertEqual(system_exit.exception.code, 0)
+            with open(output_file, 'r') as output:
+                self.assertEqual(len(json.load(output)["students"]), row_counts['students'])
+
+            # Sizes which could never add up to the requested marks are rejected before any file is written
+            for options in ({'marks': 0}, {'marks': 10, 'courses': 0}, {'marks': 10, 'courses_per_student': 0},
+                            {'marks': 10, 'max_tests_per_course': 0}):
+                with self.assertRaises(ValueError):
+                    generate_school_data(data_dir + "/invalid", **options)
+            self.assertFalse(os.path.exists(data_dir + "/invalid"))
+
+        print_test_finished(test_name)
+
+    def test_example_1_metrics(self):
+        test_name = 'Example 1 Test (Stage Metrics Written Next To Output)'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_file = output_dir + "/outputExample1.json"
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data("tests/Example1/courses.csv", "tests/Example1/students.csv",
+                                   "tests/Example1/tests.csv", "tests/Example1/marks.csv", output_file,
+                                   streaming=True, metrics=True)
+            self.assertEqual(system_exit.exception.code, 0)
+
+            with open(output_file + ".metrics.json", 'r') as metrics_file:
+                metrics = json.load(metrics_file)
+
+        # Each stage is recorded, rows of each input (streamed marks included) and students written are counted
+        self.assertEqual([s["stage"] for s in metrics["stages"]],
+                         ["parse", "generate_data_dict", "associate", "check_weights", "averages_and_write"])
+        self.assertEqual(metrics["rows"], {"courses": 3, "students": 3, "tests": 7, "marks": 19, "students_written": 3})
+        self.assertGreater(metrics["peakRssBytes"], 0)
+        self.assertNotIn("peakTracedBytes", metrics)  # Memory is not traced unless asked for, tracing slows down stages
+
+        # Memory allocated by each stage is traced with --metrics=memory
+        self.assertEqual(supply_options(['--metrics', '--metrics=memory']), {'metrics': 'memory'})
+        self.assertEqual(supply_options(['--metrics']), {'metrics': True})
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_file = output_dir + "/outputExample1.json"
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data("tests/Example1/courses.csv", "tests/Example1/students.csv",
+                                   "tests/Example1/tests.csv", "tests/Example1/marks.csv", output_file,
+                                   streaming=True, metrics='memory')
+            self.assertEqual(system_exit.exception.code, 0)
+            self.assertFalse(tracemalloc.is_tracing())
+            with open(output_file + ".metrics.json", 'r') as metrics_file:
+                metrics = json.load(metrics_file)
+        self.assertGreater(metrics["peakTracedBytes"], 0)
+        self.assertTrue(all("allocatedBytes" in s for s in metrics["stages"]))
+
+        print_test_finished(test_name)
+
+    def test_slotted_entities(self):
+        test_name = 'Students, Courses And Tests Are Slotted, Attribute API Is Kept'
+        print_test_header(test_name)
+
+        student, course, test = Student(1, 'A'), Course(1, 'Biology', 'Mr. D'), CourseTest(1, 1, 100)
+        for entity in (student, course, test):
+            self.assertFalse(hasattr(entity, '__dict__'))
+
+        # Course points are only created once used, and can still be read and replaced as an attribute
+        student.add_course_points(1, 7800)
+        student.add_course_points(1, 1000)
+        self.assertEqual(student.course_points, {1: 8800})
+        student.course_points = {2: 5000}
+        student.compute_course_averages_from_points()
+        student.compute_total_average()
+        self.assertEqual((student.course_averages, student.total_average), ({2: 50.0}, 50.0))
+
+        print_test_finished(test_name)
+
+    def test_run_admin_data_reentrant(self):
+        test_name = 'Runs Return Results Without Exiting, Concurrent Runs Do Not Share Writers'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            contexts = [AdminRunContext(*["tests/{0}/{1}.csv".format(example, f)
+                                          for f in ("courses", "students", "tests", "marks")],
+                                        "{0}/output{1}_{2}.json".format(output_dir, example, i))
+                        for i in range(4) for example in ("Example1", "Example2", "Example7DuplicateStudents")]
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(run_admin_data, contexts))
+
+            for context, result in zip(contexts, results):
+                self.assertEqual(result.output_file, context.output_file)
+                if "DuplicateStudents" in context.output_file:  # Error is returned and written to this run's output
+                    self.assertEqual((result.succeeded, result.exit_code), (False, -1))
+                    self.assertTrue(json_content_equal(context.output_file,
+                                                       {"error": result.error_message}, True, False))
+                else:
+                    self.assertEqual((result.succeeded, result.exit_code), (True, 0))
+                    self.assertTrue(json_content_equal(context.output_file,
+                                                       context.input_files[0].replace("courses.csv", "output.json"),
+                                                       True, True))
+
+        print_test_finished(test_name)
+
+    def test_batch_schools(self):
+        test_name = 'Batch Of Schools (Each Example Directory Is A School)'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            results = process_admin_data_batch("tests", output_dir, batch_workers=2)
+
+            # Every example holding all input files is processed, an error in one school does not stop the others
+            self.assertNotIn("known_test_outputs", results)
+            self.assertEqual(results["Example1"]["studentsWritten"], 3)
+            self.assertTrue(json_content_equal(output_dir + "/Example1.json", "tests/Example1/output.json", True, True))
+            self.assertTrue(json_content_equal(output_dir + "/Example2.json", "tests/Example2/output.json", True, True))
+            self.assertFalse(results["Example5BadTestWeights"]["succeeded"])
+            self.assertTrue(json_content_equal(output_dir + "/Example5BadTestWeights.json",
+                                               {"error": results["Example5BadTestWeights"]["error"]}, True, False))
+
+        # A student without marks cannot be averaged, which only fails their own school
+        with tempfile.TemporaryDirectory() as schools_dir:
+            for school in ("Example1", "NoMarksStudent"):
+                shutil.copytree("tests/Example1", os.path.join(schools_dir, school))
+            with open(os.path.join(schools_dir, "NoMarksStudent", "students.csv"), 'a') as students:
+                students.write("\n4,D\n")
+            results = process_admin_data_batch(schools_dir, os.path.join(schools_dir, "output"))
+            self.assertTrue(results["Example1"]["succeeded"])
+            self.assertFalse(results["NoMarksStudent"]["succeeded"])
+            self.assertEqual(results["NoMarksStudent"]["error"],
+                             "Student with id 4 has no marks, so no total average can be computed.")
+            with open(os.path.join(schools_dir, "output", "NoMarksStudent.json"), 'r') as school_output:
+                self.assertEqual(json.load(school_output), {"error": results["NoMarksStudent"]["error"]})
+
+            # Unexpected errors are written as an error json by the run they stopped, rather than raised
+            output_file = os.path.join(schools_dir, "output", "Unexpected.json")
+            with mock.patch('main.generate_admin_data_stages', side_effect=RuntimeError('disk full')):
+                result = run_admin_data(AdminRunContext(*["tests/Example1/" + f for f in (
+                    "courses.csv", "students.csv", "tests.csv", "marks.csv")], output_file))
+            self.assertEqual((result.succeeded, result.error_message),
+                             (False, "Unexpected error while processing admin data: RuntimeError: disk full"))
+            with open(output_file, 'r') as unexpected_output:
+                self.assertEqual(json.load(unexpected_output), {"error": result.error_message})
+
+        print_test_finished(test_name)
+
+    def test_report_service(self):
+        test_name = 'Report Service (Catalog Kept Warm, Reloaded Once Changed)'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as catalog_dir:
+            for f in ("courses.csv", "students.csv", "tests.csv"):
+                shutil.copy("tests/Example1/" + f, catalog_dir)
+            catalog = WarmCatalog(catalog_dir + "/courses.csv", catalog_dir + "/students.csv",
+                                  catalog_dir + "/tests.csv")
+            report_server = ReportServer(('127.0.0.1', 0), catalog)
+            threading.Thread(target=report_server.serve_forever, daemon=True).start()
+            report_url = "http://127.0.0.1:{0}/report".format(report_server.server_address[1])
+
+            def request_report(query: str = "", marks: bytes = None):
+                try:
+                    with urllib.request.urlopen(report_url + query, data=marks) as response:
+                        return response.status, json.loads(response.read())
+                except urllib.error.HTTPError as error:
+                    return error.code, json.loads(error.read())
+
+            try:
+                # Marks given as a path and uploaded give the same report as main.py, catalog is loaded once
+                with open("tests/Example1/marks.csv", 'rb') as marks_file:
+                    marks = marks_file.read()
+                for query, body in (("?marks=tests/Example1/marks.csv", None), ("", marks), ("?streaming=1", marks)):
+                    status, report = request_report(query, body)
+                    self.assertEqual(status, 200)
+                    self.assertTrue(json_content_equal(report, "tests/Example1/output.json", False, True))
+                self.assertEqual(catalog.reload_count, 3)
+
+                # Only the changed catalog file is reloaded
+                with open(catalog_dir + "/courses.csv", 'a') as courses_file:
+                    courses_file.write("4,Art,Mr. Z\n")
+                self.assertEqual(request_report("", marks)[0], 200)
+                self.assertEqual(catalog.reload_count, 4)
+
+                # Errors are sent as an error json
+                status, report = request_report("", b"test_id,student_id,mark\n1,9,50\n")
+                self.assertEqual(status, 400)
+                self.assertEqual(report, {"error": "No such student with id 9 exists. Found in marks with row: "
+                                                   "{'test_id': '1', 'student_id': '9', 'mark': '50'}"})
+
+                # Bad requests are sent as a 400, unexpected errors as a 500
+                status, report = request_report("", b"test_id,student_id,mark\n1,1,\xff\n")
+                self.assertEqual((status, report), (400, {"error": "Uploaded marks must be encoded as UTF-8."}))
+                connection = http.client.HTTPConnection('127.0.0.1', report_server.server_address[1])
+                connection.putrequest('POST', '/report')
+                connection.putheader('Content-Length', 'many')
+                connection.endheaders()
+                response = connection.getresponse()
+                self.assertEqual((response.status, json.loads(response.read())),
+                                 (400, {"error": "Invalid Content-Length of request: many."}))
+                connection.close()
+                status, report = request_report("", b"test_id,student_id,mark\n1,1,50\n")  # Student 2 has no marks
+                self.assertEqual(status, 400)
+                self.assertEqual(report["error"], "Student with id 2 has no marks, so no total average can be "
+                                                  "computed.")
+                with mock.patch('report_service.generate_report', side_effect=RuntimeError('disk full')):
+                    status, report = request_report("", marks)
+                self.assertEqual((status, report),
+                                 (500, {"error": "Unexpected error while generating report: RuntimeError: disk full"}))
+            finally:
+                report_server.shutdown()
+                report_server.server_close()
+
+        print_test_finished(test_name)
+
+    def test_typed_rows_parsing(self):
+        test_name = 'Typed Rows Parsed In One Pass (Header Validated Once)'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as input_dir:
+            courses_file = input_dir + "/courses.csv"
+            with open(courses_file, 'w') as courses_input:
+                courses_input.write("room,teacher,name,id\n9, Mr. D ,Biology , 1\n\n10,Mrs. P,History,2\n")
+            # Columns are found by name in any order, strings are stripped, ids converted and blank lines skipped
+            self.assertEqual(list(stream_typed_rows(0, courses_file)),
+                             [(1, 'Biology', 'Mr. D'), (2, 'History', 'Mrs. P')])
+
+            with open(courses_file, 'a') as courses_input:
+                courses_input.write("11,Mr. E,Math,x\n")
+            with self.assertRaises(AdminDataError) as data_error:
+                list(stream_typed_rows(0, courses_file))
+            self.assertEqual(data_error.exception.error_message,
+                             "Values in input file {0} are invalid. Column id must be an integer. Found with row: "
+                             "{{'room': '11', 'teacher': 'Mr. E', 'name': 'Math', 'id': 'x'}}".format(courses_file))
+
+        print_test_finished(test_name)
+
+    def test_validate_collects_errors(self):
+        test_name = 'Validation Reports Every Error In One Pass (Up To A Limit)'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as input_dir:
+            input_files = [input_dir + "/" + f for f in ("courses.csv", "students.csv", "tests.csv", "marks.csv")]
+            for f, content in zip(input_files, ("id,name,teacher\n1,Biology,Mr. D\n",
+                                                "id,name\n1,A\nx,B\n1,C\n2,E\n",
+                                                "id,course_id,weight\n1,1,60\n2,1,50\n",
+                                                "test_id,student_id,mark\n1,1,78\n1,7,50\n9,1,50\n")):
+                with open(f, 'w') as input_file:
+                    input_file.write(content)
+            output_file = input_dir + "/report.json"
+
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data(*input_files, output_file, validate=True)
+            self.assertEqual(system_exit.exception.code, -1)
+            with open(output_file, 'r') as report_file:
+                report = json.load(report_file)
+            self.assertEqual((report["errorCount"], report["errorLimitReached"]), (6, False))
+            self.assertEqual([(e["file"][len(input_dir) + 1:], e["line"]) for e in report["errors"]],
+                             [("students.csv", 3), ("students.csv", 4), ("tests.csv", None), ("marks.csv", 3),
+                              ("marks.csv", 4), ("students.csv", None)])
+            self.assertEqual(report["errors"][1]["error"], "Duplicate found with id 1. Found with row: "
+                                                           "{'id': '1', 'name': 'C'}")
+            # A student without marks is reported with the error a run stops with
+            self.assertEqual(report["errors"][5]["error"],
+                             "Student with id 2 has no marks, so no total average can be computed.")
+
+            # Validation stops once limit is reached
+            with self.assertRaises(SystemExit):
+                process_admin_data(*input_files, output_file, validate=True, error_limit=2)
+            with open(output_file, 'r') as report_file:
+                self.assertEqual(json.load(report_file)["errorLimitReached"], True)
+
+        # Valid input has an empty report
+        with tempfile.TemporaryDirectory() as output_dir:
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data("tests/Example1/courses.csv", "tests/Example1/students.csv",
+                                   "tests/Example1/tests.csv", "tests/Example1/marks.csv", output_dir + "/report.json",
+                                   validate=True)
+            self.assertEqual(system_exit.exception.code, 0)
+            empty_report = {"errorCount": 0, "errorLimitReached": False, "errors": []}
+            self.assertTrue(json_content_equal(output_dir + "/report.json", empty_report, True, False))
+
+        print_test_finished(test_name)
+
+    def test_parallel_parsing(self):
+        test_name = 'Marks Split Into Byte Ranges Parse As They Do Serially'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            generate_school_data(data_dir, marks=500, courses=4, seed=3)
+            input_files = [data_dir + "/" + f for f in ("courses.csv", "students.csv", "tests.csv", "marks.csv")]
+            serial_rows = [list(stream_typed_rows(fc, f)) for fc, f in enumerate(input_files)]
+            self.assertEqual(parse_school_data_files_parallel(input_files, 3), serial_rows)
+            # Columns of each range are joined into columns of marks for the numpy engine
+            marks_columns = parse_school_data_files_parallel(input_files, 3, marks_columns=True)[3]
+            self.assertEqual(list(zip(*marks_columns)), serial_rows[3])
+
+            # Rows with spaces and blank lines are read as they are serially, quoted values are parsed serially
+            with open(input_files[3], 'a') as marks_file:
+                marks_file.write("\n 1 , 1,  50\r\n")
+            self.assertEqual(parse_school_data_files_parallel(input_files, 3)[3][-1], (1, 1, 50))
+            # First bad row in order of file is the error raised
+            with open(input_files[3], 'r') as marks_file:
+                marks_lines = marks_file.readlines()
+            bad_marks_file = data_dir + "/bad_marks.csv"
+            with open(bad_marks_file, 'w') as marks_file:
+                marks_file.writelines(marks_lines[:200] + ["3,x,70\n"] + marks_lines[200:400] + ["4,y,70\n"])
+            with self.assertRaises(AdminDataError) as data_error:
+                parse_school_data_files_parallel(input_files[:3] + [bad_marks_file], 3)
+            self.assertIn("{'test_id': '3', 'student_id': 'x', 'mark': '70'}", data_error.exception.error_message)
+
+            # Quoted values are parsed serially
+            with open(input_files[3], 'a') as marks_file:
+                marks_file.write('"2",1,60\n')
+            self.assertEqual(parse_school_data_files_parallel(input_files, 3)[3][-2:], [(1, 1, 50), (2, 1, 60)])
+            marks_columns = parse_school_data_files_parallel(input_files, 3, marks_columns=True)[3]
+            self.assertEqual(list(zip(*marks_columns))[-2:], [(1, 1, 50), (2, 1, 60)])
+
+        print_test_finished(test_name)
+
+    def test_integer_csv_reader(self):
+        test_name = 'Integer Files Read From Bytes Match General Parser'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as input_dir:
+            marks_file = input_dir + "/marks.csv"
+            for content, read_from_bytes in (("mark,test_id,student_id\r\n78, 1,1\r\n-0,2,1", True),
+                                              ("test_id,student_id,mark\n1,1,78\n\n2,1,87\n", False),
+                                              ('test_id,student_id,mark\n"1",1,78\n', False),
+                                              ("test_id,student_id,mark,note\n1,1,78,5\n", False),
+                                              ("test_id,student_id,mark\n1,1,078\n", False)):
+                with open(marks_file, 'w', newline='') as marks_input:
+                    marks_input.write(content)
+                self.assertEqual(read_integer_csv_columns(3, marks_file) is not None, read_from_bytes)
+                self.assertEqual(parse_typed_rows(3, marks_file), list(stream_typed_rows(3, marks_file)))
+
+                # Chunks of a few bytes start and end on every kind of line, results are unchanged
+                with mock.patch('common.integer_csv_reader.read_chunk_bytes', 4):
+                    self.assertEqual(read_integer_csv_columns(3, marks_file) is not None, read_from_bytes)
+                    self.assertEqual(parse_typed_rows(3, marks_file), list(stream_typed_rows(3, marks_file)))
+
+            # Rows which are not valid are left to the general parser, so errors are unchanged
+            with open(marks_file, 'w') as marks_input:
+                marks_input.write("test_id,student_id,mark\n1,1,\n")
+            with self.assertRaises(AdminDataError) as data_error:
+                parse_typed_rows(3, marks_file)
+            self.assertIn("Column mark must be an integer", data_error.exception.error_message)
+
+        print_test_finished(test_name)
+
+    def test_example_1_ndjson_output(self):
+        test_name = 'Example 1 Test (NDJSON Output With Index, Sharded Per Student)'
+        print_test_header(test_name)
+
+        with open("tests/Example1/output.json", 'r') as desired_output:
+            desired_students = json.load(desired_output)["students"]
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            for shard_size in (None, 1):
+                output_file = output_dir + "/outputExample1_{0}.ndjson".format(shard_size)
+                with self.assertRaises(SystemExit) as system_exit:
+                    process_admin_data("tests/Example1/courses.csv", "tests/Example1/students.csv",
+                                       "tests/Example1/tests.csv", "tests/Example1/marks.csv", output_file,
+                                       output_format='ndjson', shard_size=shard_size)
+                self.assertEqual(system_exit.exception.code, 0)
+
+                # Each student is read with a single seek using the index
+                for student in desired_students:
+                    self.assertTrue(json_content_equal(read_student_entry(output_file, student["id"]), student))
+                self.assertIsNone(read_student_entry(output_file, 4))
+
+            # Unsharded output holds one student per line in order of id, sharded output lists shard files
+            with open(output_dir + "/outputExample1_None.ndjson", 'r') as output:
+                self.assertEqual([json.loads(line)["id"] for line in output], [1, 2, 3])
+            with open(output_dir + "/outputExample1_1.ndjson", 'r') as output:
+                self.assertEqual([(s["file"], s["firstId"]) for s in json.load(output)["shards"]],
+                                 [("outputExample1_1.ndjson.{0:04d}".format(i), i + 1) for i in range(3)])
+
+        print_test_finished(test_name)
+
+    def test_memory_limit_spilled_runs(self):
+        test_name = 'Memory Limit (Sums Spilled To Sorted Runs Then Merged) Matches Streaming'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            generate_school_data(data_dir, marks=2000, courses=6, seed=2)
+            input_files = [data_dir + "/" + f for f in ("courses.csv", "students.csv", "tests.csv", "marks.csv")]
+            with self.assertRaises(SystemExit):
+                process_admin_data(*input_files, data_dir + "/streamed.json", streaming=True)
+
+            # Only a few marks and course averages fit in memory, so many runs are spilled and merged
+            with mock.patch('main.spill_entry_limit', return_value=7), \
+                    mock.patch('main.score_entry_limit', return_value=5):
+                with self.assertRaises(SystemExit) as system_exit:
+                    process_admin_data(*input_files, data_dir + "/spilled.json", memory_limit=1)
+                self.assertEqual(system_exit.exception.code, 0)
+                with self.assertRaises(SystemExit):
+                    process_admin_data(*input_files, data_dir + "/spilled_stats.json", memory_limit=1,
+                                       course_stats=True)
+            with self.assertRaises(SystemExit):
+                process_admin_data(*input_files, data_dir + "/streamed_stats.json", streaming=True, course_stats=True)
+
+            for streamed_file, spilled_file in (("streamed.json", "spilled.json"),
+                                                ("streamed_stats.json", "spilled_stats.json")):
+                with open(data_dir + "/" + streamed_file, 'rb') as streamed, \
+                        open(data_dir + "/" + spilled_file, 'rb') as spilled:
+                    self.assertEqual(spilled.read(), streamed.read())
+
+            # Students count against the limit, a limit which cannot hold them is an error
+            with mock.patch('common.external_aggregation.student_entry_bytes', 1 << 19):
+                with self.assertRaises(SystemExit) as system_exit:
+                    process_admin_data(*input_files, data_dir + "/spilled.json", memory_limit=1)
+            self.assertEqual(system_exit.exception.code, -1)
+            with open(data_dir + "/spilled.json", 'r') as error_output:
+                self.assertIn("Memory limit of 1 megabytes is too small to hold", json.load(error_output)["error"])
+
+        print_test_finished(test_name)
+
+    def test_sqlite_engine_database(self):
+        test_name = 'SQLite Engine Matches Python Engine, Database Is Reused Until Inputs Change'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            generate_school_data(data_dir, marks=2000, courses=6, seed=3)
+            input_files = [data_dir + "/" + f for f in ("courses.csv", "students.csv", "tests.csv", "marks.csv")]
+            database = data_dir + "/school.db"
+            with open(input_files[0], 'r') as courses_input:  # Courses are listed out of order of id
+                courses_lines = courses_input.read().splitlines()
+            with open(input_files[0], 'w') as courses_output:
+                courses_output.write('\n'.join(courses_lines[:1] + courses_lines[:0:-1]) + '\n')
+            with self.assertRaises(SystemExit):
+                process_admin_data(*input_files, data_dir + "/python.json")
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data(*input_files, data_dir + "/sqlite.json", engine='sqlite', database=database)
+            self.assertEqual(system_exit.exception.code, 0)
+            with open(data_dir + "/python.json", 'rb') as python_output, open(data_dir + "/sqlite.json", 'rb') as \
+                    sqlite_output:
+                self.assertEqual(sqlite_output.read(), python_output.read())
+
+            # Inputs are unchanged, so the second run queries the database without loading it again
+            with mock.patch('main.load_school_database') as load_database:
+                with self.assertRaises(SystemExit):
+                    process_admin_data(*input_files, data_dir + "/reused.json", engine='sqlite', database=database)
+            load_database.assert_not_called()
+            with open(data_dir + "/python.json", 'r') as python_output:
+                python_students = json.load(python_output)["students"]
+            with open(data_dir + "/reused.json", 'r') as reused_output:
+                self.assertEqual(json.load(reused_output)["students"], python_students)
+
+            # A single student is looked up from the database
+            self.assertEqual(generate_sqlite_student_entry(database, python_students[3]["id"]), python_students[3])
+            self.assertIsNone(generate_sqlite_student_entry(database, -1))
+
+            # Catalogs are read back in the order of input files rather than in order of id
+            connection = connect_school_database(database)
+            courses_rows = read_catalog_rows(connection)[0]
+            connection.close()
+            self.assertEqual([r[0] for r in courses_rows], [int(line.split(',')[0]) for line in courses_lines[:0:-1]])
+
+            # Input files changed since the database was loaded, so a lookup is an error rather than stale data
+            with open(input_files[3], 'a') as marks_output:
+                marks_output.write('1,1,100\n')
+            with self.assertRaises(AdminDataError):
+                generate_sqlite_student_entry(database, python_students[3]["id"])
+
+        # A database of an older schema (no row numbers) is rebuilt once opened
+        with tempfile.TemporaryDirectory() as data_dir:
+            connection = sqlite3.connect(data_dir + "/old.db")
+            connection.execute('CREATE TABLE courses (id INTEGER PRIMARY KEY, name TEXT, teacher TEXT)')
+            connection.close()
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data("tests/Example1/courses.csv", "tests/Example1/students.csv",
+                                   "tests/Example1/tests.csv", "tests/Example1/marks.csv", data_dir + "/old.json",
+                                   engine='sqlite', database=data_dir + "/old.db")
+            self.assertEqual(system_exit.exception.code, 0)
+
+        # Example 1 (held in a database in memory) matches its known output
+        with self.assertRaises(SystemExit) as system_exit:
+            process_admin_data("tests/Example1/courses.csv", "tests/Example1/students.csv", "tests/Example1/tests.csv",
+                               "tests/Example1/marks.csv", "tests/test_outputs/outputExample1SQLite.json",
+                               engine='sqlite')
+        self.assertEqual(system_exit.exception.code, 0)
+        self.assertTrue(json_content_equal("tests/test_outputs/outputExample1SQLite.json", "tests/Example1/output.json",
+                                           True, True))
+
+        print_test_finished(test_name)
+
+    def test_example_1_course_statistics(self):
+        test_name = 'Example 1 Test (Course Statistics Section)'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data("tests/Example1/courses.csv", "tests/Example1/students.csv",
+                                   "tests/Example1/tests.csv", "tests/Example1/marks.csv", output_dir + "/output.json",
+                                   course_stats=True)
+            self.assertEqual(system_exit.exception.code, 0)
+
+            # Students are unchanged, and the file is laid out as json.dump would lay out the whole report
+            with open(output_dir + "/output.json", 'r') as output:
+                output_text = output.read()
+            report = json.loads(output_text)
+            self.assertEqual(output_text, json.dumps(report, indent=2) + "\n")
+            self.assertTrue(json_content_equal({"students": report["students"]}, "tests/Example1/output.json",
+                                               bIsFile=True))
+
+            biology = report["courses"][0]
+            self.assertEqual((biology["courseAverage"], biology["students"]), (76.77, 3))
+            self.assertEqual((biology["distribution"]["50-60"], biology["distribution"]["90-100"]), (1, 2))
+            self.assertEqual([(r["id"], r["rank"], r["percentile"]) for r in biology["ranks"]],
+                             [(1, 1, 66.67), (3, 1, 66.67), (2, 3, 16.67)])
+
+            # Newline delimited json output has its course statistics written next to it
+            with self.assertRaises(SystemExit):
+                process_admin_data("tests/Example1/courses.csv", "tests/Example1/students.csv",
+                                   "tests/Example1/tests.csv", "tests/Example1/marks.csv",
+                                   output_dir + "/output.ndjson", output_format='ndjson', course_stats=True)
+            with open(output_dir + "/output.ndjson.courses.json", 'r') as course_statistics:
+                self.assertEqual(json.load(course_statistics)["courses"], report["courses"])
+
+        # A course no student has marks in has no average rather than an average of 0
+        empty_course = CourseStatistics().course_statistics_entry(Course(9, 'Art', 'Ms. K'), [])
+        self.assertEqual((empty_course["courseAverage"], empty_course["students"]), (None, 0))
+        self.assertEqual(empty_course["ranks"], [])
+
+        print_test_finished(test_name)
+
+    def test_example_1_compact_compressed_output(self):
+        test_name = 'Example 1 Test (Compact, Compressed And Fast Encoded Output)'
+        print_test_header(test_name)
+
+        example_files = ["tests/Example1/courses.csv", "tests/Example1/students.csv", "tests/Example1/tests.csv",
+                         "tests/Example1/marks.csv"]
+        with tempfile.TemporaryDirectory() as output_dir:
+            output_texts = {}
+            for name, options in (('indented', {}), ('compact', {'compact': True}),
+                                  ('gzip', {'compact': True, 'compression': 'gzip'}),
+                                  ('xz', {'compression': 'xz', 'course_stats': True}),
+                                  ('fast', {'fast_encoder': True, 'course_stats': True}),
+                                  ('fast_compact', {'fast_encoder': True, 'compact': True})):
+                output_file = output_dir + "/" + name
+                with self.assertRaises(SystemExit) as system_exit:
+                    process_admin_data(*example_files, output_file, **options)
+                self.assertEqual(system_exit.exception.code, 0)
+                output_open = {'gzip': gzip.open, 'xz': lzma.open}.get(options.get('compression'), open)
+                with output_open(output_file, 'rt') as output:
+                    output_texts[name] = output.read()
+
+            report = json.loads(output_texts['indented'])
+            self.assertTrue(json_content_equal(report, "tests/Example1/output.json", bIsFile=True))
+            self.assertEqual(output_texts['compact'], json.dumps(report, separators=(',', ':')) + "\n")
+            self.assertEqual(output_texts['gzip'], output_texts['compact'])
+            self.assertEqual(json.loads(output_texts['xz'])["students"], report["students"])
+
+            # Faster encoder (if installed) writes the same bytes as json for ASCII data
+            self.assertEqual(output_texts['fast_compact'], output_texts['compact'])
+            self.assertEqual(output_texts['fast'], output_texts['xz'])
+            if not fast_encoder_available:
+                print('orjson is not installed, json encoded output in place of fast encoder')
+
+            # Output is written to a temporary file which replaces output file, an error while writing leaves it as was
+            def failing_entries():
+                yield report["students"][0]
+                raise RuntimeError('disk full')
+
+            for output_format in ('json', 'ndjson'):
+                json_writer = JSONWriter(output_dir + "/indented")
+                with self.assertRaises(RuntimeError):
+                    if output_format == 'json':
+                        json_writer.write_students_to_output_file(failing_entries())
+                    else:
+                        json_writer.write_students_to_ndjson_file(failing_entries())
+                with open(output_dir + "/indented", 'r') as output:
+                    self.assertEqual(output.read(), output_texts['indented'])
+                self.assertFalse([f for f in os.listdir(output_dir) if f.endswith('.tmp')])
+
+        print_test_finished(test_name)
+
+    def test_example_1_compressed_inputs(self):
+        test_name = 'Example 1 Test (Gzip And Xz Compressed Inputs)'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            input_files = []
+            for name, compressed_open, compressed_name in (('courses.csv', open, 'courses.csv'),
+                                                           ('students.csv', gzip.open, 'students'),  # Found by magic
+                                                           ('tests.csv', lzma.open, 'tests.csv.xz'),
+                                                           ('marks.csv', gzip.open, 'marks.csv.gz')):
+                with open("tests/Example1/" + name, 'rb') as plain:
+                    plain_data = plain.read()
+                with compressed_open(data_dir + "/" + compressed_name, 'wb') as compressed:
+                    compressed.write(plain_data)
+                input_files.append(data_dir + "/" + compressed_name)
+
+            for parse_workers in (1, 2):  # Compressed marks are parsed serially rather than split into byte ranges
+                with self.assertRaises(SystemExit) as system_exit:
+                    process_admin_data(*input_files, data_dir + "/output.json", parse_workers=parse_workers)
+                self.assertEqual(system_exit.exception.code, 0)
+                self.assertTrue(json_content_equal(data_dir + "/output.json", "tests/Example1/output.json", True, True))
+
+            # Emptiness is checked on decompressed data, corrupt data is an input error
+            with gzip.open(data_dir + "/empty.csv.gz", 'wb'):
+                pass
+            with open(data_dir + "/corrupt.csv.xz", 'wb') as corrupt:
+                corrupt.write(b'not xz data')
+            for bad_marks, error in (("empty.csv.gz", 'has no data in it'), ("corrupt.csv.xz", 'error decompressing')):
+                with self.assertRaises(SystemExit) as system_exit:
+                    process_admin_data(*input_files[:3], data_dir + "/" + bad_marks, data_dir + "/error.json")
+                self.assertEqual(system_exit.exception.code, -1)
+                with open(data_dir + "/error.json", 'r') as error_output:
+                    self.assertIn(error, json.load(error_output)["error"])
+
+        print_test_finished(test_name)
+
+    def test_watch_mode_regeneration(self):
+        test_name = 'Watch Mode Regenerates Only What Changed Input Files Affect'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            input_files = [data_dir + "/" + f for f in ("courses.csv", "students.csv", "tests.csv", "marks.csv")]
+            for f in input_files:
+                shutil.copy("tests/Example1/" + os.path.basename(f), f)
+            with open(input_files[3], 'a') as marks:
+                marks.write("\n")  # Last line is complete, so rows can be appended after it
+
+            # Output of a watched school matches a streaming run of its input files as they are now
+            def assert_matches_streaming():
+                with self.assertRaises(SystemExit):
+                    process_admin_data(*input_files, data_dir + "/streamed.json", streaming=True)
+                with open(data_dir + "/streamed.json", 'rb') as streamed, open(data_dir + "/watched.json", 'rb') as \
+                        watched:
+                    self.assertEqual(watched.read(), streamed.read())
+
+            watched_school = WatchedSchool(input_files, data_dir + "/watched.json")
+            self.assertEqual(regenerate_watched_admin_data(watched_school, set()), 'every input file loaded')
+            assert_matches_streaming()
+
+            with open(input_files[0], 'w') as courses:
+                courses.write("id,name,teacher\n1,Biology,Ms. E\n2,History,Mrs. P\n3,Math,Mrs. C\n")
+            self.assertEqual(regenerate_watched_admin_data(watched_school, {0}), 'course entries rerendered')
+            assert_matches_streaming()
+
+            with open(input_files[3], 'a') as marks:
+                marks.write("4,2,50\n5,2,70\n")
+            self.assertEqual(regenerate_watched_admin_data(watched_school, {3}),
+                             '1 students with appended marks recomputed')
+            assert_matches_streaming()
+
+            with open(input_files[3], 'w') as marks:  # Rewritten rather than appended to
+                marks.write("test_id,student_id,mark\n1,1,10\n2,1,20\n3,1,30\n6,2,50\n7,2,50\n6,3,70\n7,3,80\n")
+            self.assertEqual(regenerate_watched_admin_data(watched_school, {3}), 'every student recomputed')
+            assert_matches_streaming()
+
+            # Watching in a thread, appended marks are picked up once writes stop
+            stop_event = threading.Event()
+            watch_thread = threading.Thread(target=watch_admin_data, args=(*input_files, data_dir + "/watched.json"),
+                                            kwargs={'watch_interval_ms': 10, 'debounce_ms': 50,
+                                                    'stop_event': stop_event})
+            watch_thread.start()
+            try:
+                time.sleep(0.2)
+                with open(input_files[3], 'a') as marks:
+                    marks.write("1,3,90\n2,3,90\n3,3,90\n")
+                for _ in range(500):
+                    with open(data_dir + "/watched.json", 'r') as watched:
+                        if '"courseAverage": 90.0' in watched.read():
+                            break
+                    time.sleep(0.01)
+            finally:
+                stop_event.set()
+                watch_thread.join()
+            assert_matches_streaming()
+
+        print_test_finished(test_name)
+
+    def test_pipelined_stages(self):
+        test_name = 'Pipelined Stages Match Streaming'
+        print_test_header(test_name)
+
+        with tempfile.TemporaryDirectory() as data_dir:
+            generate_school_data(data_dir, marks=3000, courses=5, seed=4)
+            input_files = [data_dir + "/" + f for f in ("courses.csv", "students.csv", "tests.csv", "marks.csv")]
+            with self.assertRaises(SystemExit):
+                process_admin_data(*input_files, data_dir + "/streamed.json", streaming=True)
+
+            # Small ranges and batches, so many ranges are aggregated while others are parsed
+            with mock.patch('main.pipeline_range_bytes', 2000), mock.patch('main.pipeline_student_batch_size', 7):
+                with self.assertRaises(SystemExit) as system_exit:
+                    process_admin_data(*input_files, data_dir + "/pipelined.json", pipeline=True, parse_workers=2)
+                self.assertEqual(system_exit.exception.code, 0)
+                with open(data_dir + "/streamed.json", 'rb') as streamed, \
+                        open(data_dir + "/pipelined.json", 'rb') as pipelined:
+                    self.assertEqual(pipelined.read(), streamed.read())
+
+                # Quoted values late in marks are parsed with the rest of marks, errors match streaming
+                with open(input_files[3], 'a') as marks:
+                    marks.write('"1",999999,50\n')
+                for output_name, options in (("streamed", {'streaming': True}), ("pipelined", {'pipeline': True})):
+                    with self.assertRaises(SystemExit) as system_exit:
+                        process_admin_data(*input_files, data_dir + f"/{output_name}.json", **options)
+                    self.assertEqual(system_exit.exception.code, -1)
+                with open(data_dir + "/streamed.json", 'rb') as streamed, \
+                        open(data_dir + "/pipelined.json", 'rb') as pipelined:
+                    streamed_error = streamed.read()
+                    self.assertIn(b'No such student with id 999999', streamed_error)
+                    self.assertEqual(pipelined.read(), streamed_error)
+
+            # With several bad catalog files, the first bad file is reported whichever parse finishes first
+            empty_files = ["tests/Example0EmptyFiles/" + f for f in ("courses.csv", "students.csv", "tests.csv",
+                                                                      "marks.csv")]
+            for output_name, options in (("streamed", {'streaming': True}), ("pipelined", {'pipeline': True})):
+                for run in range(3):
+                    with self.assertRaises(SystemExit) as system_exit:
+                        process_admin_data(*empty_files, data_dir + f"/{output_name}{run}.json", parse_workers=4,
+                                           **options)
+                    self.assertEqual(system_exit.exception.code, -1)
+            with open(data_dir + "/streamed0.json", 'rb') as streamed:
+                streamed_error = streamed.read()
+            self.assertIn(b'courses.csv', streamed_error)
+            for run in range(3):
+                with open(data_dir + f"/pipelined{run}.json", 'rb') as pipelined:
+                    self.assertEqual(pipelined.read(), streamed_error)
+
+        print_test_finished(test_name)
+
+    def test_averaging_regression(self):
+        test_name = 'Averages Match Known Output In Every Mode'
+        print_test_header(test_name)
+
+        input_files = ["tests/Example11AveragingRegression/" + f
+                       for f in ("courses.csv", "students.csv", "tests.csv", "marks.csv")]
+        # Known output was regenerated when totals became rounded half up in whole hundredths: totals of 45 of its
+        # students are exactly half way between two hundredths, and earlier versions rounded them from float sums
+        with open("tests/known_test_outputs/outputExample11AveragingRegression.json", 'rb') as known_output_file:
+            known_output = known_output_file.read()
+
+        modes = [{}, {'streaming': True}, {'parse_workers': 2}, {'workers': 2}, {'engine': 'sqlite'},
+                 {'memory_limit': 1}, {'pipeline': True}]
+        if numpy_engine_available:
+            modes += [{'engine': 'numpy'}, {'engine': 'numpy', 'parse_workers': 2}]
+        with tempfile.TemporaryDirectory() as output_dir:
+            for options in modes:
+                output_file = output_dir + "/output.json"
+                with self.assertRaises(SystemExit) as system_exit:
+                    process_admin_data(*input_files, output_file, **options)
+                self.assertEqual(system_exit.exception.code, 0)
+                with open(output_file, 'rb') as output:
+                    self.assertEqual(output.read(), known_output, options)
+
+        # Means half way between two hundredths are rounded up, whichever order courses are in
+        student = Student(1, "A")
+        for course_averages, total_average in (([72.5, 80.01], 76.26), ([33.33, 33.33, 33.34], 33.33),
+                                               ([50.0, 50.01, 50.01, 50.01], 50.01), ([0.01, 0.0], 0.01)):
+            for ordered_averages in (course_averages, course_averages[::-1]):
+                student.course_averages = dict(enumerate(ordered_averages))
+                student.compute_total_average()
+                self.assertEqual(student.total_average, total_average)
+
+        print_test_finished(test_name)
+
+    def test_duplicate_marks(self):
+        test_name = 'Duplicate Marks Are Rejected In Every Mode'
+        print_test_header(test_name)
+
+        # Example 12 is Example 1 with a second mark of student 1 for test 2, which earlier versions kept over the first
+        input_files = ["tests/Example12DuplicateMarks/" + f for f in ("courses.csv", "students.csv", "tests.csv",
+                                                                       "marks.csv")]
+        with open("tests/known_test_outputs/outputExample12DuplicateMarks.json", 'r') as known_output:
+            expected_error = json.load(known_output)
+        modes = [{}, {'streaming': True}, {'parse_workers': 2}, {'workers': 2}, {'engine': 'sqlite'},
+                 {'memory_limit': 1}, {'pipeline': True}]
+        if numpy_engine_available:
+            modes.append({'engine': 'numpy'})
+        with tempfile.TemporaryDirectory() as data_dir:
+            output_file = data_dir + "/output.json"
+            for options in modes:
+                with self.assertRaises(SystemExit) as system_exit:
+                    process_admin_data(*input_files, output_file, **options)
+                self.assertEqual(system_exit.exception.code, -1)
+                self.assertTrue(json_content_equal(output_file, expected_error, aIsFile=True), options)
+
+            # Marks appended since state was saved cannot mark a test again either
+            state_file = data_dir + "/state.json"
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data(*input_files[:3], "tests/Example10DeltaMarks/marks.csv", output_file,
+                                   state=state_file)
+            self.assertEqual(system_exit.exception.code, 0)
+            with open(data_dir + "/marks_delta.csv", 'w') as marks_output:
+                marks_output.write('test_id,student_id,mark\n2,1,60\n')
+            with self.assertRaises(SystemExit) as system_exit:
+                process_admin_data(*input_files[:3], data_dir + "/marks_delta.csv", output_file, state=state_file,
+                                   delta=True)
+            self.assertEqual(system_exit.exception.code, -1)
+            self.assertTrue(json_content_equal(output_file, expected_error, aIsFile=True))
+
+        print_test_finished(test_name)
+
+    def test_first_bad_mark_reported(self):
+        test_name = 'First Bad Row Of Marks Is Reported In Every Mode'
+        print_test_header(test_name)
+
+        modes = [{}, {'streaming': True}, {'workers': 2}, {'engine': 'sqlite'}, {'memory_limit': 1}]
+        if numpy_engine_available:
+            modes.append({'engine': 'numpy'})
+        # Rows inserted into marks of Example 1 (after its first 3 marks, then at the end), error is for the first one
+        bad_marks = [(['2,1,60'], ['1,99,50'], "Duplicate mark found for test with id 2 and student with id 1. "
+                                               "Found in marks with row: {'test_id': '2', 'student_id': '1', "
+                                               "'mark': '60'}"),
+                     (['99,1,50'], ['1,99,50'], "No such test with id 99 exists. Found in marks with row: "
+                                                "{'test_id': '99', 'student_id': '1', 'mark': '50'}"),
+                     (['1,99,50'], ['99,1,50', '2,1,60'], "No such student with id 99 exists. Found in marks with "
+                                                          "row: {'test_id': '1', 'student_id': '99', 'mark': '50'}")]
+        with open("tests/Example1/marks.csv", 'r') as marks_input:
+            marks_lines = marks_input.read().splitlines()
+        with tempfile.TemporaryDirectory() as data_dir:
+            input_files = ["tests/Example1/" + f for f in ("courses.csv", "students.csv", "tests.csv")]
+            input_files.append(data_dir + "/marks.csv")
+            output_file = data_dir + "/output.json"
+            for early_rows, late_rows, expected_error in bad_marks:
+                with open(input_files[3], 'w') as marks_output:
+                    marks_output.write('\n'.join(marks_lines[:4] + early_rows + marks_lines[4:] + late_rows) + '\n')
+                for options in modes:
+                    with self.assertRaises(SystemExit) as system_exit:
+                        process_admin_data(*input_files, output_file, **options)
+                    self.assertEqual(system_exit.exception.code, -1)
+                    self.assertTrue(json_content_equal(output_file, {"error": expected_error}, aIsFile=True), options)
+                with mock.patch('main.spill_entry_limit', return_value=2):  # Marks of a duplicate are in separate runs
+                    with self.assertRaises(SystemExit):
+                        process_admin_data(*input_files, output_file, memory_limit=1)
+                self.assertTrue(json_content_equal(output_file, {"error": expected_error}, aIsFile=True))
+
+        print_test_finished(test_name)
+
+    def test_school_ids(self):
+        test_name = 'Courses And Tests Are Joined By Dense Index'
+        print_test_header(test_name)
+
+        course_data = {7: Course(7, 'Biology', 'Mr. D'), 3: Course(3, 'History', 'Mrs. P')}
+        test_data = {12: CourseTest(12, 3, 40), 5: CourseTest(5, 7, 100), 9: CourseTest(9, 3, 60)}
+        school_ids = SchoolIds(course_data, test_data)
+        self.assertEqual((school_ids.course_ids, school_ids.test_indices), ([7, 3], {12: 0, 5: 1, 9: 2}))
+        self.assertEqual((school_ids.test_course_indices, school_ids.test_weights), ([1, 0, 1], [40, 100, 60]))
+        self.assertEqual((school_ids.test_course_positions, school_ids.course_test_indices), ([0, 0, 1], [[1], [0, 2]]))
+
+        # Tests a student has a mark for are kept by position within their course, a test is only marked once
+        student = Student(2, 'B')
+        self.assertTrue(student.add_course_test(3, 1) and student.add_course_test(3, 0))
+        self.assertFalse(student.add_course_test(3, 1))
+        self.assertEqual(student.course_tests, {3: 0b11})
+
+        # Marks are kept by test index, courses of each student are ordered as first found in marks
+        student_data = {1: Student(1, 'A')}
+        associate_student_marks(student_data, [(9, 1, 80), (5, 1, 70), (12, 1, 90)], school_ids)
+        associate_student_courses(student_data, school_ids)
+        self.assertEqual(student_data[1].courses, {3: [(2, 80, 60), (0, 90, 40)], 7: [(1, 70, 100)]})
+        check_course_test_weights(school_ids)
+        self.assertEqual((course_data[7].test_weights, course_data[3].test_weights), (100, 100))
+
+        # Tests of courses and marks of tests which do not exist are reported as errors rather than raising KeyError
+        test_data[4] = CourseTest(4, 8, 0)
+        with self.assertRaises(AdminDataError) as error:
+            check_course_test_weights(SchoolIds({7: Course(7, 'Biology', 'Mr. D'), 3: Course(3, 'History', 'Mrs. P')},
+                                                test_data))
+        self.assertIn('No such course with id 8 exists', str(error.exception))
+        with self.assertRaises(AdminDataError) as error:
+            associate_student_marks(student_data, [(6, 1, 50)], school_ids)
+        self.assertIn('No such test with id 6 exists', str(error.exception))
+
+        print_test_finished(test_name)
+
 
 if __name__ == '__main__':
     unittest.main()